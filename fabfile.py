@@ -102,6 +102,8 @@ def prepare(venv):
 def install(install_dir):
     with cd(os.path.dirname(install_dir)):
         run('python manage.py syncdb --settings=%s' % env.settings_module)
+        run('python manage.py createcachetable --settings=%s' % env.settings_module)
+        run('python manage.py rebuild_collection_events --settings=%s' % env.settings_module)
         run('python manage.py collectstatic --noinput --settings=%s' % env.settings_module)
 
 @task
@@ -0,0 +1,82 @@
+"""iCalendar feeds of events, streamed and rendered from the models.
+
+The VEVENT block of each event is cached, keyed by the revision of the event
+(its `updated` time, bumped when its speakers, topics or series change), so
+that polling a feed mostly costs one cache lookup per event: only the events
+missing from the cache are prefetched and rendered.
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.http.response import StreamingHttpResponse
+
+from talks.api.serializers import get_location_string
+from talks.core.renderers import ICalRenderer, stream_ical
+from talks.events.resources import prefetch_events
+
+# number of events loaded (and looked up in the cache) at once
+CHUNK_SIZE = 100
+
+CACHE_NAME = 'ics'
+
+
+def get_ics_data(event, request=None):
+    """Get the data used to render an event, in the same
+    form as `EventSerializer` but with datetime objects
+    :param event: Event
+    :param request: current request (used to build the url of the event)
+    :return: dictionary
+    """
+    url = event.get_absolute_url()
+    return {
+        'title_display': event.title_display,
+        'description': event.description,
+        'status': event.status,
+        'various_speakers': event.various_speakers,
+        'speakers': [{'name': speaker.name, 'bio': speaker.bio} for speaker in event.speakers],
+        'start': event.start,
+        'end': event.end,
+        'full_url': request.build_absolute_uri(url) if request else url,
+        'location': get_location_string(event),
+    }
+
+
+def _get_cache_key(event, request=None):
+    # the name of the venue comes from the API, the url from the host requested
+    base_url = request.build_absolute_uri('/') if request else ''
+    fingerprint = repr((event.updated, event.location, base_url))
+    return 'vevent:{id}:{digest}'.format(id=event.id, digest=hashlib.md5(fingerprint).hexdigest())
+
+
+def iter_vevents(events, request=None):
+    """Render the events, using the cached VEVENT blocks when possible
+    :param events: iterable of Event
+    :param request: current request
+    :return: generator of VEVENT blocks
+    """
+    cache = caches[CACHE_NAME]
+    events = iter(events)
+    while True:
+        chunk = [event for _, event in zip(range(CHUNK_SIZE), events)]
+        if not chunk:
+            return
+        keys = [_get_cache_key(event, request) for event in chunk]
+        cached = cache.get_many(keys)
+        missing = [(key, event) for key, event in zip(keys, chunk) if key not in cached]
+        prefetch_events([event for _, event in missing], api_resources=('location',))
+        rendered = {key: ICalRenderer.event_to_vevent(get_ics_data(event, request)) for key, event in missing}
+        for key in keys:
+            yield cached.get(key) or rendered[key]
+        if rendered:
+            cache.set_many(rendered)
+
+
+def ics_response(events, request=None):
+    """Stream a calendar of events
+    :param events: iterable of Event (e.g. a QuerySet, iterated once)
+    :param request: current request
+    :return: StreamingHttpResponse
+    """
+    if hasattr(events, 'iterator'):
+        events = events.iterator()
+    return StreamingHttpResponse(stream_ical(iter_vevents(events, request)), content_type=ICalRenderer.media_type)
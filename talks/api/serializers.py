@@ -1,12 +1,15 @@
 from django.contrib.auth.models import User
 from django.conf import settings
-from rest_framework import serializers, pagination
+from django.db import models
+from rest_framework import serializers
 from rest_framework.fields import Field
+from rest_framework.templatetags.rest_framework import replace_query_param
 import pytz
 from datetime import datetime, timedelta
 
 
 from talks.events.models import Event, Person, EventGroup
+from talks.events.resources import prefetch_events, get_resource_map
 from talks.users.models import CollectionItem, TalksUserCollection, Collection, CollectedDepartment, TalksUser
 
 
@@ -36,6 +39,40 @@ class ClassNameField(serializers.Field):
         return value.__class__.__name__
 
 
+def get_location_string(event):
+    """Describe the location of an event
+    :param event: Event
+    :return: string including the name, details and address of the venue
+    """
+    if event.location:
+        if event.api_location:
+            location = event.api_location
+            name = location['name']
+            if event.location_details:
+                name += " (" + event.location_details + ")"
+            location_string = name
+            if location.get('address'):
+                location_string += ", " + location.get('address')
+            return location_string
+    if event.location_details:
+        name = event.location_details
+        return name
+    else:
+        return "Venue to be announced"
+
+
+class PrefetchedEventListSerializer(serializers.ListSerializer):
+    """
+    Load the related objects and external resources of all the events at once before serializing them
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        request = self.context.get('request')
+        resource_map = get_resource_map(request) if request is not None else None
+        return super(PrefetchedEventListSerializer, self).to_representation(
+            prefetch_events(iterable, resource_map=resource_map))
+
+
 class EventSerializer(serializers.ModelSerializer):
     url = serializers.CharField(source='get_absolute_url',
                                 read_only=True)
@@ -57,28 +94,14 @@ class EventSerializer(serializers.ModelSerializer):
             return obj.get_absolute_url()
 
     def get_location(self, event):
-
-        if event.location:
-            if event.api_location:
-                location = event.api_location
-                name = location['name']
-                if event.location_details:
-                    name += " (" + event.location_details + ")"
-                location_string = name
-                if location.get('address'):
-                    location_string += ", " + location.get('address')
-                return location_string
-        if event.location_details:
-            name = event.location_details
-            return name
-        else:
-            return "Venue to be announced"
+        return get_location_string(event)
 
     class Meta:
         model = Event
         fields = ('slug', 'url', 'title_display', 'start', 'end', 'description', 'status',
                   'formatted_date', 'formatted_time', 'speakers', 'organisers', 'hosts', 'happening_today', 'audience', 'api_location',
                   'api_organisation', 'api_topics', 'class_name', 'full_url', 'location', 'organiser_email', 'various_speakers')
+        list_serializer_class = PrefetchedEventListSerializer
 
 
 class HALURICharField(Field):
@@ -199,6 +222,7 @@ class HALEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = ('_links', 'title_display', 'slug', 'start', 'end', 'timezone', 'formatted_date', 'formatted_time', 'status', 'description', 'audience', 'booking_required', 'booking_url', 'booking_email', 'cost', 'location_details', 'location_summary', 'series', 'organiser_email', 'special_message', '_embedded')
+        list_serializer_class = PrefetchedEventListSerializer
 
 
 
@@ -206,26 +230,26 @@ class SearchResultEmbedsSerializer(serializers.Serializer):
     talks = HALEventSerializer(source='*', many=True, read_only=True)
 
 
-class HALPreviousPageField(pagination.PreviousPageField):
-
-    def to_representation(self, value):
-        if value.has_previous():
-            return {'href': super(HALPreviousPageField, self).to_representation(value)}
-        return None
-
-
-class HALNextPageField(pagination.NextPageField):
+class HALCursorField(Field):
+    """Link to an adjacent page of a `talks.core.pagination.KeysetPage`
+    """
+    def __init__(self, cursor_method, *args, **kwargs):
+        self.cursor_method = cursor_method
+        kwargs['read_only'] = True
+        super(HALCursorField, self).__init__(*args, **kwargs)
 
     def to_representation(self, value):
-        if value.has_next():
-            return {'href': super(HALNextPageField, self).to_representation(value)}
-        return None
+        cursor = getattr(value, self.cursor_method)()
+        if cursor is None:
+            return None
+        url = self.context['request'].build_absolute_uri()
+        return {'href': replace_query_param(url, 'cursor', cursor)}
 
 
 class SearchResultLinksSerializer(serializers.Serializer):
     self = serializers.SerializerMethodField()
-    next = HALNextPageField(source='*')
-    prev = HALPreviousPageField(source='*')
+    next = HALCursorField('next_cursor', source='*')
+    prev = HALCursorField('previous_cursor', source='*')
     results = None
 
     def get_self(self, obj):
@@ -1,13 +1,33 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Count, Max
 from django.db.models.query_utils import Q
+from django.utils import timezone
+import hashlib
 import operator
 from rest_framework.exceptions import ParseError
+from talks.api_ox.models import OrganisationNode
 from talks.core.utils import parse_date
 from talks.events.datasources import DEPARTMENT_DESCENDANT_DATA_SOURCE
-from talks.events.models import ROLES_SPEAKER, Event, EventGroup
-from datetime import datetime, timedelta
+from talks.events.models import ROLES_SPEAKER, Event, EventGroup, PersonEvent, TopicItem
+from datetime import date, datetime, time, timedelta
 
 
 
+def _speakers_filter(speakers):
+    """Events with one of the speakers (slugs)
+    """
+    speaker_events = PersonEvent.objects.filter(role=ROLES_SPEAKER, person__slug__in=speakers)
+    return Q(id__in=speaker_events.values('event_id'))
+
+
+def _topics_filter(topics):
+    """Events with one of the topics (URIs)
+    """
+    topic_items = TopicItem.objects.filter(content_type=ContentType.objects.get_for_model(Event), uri__in=topics)
+    return Q(id__in=topic_items.values('object_id'))
+
+
 def events_search(parameters):
     """
     Return a list of events based on the DRF Request object
@@ -33,14 +53,16 @@ def events_search(parameters):
     if subdepartments and subdepartments == 'false':
         include_sub_departments = False
 
-    # map between URL query parameters and their corresponding django ORM query
+    # map between URL query parameters and their corresponding django ORM query.
+    # Filters on people and topics are semi-joins (`id IN (subquery)`) rather than
+    # joins, so that each event is returned once without using DISTINCT
     list_parameters = {
-        'speaker': lambda speakers: Q(personevent__role=ROLES_SPEAKER, personevent__person__slug__in=speakers),
+        'speaker': _speakers_filter,
         'venue': lambda venues: Q(location__in=venues),
         'organising_department': lambda depts: Q(department_organiser__in=get_all_department_ids(depts, include_sub_departments)),
-        'topic': lambda topics: Q(topics__uri__in=topics),
+        'topic': _topics_filter,
         'series': lambda series: Q(group__slug__in=series),
-        'seriesid': lambda seriesid: Q(group__id__in=seriesid)
+        'seriesid': lambda seriesid: Q(group_id__in=seriesid)
     }
 
     for url_query_parameter, orm_mapping in list_parameters.iteritems():
@@ -49,28 +71,45 @@ def events_search(parameters):
             queries.append(orm_mapping(value))
 
     final_query = reduce(operator.and_, queries)
-    events = Event.objects.filter(final_query).distinct().order_by('start')
-    
+    events = Event.objects.filter(final_query).order_by('start')
+
     return events
 
 
 def get_all_department_ids(departments, include_suborgs):
-    if not include_suborgs:
+    """Get the ids of departments and (optionally) of all their sub-departments
+    :param departments: list of OxPoints ids
+    :param include_suborgs: whether to include sub-departments
+    :return: iterable of ids (can be a subquery)
+    """
+    if not include_suborgs or not departments:
         return departments
 
-    # build a new list which includes the originals plus all descendants
-    try:
-        descendants_response = DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_list(departments)
-    except Exception:
-        print "Error retrieving sub-departments, returning departments only"
-        return departments
+    # departments in the local tree (see the `sync_organisation_tree` command)
+    descendants, missing = OrganisationNode.objects.descendant_ids(departments)
+    if not missing:
+        return descendants
+
+    all_ids = list(descendants) if descendants is not None else []
+    all_ids.extend(get_remote_department_ids(missing))
+    return all_ids
 
+
+def get_remote_department_ids(departments):
+    """Get the ids of departments and all their sub-departments from the API
+    :param departments: list of OxPoints ids
+    :return: list of ids
+    """
     all_ids = []
-    for result in descendants_response:
-        # For each of the orgs being queried, extract the list of suborg ids, and add the original id too
-        result_ids = map((lambda descendant: descendant['id']), result['descendants'])
-        result_ids.append(result['id'])
-        all_ids.extend(result_ids)
+    for department in departments:
+        all_ids.append(department)
+        try:
+            result = DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_by_id(department)
+        except Exception:
+            print "Error retrieving sub-departments, returning department only"
+            continue
+        if result:
+            all_ids.extend(descendant['id'] for descendant in result['descendants'])
     return all_ids
 
 
@@ -94,3 +133,51 @@ def get_eventgroup_by_slug(slug):
         return EventGroup.objects.get(slug=slug)
     except EventGroup.DoesNotExist:
         return None
+
+
+def get_daily_event_counts(start, end):
+    """Count the events of each day (in the current time zone) with one aggregate query
+    :param start: aware datetime (included)
+    :param end: aware datetime (excluded)
+    :return: list of tuples (date, number of events), for the days which have events
+    """
+    start_column = '{table}.{column}'.format(table=connection.ops.quote_name(Event._meta.db_table),
+                                             column=connection.ops.quote_name('start'))
+    day_sql, day_params = connection.ops.datetime_trunc_sql('day', start_column,
+                                                             timezone.get_current_timezone_name())
+    rows = (Event.objects.filter(start__gte=start, start__lt=end)
+            .extra(select={'day': day_sql}, select_params=day_params)
+            .values('day').annotate(count=Count('id')).order_by('day'))
+    counts = []
+    for row in rows:
+        day = row['day']
+        if isinstance(day, datetime):
+            day = day.date()
+        else:
+            # SQLite returns a string
+            day = datetime.strptime(day[:10], '%Y-%m-%d').date()
+        counts.append((day, row['count']))
+    return counts
+
+
+def get_events_validator(events, objects=(), daily=False, variant=''):
+    """Compute validators for a response which only depends on
+    events (and some other objects), without loading the events
+    :param events: QuerySet of Event
+    :param objects: other objects displayed in the response (e.g. the Collection), with an `updated` field
+    :param daily: whether the events also depend on the current date (e.g. upcoming events)
+    :param variant: anything else the response depends on (e.g. the query string)
+    :return: tuple (ETag, Last-Modified datetime or None)
+    """
+    aggregates = events.aggregate(last_updated=Max('updated'), count=Count('id'))
+    objects_updated = [(obj.__class__.__name__, obj.pk, obj.updated) for obj in objects]
+    times = [aggregates['last_updated']] + [updated for _, _, updated in objects_updated]
+    today = None
+    if daily:
+        today = date.today()
+        times.append(timezone.make_aware(datetime.combine(today, time()), timezone.get_current_timezone()))
+    times = filter(None, times)
+    last_modified = max(times) if times else None
+    etag = hashlib.md5(repr((aggregates['count'], aggregates['last_updated'], objects_updated, today,
+                             variant))).hexdigest()
+    return etag, last_modified
@@ -3,10 +3,18 @@ import mock
 from django.contrib.contenttypes.models import ContentType
 from django.test.testcases import TestCase
 from rest_framework.test import APIRequestFactory, APIClient
+from django.test.utils import override_settings
+from talks.api.ics import ics_response
+from talks.api.serializers import HALEventSerializer, EventSerializer
+from talks.core.renderers import ICalRenderer
+from talks.api.services import events_search, get_all_department_ids
+from talks.api_ox.models import OrganisationNode
 from talks.events import factories, models
 from talks.users import models
-from talks.events.models import EVENT_PUBLISHED, PersonEvent, ROLES_SPEAKER
+from talks.events.models import EVENT_PUBLISHED, PersonEvent, ROLES_SPEAKER, Person
 from django.conf import settings
+from django.http import QueryDict
+from django.utils import timezone
 import datetime 
 
 FUTURE_DATE_STRING = "2018-01-01 19:00"
@@ -159,7 +167,7 @@ class TestAPI(TestCase):
         self.req_factory = APIRequestFactory()
         self.client = APIClient()
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_retrieve_event_happy(self, requests_get):
         response = self.client.get('/api/talks/' + self.event1_slug)
         self.assertEquals(response.status_code, 200)
@@ -173,7 +181,7 @@ class TestAPI(TestCase):
         response = self.client.get('/api/talks/foo')
         self.assertEquals(response.status_code, 404)
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_retrieve_series_happy(self, requests_get):
         response = self.client.get('/api/series/' + self.group1_slug)
         self.assertEquals(response.status_code, 200)
@@ -186,7 +194,7 @@ class TestAPI(TestCase):
         response = self.client.get('/api/series/foo/')
         self.assertEquals(response.status_code, 404)
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_retrieve_collection_happy(self, requests_get):
         response = self.client.get('/api/collections/id/' + self.collection1_slug)
         self.assertEquals(response.status_code, 200)
@@ -209,7 +217,7 @@ class TestAPI(TestCase):
         self.assertContains(response, "_links")
         self.assertContains(response, "_embedded")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_from_today(self, requests_get):
         #test the from=today search
         #expect only the future search
@@ -221,7 +229,7 @@ class TestAPI(TestCase):
         self.assertContains(response, "A today event")
         self.assertNotContains(response, "A past event")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_edge_dates(self, requests_get):
         #test the from past_event_date,  to future_event_date search
         #expect all the events in the results
@@ -233,7 +241,26 @@ class TestAPI(TestCase):
         self.assertContains(response, "A today event")
         self.assertContains(response, "A past event")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_search_cursor(self, requests_get):
+        response = self.client.get('/api/talks/search?from=01/01/01&count=1')
+        self.assertEquals(response.status_code, 200)
+        links = response.data['_links']
+        self.assertEquals(links['prev'], None)
+        self.assertIn('cursor=', links['next']['href'])
+        slugs = [response.data['_embedded']['talks'][0]['slug']]
+        while links['next']:
+            response = self.client.get(links['next']['href'])
+            links = response.data['_links']
+            slugs.extend(talk['slug'] for talk in response.data['_embedded']['talks'])
+        self.assertEquals(len(slugs), len(set(slugs)))
+        self.assertEquals(len(slugs), models.Event.objects.count())
+
+    def test_search_invalid_cursor(self):
+        response = self.client.get('/api/talks/search?from=01/01/01&cursor=foo')
+        self.assertEquals(response.status_code, 400)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_from_to(self, requests_get):
         #test the from and to search fields
         #expect only the future search
@@ -247,7 +274,7 @@ class TestAPI(TestCase):
         # self.assertContains(response, "title", 2)
         # No longer a valid test, as there are further titles within embedded data
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_speaker(self, requests_get):
         response = self.client.get('/api/talks/search?from=01/01/01&speaker=' + self.speaker1_slug )
         self.assertEquals(response.status_code, 200)
@@ -257,7 +284,7 @@ class TestAPI(TestCase):
         self.assertContains(response, "James Bond")
         self.assertContains(response, "A future event")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_venue(self, requests_get):
         response = self.client.get('/api/talks/search?from=01/01/01&venue=' + self.location1)
         self.assertEquals(response.status_code, 200)
@@ -265,7 +292,7 @@ class TestAPI(TestCase):
         self.assertContains(response, "_embedded")
         self.assertContains(response, "Banbury Road")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_organising_department(self, requests_get):
         response = self.client.get('/api/talks/search?from=01/01/01&organising_department=' + self.department1)
         self.assertEquals(response.status_code, 200)
@@ -273,7 +300,7 @@ class TestAPI(TestCase):
         self.assertContains(response, "_embedded")
         self.assertContains(response, "Chemical Biology")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_topic(self, requests_get):
         response = self.client.get('/api/talks/search?from=01/01/01&topic=' + self.topic1_uri)
         self.assertEquals(response.status_code, 200)
@@ -281,10 +308,156 @@ class TestAPI(TestCase):
         self.assertContains(response, "_embedded")
         self.assertContains(response, "Biodiversity")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
     def test_search_sub_organisations(self, requests_get):
         response = self.client.get('/api/talks/search?from=01/01/01&organising_department=' + self.super_department)
         self.assertEquals(response.status_code, 200)
         self.assertContains(response, "_links")
         self.assertContains(response, "_embedded")
         self.assertContains(response, self.event1_slug)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_serialize_many_same_as_single(self, requests_get):
+        events = models.Event.objects.order_by('start')
+        for serializer_class in (HALEventSerializer, EventSerializer):
+            single = [serializer_class(event).data for event in events]
+            requests_get.reset_mock()
+            many = serializer_class(events, many=True).data
+            self.assertEquals(list(many), single)
+            # one request for each of location, department and topics
+            self.assertEquals(requests_get.call_count, 3)
+
+    def test_serialize_many_queries(self):
+        events = list(models.Event.objects.all())
+        with mock.patch('talks.events.typeahead.DataSource.get_local_objects', return_value=({}, set())):
+            # groups, people and topics
+            with self.assertNumQueries(3):
+                HALEventSerializer(events, many=True).data
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_ics_same_as_serialized(self, requests_get):
+        events = models.Event.objects.order_by('start')
+        serialized = ICalRenderer().render(EventSerializer(events, many=True).data)
+        streamed = "".join(ics_response(events).streaming_content)
+        self.assertEquals(streamed, serialized)
+
+    @override_settings(CACHES=dict(settings.CACHES, ics={
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-ics'}))
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_ics_cached(self, requests_get):
+        events = models.Event.objects.order_by('start')
+        first = "".join(ics_response(events).streaming_content)
+        with mock.patch.object(ICalRenderer, 'event_to_vevent') as event_to_vevent:
+            with mock.patch('talks.api.ics.prefetch_events') as prefetch:
+                second = "".join(ics_response(events).streaming_content)
+        self.assertFalse(event_to_vevent.called)
+        # nothing is loaded for the cached events
+        prefetch.assert_called_once_with([], api_resources=('location',))
+        self.assertEquals(first, second)
+        models.Event.objects.filter(slug=self.event1_slug).update(title="A changed event", updated=timezone.now())
+        self.assertIn("A changed event", "".join(ics_response(events).streaming_content))
+
+    def test_search_page_parameters(self):
+        url = '/api/talks/search'
+        self.assertEquals(self.client.get(url, {'from': 'today', 'page': 2}).status_code, 400)
+        self.assertEquals(self.client.get(url, {'from': 'today', 'count': -2}).status_code, 400)
+        self.assertEquals(self.client.get(url, {'from': 'today', 'count': 0}).status_code, 400)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_conditional_get(self, requests_get):
+        url = '/api/person/' + self.speaker1_slug + '.ics'
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        # the latest update does not tell when an event left the feed
+        self.assertNotIn('Last-Modified', response)
+        # changing the name of the speaker changes the feed
+        person = Person.objects.get(slug=self.speaker1_slug)
+        person.name = "James Bond 007"
+        person.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response['ETag'], etag)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_conditional_get_series(self, requests_get):
+        url = '/api/series/' + self.group1_slug
+        etag = self.client.get(url)['ETag']
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        models.Event.objects.get(slug=self.event1_slug).save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_conditional_get_event_deleted(self, requests_get):
+        url = '/api/series/' + self.group1_slug
+        etag = self.client.get(url)['ETag']
+        models.Event.objects.filter(group__slug=self.group1_slug).order_by('start').first().delete()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_conditional_get_event(self, requests_get):
+        url = '/api/talks/' + self.event1_slug
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEquals(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+
+class TestGetAllDepartmentIds(TestCase):
+
+    def test_without_sub_departments(self):
+        self.assertEquals(get_all_department_ids(['oxpoints:23232546'], False), ['oxpoints:23232546'])
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_local_tree(self, requests_get):
+        OrganisationNode.objects.rebuild('oxpoints:23232546', {
+            'oxpoints:23232546': (None, 'Department of Chemistry'),
+            'oxpoints:23232503': ('oxpoints:23232546', 'Chemical Biology'),
+        })
+        ids = get_all_department_ids(['oxpoints:23232546'], True)
+        self.assertEquals(sorted(ids), ['oxpoints:23232503', 'oxpoints:23232546'])
+        self.assertFalse(requests_get.called)
+
+    @mock.patch('talks.core.http.get', side_effect=mocked_requests_get)
+    def test_remote_each_department(self, requests_get):
+        ids = get_all_department_ids(['oxpoints:23232546', 'oxpoints:40002001'], True)
+        self.assertIn('oxpoints:23232604', ids)
+        self.assertIn('oxpoints:23232546', ids)
+        self.assertIn('oxpoints:40002001', ids)
+        self.assertEquals(requests_get.call_count, 2)
+
+
+class TestEventsSearch(TestCase):
+
+    def setUp(self):
+        self.event = factories.EventFactory.create(title="Joint talk")
+        self.other = factories.EventFactory.create(title="Other talk")
+        for slug in ('speaker-a', 'speaker-b'):
+            person = factories.PersonFactory.create(name=slug, slug=slug)
+            factories.PersonEventFactory.create(person=person, event=self.event, role=ROLES_SPEAKER)
+        ct = ContentType.objects.get_for_model(models.Event)
+        for uri in ('http://example.com/a', 'http://example.com/b'):
+            factories.TopicItemFactory_noSubFactory.create(uri=uri, content_type=ct, object_id=self.event.id)
+
+    def test_each_event_once(self):
+        parameters = QueryDict('from=01/01/01&speaker=speaker-a&speaker=speaker-b'
+                               '&topic=http://example.com/a&topic=http://example.com/b')
+        events = events_search(parameters)
+        self.assertEquals(list(events), [self.event])
+        self.assertNotIn('DISTINCT', str(events.query))
+
+
+class TestEventCalendar(TestCase):
+
+    def test_daily_counts(self):
+        for start in ('2015-10-22 23:30Z', '2015-10-23 09:00Z', '2015-10-23 14:00Z', '2015-10-31 12:00Z',
+                      '2015-11-01 09:00Z'):
+            factories.EventFactory.create(start=start, end=start)
+        response = self.client.get('/api/talks/calendar/2015/10')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.data['days'], [{'date': '2015-10-23', 'count': 3},
+                                                  {'date': '2015-10-31', 'count': 1}])
+
+    def test_invalid_month(self):
+        response = self.client.get('/api/talks/calendar/2015/13')
+        self.assertEquals(response.status_code, 404)
@@ -1,6 +1,6 @@
 from django.conf.urls import patterns, url
 
-from .views import (api_event_search_hal, api_event_search_ics, api_event_get, api_event_get_ics,
+from .views import (api_event_search_hal, api_event_search_ics, api_event_calendar, api_event_get, api_event_get_ics,
                     api_event_group, get_event_group, suggest_event_group, api_event_group_ics,
                     suggest_user, suggest_user_by_complete_email_address, api_person, api_person_ics, suggest_person, api_create_person,
                     save_item, remove_item, subscribe_to_list, unsubscribe_from_list, api_collection, api_collection_ics,
@@ -14,6 +14,7 @@ urlpatterns = patterns('',
     url(r'^series/(?P<event_group_slug>[^/]+)', api_event_group, name='api-event-group'),
     url(r'^talks/search$', api_event_search_hal, name='api-search-events'),
     url(r'^talks/search.ics$', api_event_search_ics, name='api-search-events-ics'),
+    url(r'^talks/calendar/(?P<year>\d{4})/(?P<month>\d{2})$', api_event_calendar, name='api-events-calendar'),
     url(r'^talks/(?P<slug>[^/]+).ics$', api_event_get_ics, name='event-detail-ics'),
     url(r'^talks/(?P<slug>[^/]+)', api_event_get, name='event-detail'),
     url(r'^user/suggest$', suggest_user, name='api-user-suggest'),
@@ -3,26 +3,31 @@ from datetime import date
 from django.contrib.auth.models import User
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.db.models import Q
 from django.http.response import Http404
+from django.views.decorators.http import condition
 
 from rest_framework import status, permissions
+from rest_framework.exceptions import ParseError
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from talks.events.models import Event, EventGroup, Person
+from talks.events.resources import get_resource_map, resolve_api_resources
 from talks.users.authentication import GROUP_EDIT_EVENTS, user_in_group_or_super
 from talks.users.models import Collection, TalksUser, TalksUserCollection, CollectedDepartment, COLLECTION_ROLES_READER
 from talks.api.serializers import (PersonSerializer, EventGroupSerializer, UserSerializer,
                                     CollectionItemSerializer, TalksUserSerializer, TalksUserCollectionSerializer, get_item_serializer,
                                     HALEventSerializer, HALEventGroupSerializer, HALSearchResultSerializer, EventSerializer,
                                     HALCollectionSerializer, HALPersonSerializer)
-from talks.api.services import events_search, get_event_by_slug, get_eventgroup_by_slug
+from talks.api.services import (events_search, get_event_by_slug, get_eventgroup_by_slug, get_events_validator,
+                                get_daily_event_counts)
+from talks.api.ics import ics_response
+from talks.core.pagination import get_keyset_page, parse_count, InvalidCursor
 from talks.core.renderers import ICalRenderer
-from talks.core.utils import parse_date
+from talks.core.utils import parse_date, date_range
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,75 @@ class IsSuperuserOrContributor(permissions.BasePermission):
 
 
 
+def events_condition(get_events, daily=False, last_modified=False):
+    """Answer conditional GET requests (If-None-Match, If-Modified-Since)
+    to a view which only depends on events, before running the view
+    :param get_events: function called with the arguments of the view and returning
+    a tuple (QuerySet of Event, list of other objects) or None if not found
+    :param daily: whether the events also depend on the current date
+    :param last_modified: whether to send Last-Modified, only for a single event:
+    the latest update of a list of events does not change when one of them is
+    deleted or leaves the list (the ETag does, it includes their number)
+    """
+    def get_validator(request, *args, **kwargs):
+        if not hasattr(request, '_events_validator'):
+            found = get_events(request, *args, **kwargs)
+            if found:
+                events, objects = found
+                variant = (request.get_full_path(), request.META.get('HTTP_ACCEPT'))
+                request._events_validator = get_events_validator(events, objects, daily=daily, variant=variant)
+            else:
+                request._events_validator = None, None
+        return request._events_validator
+
+    def etag_func(request, *args, **kwargs):
+        return get_validator(request, *args, **kwargs)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        return get_validator(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func if last_modified else None)
+
+
+def _event_group_events(request, event_group_slug):
+    eg = get_eventgroup_by_slug(event_group_slug)
+    if eg:
+        return eg.events.all(), [eg]
+
+
+def _search_events(request):
+    try:
+        return events_search(request.GET), []
+    except ParseError:
+        return None
+
+
+def _event(request, slug):
+    event = get_event_by_slug(slug)
+    if event:
+        return Event.objects.filter(id=event.id), [event.group] if event.group else []
+
+
+def _person_events(request, person_slug):
+    person = Person.objects.filter(slug=person_slug).first()
+    if person:
+        return Event.objects.filter(personevent__person=person), [person]
+
+
+def _collection_events(request, collection_slug):
+    collection = Collection.objects.filter(slug=collection_slug).first()
+    if collection:
+        return collection.get_all_events(), [collection]
+
+
+def _month_events(request, year, month):
+    try:
+        start, end = date_range(year, month)
+    except ValueError:
+        return None
+    return Event.objects.filter(start__gte=start, start__lt=end), []
+
+
 # These views are typically used by ajax
 @authentication_classes((SessionAuthentication,))
 @permission_classes((IsAuthenticated, IsSuperuserOrContributor,))
@@ -101,6 +175,7 @@ def get_event_group(request, event_group_id):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@events_condition(_event_group_events)
 @api_view(["GET"])
 def api_event_group(request, event_group_slug):
     """Serialise an EventGroup
@@ -122,6 +197,7 @@ def api_event_group(request, event_group_slug):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@events_condition(_event_group_events)
 @api_view(["GET"])
 @renderer_classes((ICalRenderer,))
 def api_event_group_ics(request, event_group_slug):
@@ -133,8 +209,7 @@ def api_event_group_ics(request, event_group_slug):
         return Response({'error': "Item not found"},
                         status=status.HTTP_404_NOT_FOUND)
 
-    serializer = EventSerializer(eg.events, many=True, context={'request': request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return ics_response(eg.events.all(), request)
 
 
 @api_view(["GET"])
@@ -147,6 +222,7 @@ def suggest_event_group(request):
     return Response(serializer.data)
 
 
+@events_condition(_search_events, daily=True)
 @api_view(["GET"])
 def api_event_search_hal(request):
     """
@@ -155,20 +231,44 @@ def api_event_search_hal(request):
     """
     events = events_search(request.GET)
 
-    count = request.GET.get('count', 20)
-    page_number = request.GET.get('page', 1)
-    paginator = Paginator(events, count)
+    if 'page' in request.GET:
+        raise ParseError(detail="The 'page' parameter is not supported, follow the 'next' link "
+                                "(or use the 'cursor' parameter) to get the next page.")
     try:
-        page = paginator.page(page_number)
-    except PageNotAnInteger:
-        page = paginator.page(1)
-    except EmptyPage:
-        page = paginator.page(paginator.num_pages)
+        count = parse_count(request.GET.get('count'))
+    except ValueError:
+        raise ParseError(detail="'count' parameter must be a number of at least 1.")
+    try:
+        page = get_keyset_page(events, request.GET.get('cursor'), count)
+    except InvalidCursor:
+        raise ParseError(detail="Invalid 'cursor' parameter.")
 
     serializer = HALSearchResultSerializer(page, read_only=True, context={'request': request})
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@events_condition(_month_events)
+@api_view(["GET"])
+def api_event_calendar(request, year, month):
+    """
+    Return the number of events of each day of a month
+    (e.g. for a calendar widget)
+    """
+    try:
+        start, end = date_range(year, month)
+    except ValueError:
+        raise Http404
+    days = [{'date': day.isoformat(), 'count': count} for day, count in get_daily_event_counts(start, end)]
+    data = {
+        '_links': {'self': {'href': request.build_absolute_uri()}},
+        'year': int(year),
+        'month': int(month),
+        'days': days,
+    }
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@events_condition(_search_events, daily=True)
 @api_view(["GET"])
 @renderer_classes((ICalRenderer,))
 def api_event_search_ics(request):
@@ -177,28 +277,27 @@ def api_event_search_ics(request):
     based on the query terms
     """
     events = events_search(request.GET)
-    serializer = EventSerializer(events, many=True, context={'request': request})
-    return Response(serializer.data,
-                    status=status.HTTP_200_OK, content_type=ICalRenderer.media_type)
+    return ics_response(events, request)
 
 
+@events_condition(_event, last_modified=True)
 @api_view(["GET"])
 def api_event_get(request, slug):
     event = get_event_by_slug(slug)
     if not event:
         raise Http404
+    resolve_api_resources([event], resource_map=get_resource_map(request))
     serializer = HALEventSerializer(event, read_only=True, context={'request': request})
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+@events_condition(_event, last_modified=True)
 @api_view(["GET"])
 @renderer_classes((ICalRenderer,))
 def api_event_get_ics(request, slug):
     event = get_event_by_slug(slug)
     if not event:
         raise Http404
-    serializer = EventSerializer(event, context={'request':request})
-    return Response(serializer.data,
-                    status=status.HTTP_200_OK, content_type=ICalRenderer.media_type)
+    return ics_response([event], request)
 
 
 def item_from_request(request):
@@ -305,6 +404,7 @@ def unsubscribe_from_list(request):
         return Response({'error': "Failed to unsubscribe from collection"},
                         status=status.HTTP_404_NOT_FOUND)
 
+@events_condition(_person_events)
 @api_view(["GET"])
 @renderer_classes((ICalRenderer,))
 def api_person_ics(request, person_slug):
@@ -314,14 +414,13 @@ def api_person_ics(request, person_slug):
         person = Person.objects.get(slug=person_slug)
         today = date.today()
         events = Event.objects.filter(personevent__person__slug=person_slug)
-        
-        serializer = EventSerializer(events, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return ics_response(events, request)
     
     except ObjectDoesNotExist:
         return Response({'error': "Person not found"},
                         status=status.HTTP_404_NOT_FOUND)
 
+@events_condition(_person_events)
 @api_view(["GET"])
 def api_person(request, person_slug):
     """Get events associated with a person
@@ -340,6 +439,7 @@ def api_person(request, person_slug):
         return Response({'error': "Person not found"},
                         status=status.HTTP_404_NOT_FOUND)
 
+@events_condition(_collection_events, daily=True)
 @api_view(["GET"])
 @renderer_classes((ICalRenderer,))
 def api_collection_ics(request, collection_slug):
@@ -349,16 +449,15 @@ def api_collection_ics(request, collection_slug):
     try:
         collection = Collection.objects.get(slug=collection_slug)
         today = date.today()
-        events = collection.get_all_events().filter(start__gte=today)
-
-        serializer = EventSerializer(events, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        events = collection.get_all_events(from_date=today)
+        return ics_response(events, request)
     except ObjectDoesNotExist:
         return Response({'error': "Collection not found"},
                         status=status.HTTP_404_NOT_FOUND)
 
 
 
+@events_condition(_collection_events)
 @api_view(["GET"])
 def api_collection(request, collection_slug):
     """Get events and event groups from a collection to be displayed
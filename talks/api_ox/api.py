@@ -1,6 +1,9 @@
 """This is only used for oxford dates, this should probably
 be moved to typeahead.Datasource, but the API should support the
-query of multiple dates at once to keep the use consistent
+query of multiple dates at once to keep the use consistent.
+
+Dates are normally computed locally (see `talks.api_ox.dates`),
+use `get_oxford_dates` to resolve many dates at once.
 """
 
 import logging
@@ -9,6 +12,9 @@ import requests
 from requests.exceptions import RequestException
 from django.conf import settings
 
+from talks.api_ox.dates import OxfordDate, local_date
+from talks.core import http
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,15 +32,16 @@ class JSONAttribute(object):
 
 class ApiOxResource(object):
 
-    _json = {}
-
+    # the dates are on the same host as OxPoints, whose
+    # timeout (see EXTERNAL_HTTP['HOSTS']) is too long for them
     def __init__(self, base_url, timeout=1):
         self.base_url = base_url
         self.timeout = timeout
+        self._json = {}
 
     def _get_request(self, path, params=None):
         try:
-            r = requests.get('{base_url}{path}'.format(
+            r = http.get('{base_url}{path}'.format(
                 base_url=self.base_url, path=path), timeout=self.timeout)
             if r.status_code == requests.codes.ok:
                 self._json = r.json()
@@ -67,6 +74,18 @@ class OxfordDateResource(ApiOxResource):
         return date_resource
 
 
+def get_oxford_dates(dates):
+    """Resolve multiple dates at once, each distinct day is only
+    computed once
+    :param dates: iterable of dates or datetimes (aware datetimes are
+    converted to the local timezone first)
+    :return: dict of date -> `OxfordDate` (exposing `components`,
+    `formatted` and `formatted_nocal`)
+    """
+    days = set(local_date(d) for d in dates if d)
+    return dict((day, OxfordDate.from_date(day)) for day in days)
+
+
 class ApiException(Exception):
 
     message = "API is not available"
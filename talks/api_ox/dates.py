@@ -0,0 +1,210 @@
+"""Local computation of Oxford dates (e.g. "Friday 1st Week, Michaelmas 2015").
+
+Dates are computed from a table of the start of each Full Term (the Sunday
+of 1st Week), so that rendering a page does not need to call the dates API.
+The API is still available through `talks.api_ox.api.OxfordDateResource`
+and can be used to verify or extend the table (see the
+`oxford_term_dates` management command).
+"""
+
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+MICHAELMAS = 'michaelmas'
+HILARY = 'hilary'
+TRINITY = 'trinity'
+
+TERM_NAMES = {
+    MICHAELMAS: ('Michaelmas', 'Mich'),
+    HILARY: ('Hilary', 'Hil'),
+    TRINITY: ('Trinity', 'Trin'),
+}
+
+# number of weeks in a Full Term
+FULL_TERM_WEEKS = 8
+
+# Sunday of 1st Week for each Full Term, can be extended
+# using the OXFORD_TERM_DATES setting
+TERM_START_DATES = (
+    (MICHAELMAS, date(2010, 10, 10)),
+    (HILARY, date(2011, 1, 16)),
+    (TRINITY, date(2011, 5, 1)),
+    (MICHAELMAS, date(2011, 10, 9)),
+    (HILARY, date(2012, 1, 15)),
+    (TRINITY, date(2012, 4, 22)),
+    (MICHAELMAS, date(2012, 10, 14)),
+    (HILARY, date(2013, 1, 13)),
+    (TRINITY, date(2013, 4, 21)),
+    (MICHAELMAS, date(2013, 10, 13)),
+    (HILARY, date(2014, 1, 19)),
+    (TRINITY, date(2014, 4, 27)),
+    (MICHAELMAS, date(2014, 10, 12)),
+    (HILARY, date(2015, 1, 18)),
+    (TRINITY, date(2015, 4, 26)),
+    (MICHAELMAS, date(2015, 10, 11)),
+    (HILARY, date(2016, 1, 17)),
+    (TRINITY, date(2016, 4, 24)),
+    (MICHAELMAS, date(2016, 10, 9)),
+    (HILARY, date(2017, 1, 15)),
+    (TRINITY, date(2017, 4, 23)),
+    (MICHAELMAS, date(2017, 10, 8)),
+    (HILARY, date(2018, 1, 14)),
+    (TRINITY, date(2018, 4, 22)),
+    (MICHAELMAS, date(2018, 10, 7)),
+    (HILARY, date(2019, 1, 13)),
+    (TRINITY, date(2019, 4, 28)),
+    (MICHAELMAS, date(2019, 10, 13)),
+    (HILARY, date(2020, 1, 19)),
+    (TRINITY, date(2020, 4, 26)),
+    (MICHAELMAS, date(2020, 10, 11)),
+    (HILARY, date(2021, 1, 17)),
+    (TRINITY, date(2021, 4, 25)),
+    (MICHAELMAS, date(2021, 10, 10)),
+    (HILARY, date(2022, 1, 16)),
+    (TRINITY, date(2022, 4, 24)),
+    (MICHAELMAS, date(2022, 10, 9)),
+    (HILARY, date(2023, 1, 15)),
+    (TRINITY, date(2023, 4, 23)),
+    (MICHAELMAS, date(2023, 10, 8)),
+    (HILARY, date(2024, 1, 14)),
+    (TRINITY, date(2024, 4, 21)),
+    (MICHAELMAS, date(2024, 10, 13)),
+    (HILARY, date(2025, 1, 19)),
+    (TRINITY, date(2025, 4, 27)),
+    (MICHAELMAS, date(2025, 10, 12)),
+    (HILARY, date(2026, 1, 18)),
+    (TRINITY, date(2026, 4, 26)),
+    (MICHAELMAS, date(2026, 10, 11)),
+    (HILARY, date(2027, 1, 17)),
+    (TRINITY, date(2027, 4, 25)),
+)
+
+
+def ordinal_suffix(number):
+    """Suffix used when displaying a week number, e.g. 'st' for 1st
+    :param number: integer (can be zero or negative)
+    :return: 'st', 'nd', 'rd' or 'th'
+    """
+    number = abs(number)
+    if 10 <= number % 100 <= 20:
+        return 'th'
+    return {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+
+
+def format_date_heading(components):
+    """Heading of the events of a day in lists of events,
+    e.g. 'Monday 20 January 2025 (1st Week, Hilary Term)'
+    :param components: `components` of an `OxfordDate`
+    :return: string
+    """
+    return u"{day_name} {day_number} {month_long} {year} ({week}{ordinal} Week, {term_long} Term)".format(
+        **components)
+
+
+def _sunday_on_or_after(py_date):
+    return py_date + timedelta(days=(6 - py_date.weekday()) % 7)
+
+
+def _estimated_term_starts(year):
+    """Estimate the start of the terms of a year not covered by the table.
+    Michaelmas usually starts on the Sunday between the 7th and 13th of
+    October, Hilary on the Sunday between the 13th and 19th of January
+    and Trinity 14 weeks after Hilary.
+    """
+    hilary = _sunday_on_or_after(date(year, 1, 13))
+    return [
+        (HILARY, hilary),
+        (TRINITY, hilary + timedelta(weeks=14)),
+        (MICHAELMAS, _sunday_on_or_after(date(year, 10, 7))),
+    ]
+
+
+def get_term_start_dates():
+    """Get all the known term start dates, ordered by date
+    :return: list of tuples (term, date)
+    """
+    terms = dict((start, term) for term, start in TERM_START_DATES)
+    terms.update((start, term) for term, start in getattr(settings, 'OXFORD_TERM_DATES', ()))
+    return sorted(((term, start) for start, term in terms.iteritems()), key=lambda t: t[1])
+
+
+def _terms_around(py_date):
+    terms = get_term_start_dates()
+    first, last = terms[0][1], terms[-1][1]
+    if first <= py_date <= last + timedelta(weeks=FULL_TERM_WEEKS):
+        return terms
+    return _estimated_term_starts(py_date.year - 1) + _estimated_term_starts(py_date.year) +\
+        _estimated_term_starts(py_date.year + 1)
+
+
+def _distance_to_term(py_date, term_start):
+    term_end = term_start + timedelta(weeks=FULL_TERM_WEEKS)
+    if py_date < term_start:
+        return (term_start - py_date).days
+    elif py_date >= term_end:
+        return (py_date - term_end).days + 1
+    return 0
+
+
+def local_date(value):
+    """Get the (local) date of a date or datetime
+    """
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+class OxfordDate(object):
+    """Date expressed in the Oxford terms and weeks, exposes the same
+    attributes as `talks.api_ox.api.OxfordDateResource`
+    """
+
+    def __init__(self, py_date):
+        self.date = local_date(py_date)
+        # a date belongs to the closest term, e.g. dates
+        # after a term are in 9th Week, 10th Week... and dates
+        # before the next term are in 0th Week, -1st Week...
+        # (ties go to the following term)
+        self.term, self.term_start = min(reversed(_terms_around(self.date)),
+                                         key=lambda t: _distance_to_term(self.date, t[1]))
+        self.week = (self.date - self.term_start).days // 7 + 1
+
+    @classmethod
+    def from_date(cls, py_date):
+        return cls(py_date)
+
+    @property
+    def components(self):
+        term_long, term_short = TERM_NAMES[self.term]
+        return {
+            'day_name': self.date.strftime('%A'),
+            'day_short': self.date.strftime('%a'),
+            'day_number': self.date.day,
+            'month': self.date.month,
+            'month_long': self.date.strftime('%B'),
+            'month_short': self.date.strftime('%b'),
+            'year': self.date.year,
+            'week': self.week,
+            'ordinal': ordinal_suffix(self.week),
+            'term_long': term_long,
+            'term_short': term_short,
+            'term_year': self.term_start.year,
+        }
+
+    @property
+    def formatted_nocal(self):
+        comps = self.components
+        return u"{day_name} {week}{ordinal} Week, {term_long} {term_year}".format(**comps)
+
+    @property
+    def formatted(self):
+        comps = self.components
+        return u"{day_name} {day_number} {month_long} {year} ({week}{ordinal} Week, {term_long} {term_year})".format(
+            **comps)
+
+    def __unicode__(self):
+        return self.formatted
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from talks.api_ox.api import ApiException, OxfordDateResource
+from talks.api_ox.dates import (OxfordDate, get_term_start_dates, FULL_TERM_WEEKS,
+                                MICHAELMAS, HILARY, TRINITY)
+
+# dates used to ask the API which term (and week) it is
+# when deriving the start of the terms of a given year
+TERM_SAMPLE_DATES = (
+    (HILARY, (2, 15)),
+    (TRINITY, (5, 20)),
+    (MICHAELMAS, (11, 1)),
+)
+
+COMPARED_COMPONENTS = ('day_name', 'week', 'term_long')
+
+
+class Command(BaseCommand):
+    help = ("Verify the local table of Oxford term dates against the dates API, "
+            "or derive the term start dates of a year from the API")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--derive',
+                    dest='derive',
+                    type='int',
+                    default=None,
+                    help='Derive the start of the terms of the given year from the API'),
+        make_option('--since',
+                    dest='since',
+                    type='int',
+                    default=None,
+                    help='Only verify terms starting in or after this year'),
+    )
+
+    def handle(self, *args, **options):
+        if options['derive']:
+            self.derive(options['derive'])
+        else:
+            self.verify(options['since'])
+
+    def verify(self, since):
+        mismatches = 0
+        for term, start in get_term_start_dates():
+            if since and start.year < since:
+                continue
+            # first and last day of the Full Term
+            for day in (start, start + timedelta(weeks=FULL_TERM_WEEKS, days=-1)):
+                local = OxfordDate.from_date(day).components
+                remote = self._get_remote_components(day)
+                diff = [key for key in COMPARED_COMPONENTS if local.get(key) != remote.get(key)]
+                if diff:
+                    mismatches += 1
+                    self.stdout.write("{day}: local {local} != remote {remote}".format(
+                        day=day, local=[local.get(k) for k in diff], remote=[remote.get(k) for k in diff]))
+        if mismatches:
+            raise CommandError("{count} date(s) differ from the API".format(count=mismatches))
+        self.stdout.write("Local term dates match the API")
+
+    def derive(self, year):
+        self.stdout.write("Add the following to the OXFORD_TERM_DATES setting:")
+        for term, (month, day) in TERM_SAMPLE_DATES:
+            sample = date(year, month, day)
+            components = self._get_remote_components(sample)
+            # Sunday of the week containing the sample date
+            sunday = sample - timedelta(days=(sample.weekday() + 1) % 7)
+            start = sunday - timedelta(weeks=int(components['week']) - 1)
+            self.stdout.write("    ('{term}', date({d.year}, {d.month}, {d.day})),".format(term=term, d=start))
+
+    def _get_remote_components(self, day):
+        try:
+            return OxfordDateResource.from_date(day, timeout=5).components or {}
+        except ApiException as e:
+            raise CommandError("Unable to get {day} from the API: {message}".format(day=day, message=e.message))
@@ -0,0 +1,73 @@
+from optparse import make_option
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from talks.api_ox.models import OxPoint, OrganisationNode
+
+# number of ids requested from the API at once (bounded by the length of the url)
+DEFAULT_CHUNK_SIZE = 50
+
+
+def get_parent_ids(entity):
+    """Get the ids of the parents of an OxPoints entity
+    :param entity: entity as returned by the API
+    :return: list of ids
+    """
+    parents = entity.get('_links', {}).get('parent', [])
+    if isinstance(parents, dict):
+        parents = [parents]
+    return [link['href'][link['href'].find('oxpoints'):] for link in parents if 'href' in link]
+
+
+class Command(BaseCommand):
+    help = "Copy the hierarchy of organisations from OxPoints to the database"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--root',
+                    dest='root',
+                    default=None,
+                    help='OxPoints id of the root organisation (defaults to OXPOINTS_ROOT_ORGANISATION)'),
+        make_option('--chunk-size',
+                    dest='chunk_size',
+                    type='int',
+                    default=DEFAULT_CHUNK_SIZE,
+                    help='Number of entities to request from the API at once'),
+    )
+
+    def handle(self, *args, **options):
+        from talks.events.datasources import DEPARTMENT_DATA_SOURCE, DEPARTMENT_DESCENDANT_DATA_SOURCE
+        root_id = options['root'] or settings.OXPOINTS_ROOT_ORGANISATION
+        if not root_id:
+            raise CommandError("Set OXPOINTS_ROOT_ORGANISATION or use --root")
+        try:
+            tree = DEPARTMENT_DESCENDANT_DATA_SOURCE.fetch_remote_objects([root_id]).get(root_id)
+        except requests.RequestException as e:
+            raise CommandError("Unable to fetch the descendants of {root}: {message}".format(root=root_id, message=e))
+        if not tree:
+            raise CommandError("{root} not found".format(root=root_id))
+
+        titles = {descendant['id']: descendant.get('title', '') for descendant in tree['descendants']}
+        ids = [root_id] + sorted(titles)
+
+        # the list of descendants is flat, parents are only
+        # available from the entities (which are mirrored too)
+        entities = {}
+        chunk_size = options['chunk_size']
+        for i in range(0, len(ids), chunk_size):
+            try:
+                fetched = DEPARTMENT_DATA_SOURCE.fetch_remote_objects(ids[i:i + chunk_size])
+            except requests.RequestException as e:
+                raise CommandError("Unable to fetch entities from the API: {message}".format(message=e))
+            OxPoint.objects.update_many(fetched)
+            entities.update(fetched)
+
+        nodes = {}
+        for id in ids:
+            entity = entities.get(id, {})
+            parent_ids = [parent_id for parent_id in get_parent_ids(entity) if parent_id in titles or
+                          parent_id == root_id]
+            nodes[id] = (parent_ids[0] if parent_ids else None, titles.get(id) or entity.get('name', ''))
+        count = OrganisationNode.objects.rebuild(root_id, nodes)
+        self.stdout.write("Synced {count} organisations".format(count=count))
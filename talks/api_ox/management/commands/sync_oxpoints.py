@@ -0,0 +1,72 @@
+import itertools
+from optparse import make_option
+
+import requests
+from django.core.management.base import BaseCommand
+
+from talks.api_ox.models import OxPoint
+
+# number of ids requested from the API at once (bounded by the length of the url)
+DEFAULT_CHUNK_SIZE = 50
+
+OXPOINTS_PREFIX = 'oxpoints:'
+
+
+def get_referenced_ids():
+    """Get the ids of all the OxPoints entities referenced by the site
+    (other values of the fields, e.g. free text locations, are ignored)
+    :return: set of ids
+    """
+    from talks.events.models import Event, EventGroup
+    from talks.users.models import CollectedDepartment
+    querysets = (
+        Event.objects.values_list('location', flat=True),
+        Event.objects.values_list('department_organiser', flat=True),
+        EventGroup.objects.values_list('department_organiser', flat=True),
+        CollectedDepartment.objects.values_list('department', flat=True),
+    )
+    return set(id for id in itertools.chain.from_iterable(qs.distinct() for qs in querysets)
+               if id and id.startswith(OXPOINTS_PREFIX))
+
+
+class Command(BaseCommand):
+    help = "Copy the OxPoints entities (places and departments) referenced by events and collections to the database"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    dest='chunk_size',
+                    type='int',
+                    default=DEFAULT_CHUNK_SIZE,
+                    help='Number of entities to request from the API at once'),
+        make_option('--prune',
+                    action='store_true',
+                    dest='prune',
+                    default=False,
+                    help='Delete entities which are no longer referenced'),
+    )
+
+    def handle(self, *args, **options):
+        from talks.events.datasources import LOCATION_DATA_SOURCE
+        ids = sorted(get_referenced_ids())
+        chunk_size = options['chunk_size']
+        synced = 0
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            try:
+                # both location and department sources request the same endpoint
+                entities = LOCATION_DATA_SOURCE.fetch_remote_objects(chunk)
+            except requests.RequestException as e:
+                # the entities already mirrored are kept, try the other chunks
+                self.stderr.write("Unable to fetch {ids} from the API: {message}".format(
+                    ids=", ".join(chunk), message=e))
+                continue
+            OxPoint.objects.update_many(entities)
+            synced += len(entities)
+            missing = set(chunk) - set(entities)
+            if missing:
+                self.stdout.write("Not found: {ids}".format(ids=", ".join(sorted(missing))))
+        self.stdout.write("Synced {synced} of {total} entities".format(synced=synced, total=len(ids)))
+        if options['prune']:
+            stale = OxPoint.objects.exclude(id__in=ids)
+            self.stdout.write("Deleting {count} unreferenced entities".format(count=stale.count()))
+            stale.delete()
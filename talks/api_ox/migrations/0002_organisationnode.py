@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_ox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganisationNode',
+            fields=[
+                ('id', models.CharField(max_length=100, serialize=False, primary_key=True)),
+                ('title', models.TextField(blank=True)),
+                ('lft', models.PositiveIntegerField(db_index=True)),
+                ('rgt', models.PositiveIntegerField()),
+                ('parent', models.ForeignKey(related_name='children', blank=True, to='api_ox.OrganisationNode', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -1,3 +1,125 @@
-from django.db import models
+import itertools
+import json
+import operator
+from collections import defaultdict
 
+from django.db import models, transaction
+from django.db.models import Q
 
+
+class OxPointManager(models.Manager):
+
+    def get_many(self, id_list):
+        """Get the mirrored entities
+        :param id_list: OxPoints ids
+        :return: dictionary of decoded entities by id (missing ids are omitted)
+        """
+        return {id: json.loads(data) for id, data in self.filter(id__in=list(id_list)).values_list('id', 'data')}
+
+    def update_many(self, entities):
+        """Create or replace mirrored entities
+        :param entities: dictionary of entities (as returned by the API) by id
+        """
+        with transaction.atomic():
+            self.filter(id__in=entities.keys()).delete()
+            self.bulk_create([OxPoint(id=id, data=json.dumps(entity)) for id, entity in entities.iteritems()])
+
+
+class OxPoint(models.Model):
+    """Local copy of an OxPoints entity (place or organisation) referenced
+    by the site, filled by the `sync_oxpoints` management command
+    """
+    id = models.CharField(max_length=100, primary_key=True)
+    data = models.TextField()
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = OxPointManager()
+
+    @property
+    def entity(self):
+        return json.loads(self.data)
+
+    def __unicode__(self):
+        return self.id
+
+
+class OrganisationNodeManager(models.Manager):
+
+    def descendant_ids(self, id_list):
+        """Get the ids of organisations and all their sub-organisations
+        :param id_list: OxPoints ids of organisations
+        :return: tuple (ValuesListQuerySet of ids usable as a subquery or None
+        if none of the organisations is in the tree, list of ids not in the tree)
+        """
+        bounds = list(self.filter(id__in=id_list).values_list('id', 'lft', 'rgt'))
+        found = set(id for id, lft, rgt in bounds)
+        missing = [id for id in id_list if id not in found]
+        if not found:
+            return None, missing
+        ranges = [Q(lft__gte=lft, lft__lte=rgt) for id, lft, rgt in bounds]
+        return self.filter(reduce(operator.or_, ranges)).values_list('id', flat=True), missing
+
+    def ancestor_ids(self, id):
+        """Get the ids of an organisation and all its parent organisations
+        :param id: OxPoints id of an organisation
+        :return: list of ids (empty if the organisation is not in the tree)
+        """
+        bounds = self.filter(id=id).values_list('lft', flat=True)
+        if not bounds:
+            return []
+        return list(self.filter(lft__lte=bounds[0], rgt__gte=bounds[0]).values_list('id', flat=True))
+
+    def rebuild(self, root_id, nodes):
+        """Replace the tree, numbering the nodes with a depth-first traversal
+        so that the descendants of a node have their `lft` between its `lft` and `rgt`
+        :param root_id: id of the root organisation
+        :param nodes: dictionary of tuples (parent id, title) by id, including the root
+        """
+        children = defaultdict(list)
+        for id, (parent_id, title) in nodes.iteritems():
+            if id != root_id:
+                # organisations whose parent is unknown are attached to the root
+                children[parent_id if parent_id in nodes else root_id].append(id)
+        created = []
+        visited = set()
+        counter = itertools.count()
+
+        def visit(id, parent_id, others=()):
+            visited.add(id)
+            node = OrganisationNode(id=id, title=nodes[id][1], parent_id=parent_id, lft=next(counter))
+            created.append(node)
+            for child in itertools.chain(sorted(children[id]), others):
+                if child not in visited:
+                    visit(child, id)
+            node.rgt = next(counter)
+
+        # `others` is evaluated lazily, once the root has been traversed, to
+        # attach the nodes that are not reachable from it (i.e. part of a cycle)
+        visit(root_id, None, others=(id for id in sorted(nodes) if id not in visited))
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(created)
+        return len(created)
+
+
+class OrganisationNode(models.Model):
+    """Organisation in the hierarchy of the University (nested set), filled by
+    the `sync_organisation_tree` management command.
+    An organisation with several parents is only placed under one of them.
+    """
+    id = models.CharField(max_length=100, primary_key=True)
+    title = models.TextField(blank=True)
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='children')
+    lft = models.PositiveIntegerField(db_index=True)
+    rgt = models.PositiveIntegerField()
+
+    objects = OrganisationNodeManager()
+
+    def get_descendants(self):
+        """
+        :return: QuerySet of the sub-organisations (excluding this one)
+        """
+        return OrganisationNode.objects.filter(lft__gt=self.lft, lft__lt=self.rgt)
+
+    def __unicode__(self):
+        return self.title or self.id
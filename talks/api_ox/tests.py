@@ -0,0 +1,163 @@
+from datetime import date, datetime
+from StringIO import StringIO
+
+import mock
+import pytz
+import requests
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from talks.events import factories
+
+from .api import ApiOxResource, OxfordDateResource, get_oxford_dates
+from .dates import OxfordDate, ordinal_suffix, HILARY
+from .models import OxPoint, OrganisationNode
+
+
+class TestOxfordDate(TestCase):
+
+    def test_full_term(self):
+        ox_date = OxfordDate.from_date(date(2015, 10, 23))
+        self.assertEquals(ox_date.formatted_nocal, "Friday 2nd Week, Michaelmas 2015")
+        self.assertEquals(ox_date.formatted, "Friday 23 October 2015 (2nd Week, Michaelmas 2015)")
+        comps = ox_date.components
+        self.assertEquals(comps['day_name'], "Friday")
+        self.assertEquals(comps['day_number'], 23)
+        self.assertEquals(comps['month_long'], "October")
+        self.assertEquals(comps['year'], 2015)
+        self.assertEquals(comps['week'], 2)
+        self.assertEquals(comps['ordinal'], "nd")
+        self.assertEquals(comps['term_long'], "Michaelmas")
+
+    def test_first_day_of_term(self):
+        ox_date = OxfordDate.from_date(date(2016, 1, 17))
+        self.assertEquals(ox_date.formatted_nocal, "Sunday 1st Week, Hilary 2016")
+
+    def test_before_term(self):
+        ox_date = OxfordDate.from_date(date(2016, 1, 16))
+        self.assertEquals(ox_date.formatted_nocal, "Saturday 0th Week, Hilary 2016")
+        ox_date = OxfordDate.from_date(date(2016, 1, 9))
+        self.assertEquals(ox_date.formatted_nocal, "Saturday -1st Week, Hilary 2016")
+
+    def test_after_term(self):
+        # Michaelmas 2015 ends on Saturday 5th December
+        ox_date = OxfordDate.from_date(date(2015, 12, 7))
+        self.assertEquals(ox_date.formatted_nocal, "Monday 9th Week, Michaelmas 2015")
+
+    def test_aware_datetime_is_localised(self):
+        # 23:30 UTC is already the next day in British Summer Time
+        ox_date = OxfordDate.from_date(datetime(2015, 10, 22, 23, 30, tzinfo=pytz.utc))
+        self.assertEquals(ox_date.components['day_number'], 23)
+
+    def test_outside_of_table(self):
+        ox_date = OxfordDate.from_date(date(2040, 10, 16))
+        self.assertEquals(ox_date.components['term_long'], "Michaelmas")
+        self.assertEquals(ox_date.components['week'], 2)
+
+    @override_settings(OXFORD_TERM_DATES=((HILARY, date(2016, 1, 10)),))
+    def test_term_dates_setting(self):
+        ox_date = OxfordDate.from_date(date(2016, 1, 16))
+        self.assertEquals(ox_date.formatted_nocal, "Saturday 1st Week, Hilary 2016")
+
+    def test_ordinal_suffix(self):
+        self.assertEquals([ordinal_suffix(n) for n in (-1, 0, 1, 2, 3, 4, 11, 12, 13, 21, 22)],
+                          ['st', 'th', 'st', 'nd', 'rd', 'th', 'th', 'th', 'th', 'st', 'nd'])
+
+
+class TestGetOxfordDates(TestCase):
+
+    def test_distinct_days(self):
+        dates = [datetime(2015, 10, 23, 9, 0, tzinfo=pytz.utc),
+                 datetime(2015, 10, 23, 17, 0, tzinfo=pytz.utc),
+                 date(2015, 10, 24),
+                 None]
+        result = get_oxford_dates(dates)
+        self.assertEquals(sorted(result.keys()), [date(2015, 10, 23), date(2015, 10, 24)])
+        self.assertEquals(result[date(2015, 10, 24)].components['day_name'], "Saturday")
+
+    @mock.patch('talks.core.http.get')
+    def test_timeout(self, requests_get):
+        requests_get.return_value.status_code = 200
+        OxfordDateResource.from_date(date(2015, 10, 23))
+        self.assertEquals(requests_get.call_args[1]['timeout'], 1)
+
+    def test_resources_do_not_share_state(self):
+        first, second = ApiOxResource('http://example.com/'), ApiOxResource('http://example.com/')
+        first._json['formatted'] = 'first'
+        self.assertEquals(second._json, {})
+
+
+class TestOxPointMirror(TestCase):
+
+    def test_update_many(self):
+        OxPoint.objects.update_many({'oxpoints:1': {'id': 'oxpoints:1', 'name': 'Old name'}})
+        OxPoint.objects.update_many({'oxpoints:1': {'id': 'oxpoints:1', 'name': 'New name'},
+                                     'oxpoints:2': {'id': 'oxpoints:2', 'name': 'Other'}})
+        self.assertEquals(OxPoint.objects.count(), 2)
+        self.assertEquals(OxPoint.objects.get(id='oxpoints:1').entity['name'], 'New name')
+
+    def test_get_many(self):
+        OxPoint.objects.update_many({'oxpoints:1': {'id': 'oxpoints:1', 'name': 'Building'}})
+        result = OxPoint.objects.get_many(['oxpoints:1', 'oxpoints:3'])
+        self.assertEquals(result, {'oxpoints:1': {'id': 'oxpoints:1', 'name': 'Building'}})
+
+
+class TestOrganisationTree(TestCase):
+
+    def setUp(self):
+        OrganisationNode.objects.rebuild('oxpoints:root', {
+            'oxpoints:root': (None, 'University'),
+            'oxpoints:mpls': ('oxpoints:root', 'MPLS'),
+            'oxpoints:chem': ('oxpoints:mpls', 'Chemistry'),
+            'oxpoints:biol': ('oxpoints:chem', 'Chemical Biology'),
+            'oxpoints:hums': ('oxpoints:root', 'Humanities'),
+            'oxpoints:orphan': ('oxpoints:unknown', 'Orphan'),
+        })
+
+    def test_descendants(self):
+        chem = OrganisationNode.objects.get(id='oxpoints:chem')
+        self.assertEquals([n.id for n in chem.get_descendants()], ['oxpoints:biol'])
+        root = OrganisationNode.objects.get(id='oxpoints:root')
+        self.assertEquals(root.get_descendants().count(), 5)
+        self.assertEquals(OrganisationNode.objects.get(id='oxpoints:orphan').parent_id, 'oxpoints:root')
+
+    def test_descendant_ids(self):
+        ids, missing = OrganisationNode.objects.descendant_ids(['oxpoints:mpls', 'oxpoints:hums', 'oxpoints:other'])
+        self.assertEquals(sorted(ids), ['oxpoints:biol', 'oxpoints:chem', 'oxpoints:hums', 'oxpoints:mpls'])
+        self.assertEquals(missing, ['oxpoints:other'])
+
+    def test_descendant_ids_not_in_tree(self):
+        ids, missing = OrganisationNode.objects.descendant_ids(['oxpoints:other'])
+        self.assertEquals(ids, None)
+        self.assertEquals(missing, ['oxpoints:other'])
+
+    def test_cycle_attached_to_root(self):
+        OrganisationNode.objects.rebuild('oxpoints:root', {
+            'oxpoints:root': (None, 'University'),
+            'oxpoints:a': ('oxpoints:b', 'A'),
+            'oxpoints:b': ('oxpoints:a', 'B'),
+        })
+        ids, missing = OrganisationNode.objects.descendant_ids(['oxpoints:root'])
+        self.assertEquals(sorted(ids), ['oxpoints:a', 'oxpoints:b', 'oxpoints:root'])
+
+
+class TestSyncOxPoints(TestCase):
+
+    def setUp(self):
+        factories.EventFactory.create(location='oxpoints:1', department_organiser='oxpoints:2')
+        factories.EventFactory.create(location='Somewhere else')
+
+    @mock.patch('talks.events.datasources.LOCATION_DATA_SOURCE.fetch_remote_objects')
+    def test_only_oxpoints_ids(self, fetch_remote_objects):
+        fetch_remote_objects.side_effect = lambda ids: {id: {'id': id} for id in ids}
+        call_command('sync_oxpoints', stdout=StringIO())
+        fetch_remote_objects.assert_called_once_with(['oxpoints:1', 'oxpoints:2'])
+
+    @mock.patch('talks.events.datasources.LOCATION_DATA_SOURCE.fetch_remote_objects')
+    def test_failed_chunk_skipped(self, fetch_remote_objects):
+        fetch_remote_objects.side_effect = [requests.ConnectionError('down'), {'oxpoints:2': {'id': 'oxpoints:2'}}]
+        stderr = StringIO()
+        call_command('sync_oxpoints', chunk_size=1, stdout=StringIO(), stderr=stderr)
+        self.assertIn('oxpoints:1', stderr.getvalue())
+        self.assertEquals(list(OxPoint.objects.values_list('id', flat=True)), ['oxpoints:2'])
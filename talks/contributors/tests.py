@@ -404,7 +404,7 @@ class TestCreateEventView(AuthTestCase):
         logging.info("events:%s", models.Event.objects.all())
         self.assertEquals(count, 1, msg="Event instance was not saved")
 
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('talks.core.http.get', autospec=True)
     def test_post_valid(self, requests_get):
         requests_get.return_value.json.return_value = {'_embedded': {'pois': []}}
         title = u'cjwnf887y98fw'
@@ -438,7 +438,7 @@ class TestCreateEventView(AuthTestCase):
         self.assertEquals(event.booking_type, data['event-booking_type'])
         self.assertEquals(event.audience, data['event-audience'])
 
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('talks.core.http.get', autospec=True)
     def test_post_valid_with_speakers(self, requests_get):
         requests_get.return_value.json.return_value = {'_embedded': {'pois': []}}
         title = u'cjwnf887y98fw'
@@ -471,7 +471,7 @@ class TestCreateEventView(AuthTestCase):
         self.assertEquals(set(speakers), set(event.speakers), "speakers were not assigned properly")
         self.assertRedirects(response, event.get_absolute_url())
 
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('talks.core.http.get', autospec=True)
     def test_post_valid_with_topics(self, requests_get):
         requests_get.return_value.json.return_value = {'_embedded': {'pois': [], 'concepts': []}},
         title = u'cjwnf887y98fw'
@@ -775,7 +775,7 @@ class TestEditEventView(AuthTestCase):
         self.assertContains(response, event.end)
         self.assertTemplateUsed(response, "contributors/event_form.html")
 
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('talks.core.http.get', autospec=True)
     def test_edit_event_post_happy(self, requests_get):
         requests_get.return_value.json.return_value = {'_embedded': {'pois': []}}
         event = factories.EventFactory.create()
@@ -10,7 +10,7 @@ from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import permission_required, login_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from requests.exceptions import Timeout
+from requests.exceptions import RequestException
 
 from talks.events.models import Event, EventGroup, Person, ROLES_SPEAKER
 from talks.contributors.forms import EventForm, EventGroupForm, PersonQuickAdd, PersonForm
@@ -47,7 +47,7 @@ def edit_event(request, event_slug):
                 event.save()
             try:
                 event_updated.send(event.__class__, instance=event)
-            except Timeout:
+            except RequestException:
                 messages.warning(request, "Timed out connecting to old talks. This update won't appear on the old talks website.")
             messages.success(request, "Talk was updated")
             return redirect(event.get_absolute_url())
@@ -87,7 +87,7 @@ def create_event(request, group_slug=None):
                 event.save()
             try:
                 event_updated.send(event.__class__, instance=event)
-            except Timeout:
+            except RequestException:
                 messages.warning(request, "Timed out connecting to Old Talks. This talk won't appear on the old site")
             messages.success(request, "New talk has been created")
             if 'another' in request.POST:
@@ -155,7 +155,7 @@ def edit_event_group(request, event_group_slug):
                 event_group.save()
             try:
                 eventgroup_updated.send(event_group.__class__, instance=event_group)
-            except Timeout:
+            except RequestException:
                 messages.warning(request, "Timed out connecting to Old Talks. The series will not be updated on the old site.")
             messages.success(request, "Series was updated")
             return redirect(event_group.get_absolute_url())
@@ -186,7 +186,7 @@ def create_event_group(request):
             showTimeoutWarning = False
             try:
                 eventgroup_updated.send(event_group.__class__, instance=event_group)
-            except Timeout:
+            except RequestException:
                 showTimeoutWarning = True
             if is_modal:
                 group_data = serializers.EventGroupSerializer(event_group).data
@@ -0,0 +1,242 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches as django_caches
+
+from talks.core import http
+
+
+class ResourceCache(object):
+    """Bounded cache for resources derived from external APIs (e.g. Oxford dates).
+
+    Entries expire after `ttl` seconds and the least recently used entries
+    are evicted once `max_size` is reached. If `backend` is the name of a
+    Django cache (see the CACHES setting) entries are stored there instead,
+    so that they are shared between processes.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600, backend=None, key_prefix='resource'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Create a cache configured by the RESOURCE_CACHE setting
+        """
+        conf = getattr(settings, 'RESOURCE_CACHE', {})
+        return cls(max_size=conf.get('MAX_SIZE', 1000),
+                   ttl=conf.get('TTL', 3600),
+                   backend=conf.get('BACKEND', None))
+
+    def get_or_set(self, key, func):
+        """Get the value of `key`, or call `func` to compute it
+        and store the result if it is missing or expired
+        """
+        found, value = self._get(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = func()
+        self._set(key, value)
+        return value
+
+    def clear(self):
+        """Remove the entries stored in this process (entries stored
+        in a shared backend expire on their own)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return: dictionary with the number of hits, misses and local entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _backend_key(self, key):
+        return '{prefix}:{key}'.format(prefix=self.key_prefix, key=hashlib.md5(repr(key)).hexdigest())
+
+    def _get(self, key):
+        if self.backend:
+            entry = django_caches[self.backend].get(self._backend_key(key))
+            if entry is None:
+                return False, None
+            return True, entry[0]
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.time():
+                return False, None
+            # re-insert as the most recently used
+            self._entries[key] = entry
+            return True, value
+
+    def _set(self, key, value):
+        if self.backend:
+            # wrap the value so that a cached None is not considered a miss
+            django_caches[self.backend].set(self._backend_key(key), (value,), self.ttl)
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_resource_cache = None
+
+
+def get_resource_cache():
+    """Get the cache shared by all the models of this process
+    """
+    global _resource_cache
+    if _resource_cache is None:
+        _resource_cache = ResourceCache.from_settings()
+    return _resource_cache
+
+
+class _Call(object):
+    """Execution of a function shared by concurrent callers
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """De-duplicate concurrent calls doing the same work (e.g. fetching the
+    same objects from an external API after a cache miss): only the first
+    caller for a key runs the function, the others wait for its result.
+
+    If `backend` is the name of a Django cache shared between processes,
+    a lock stored in it also makes the callers of other processes wait, until
+    the first caller publishes its result there (or `recheck` finds it).
+
+    Waiting counts against the external call budget of the current thread
+    (see `talks.core.http`): a caller whose budget runs out stops waiting
+    and gets `UpstreamUnavailable`.
+    """
+
+    def __init__(self, backend=None, lock_timeout=10, poll_interval=0.05, key_prefix='single-flight'):
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Create an instance configured by the SINGLE_FLIGHT setting
+        """
+        conf = getattr(settings, 'SINGLE_FLIGHT', {})
+        return cls(backend=conf.get('BACKEND', None),
+                   lock_timeout=conf.get('LOCK_TIMEOUT', 10))
+
+    def do(self, key, func, recheck=None):
+        """Call `func`, unless a call with the same key is in progress
+        in which case its result is returned (or its exception raised)
+        :param key: key identifying the work done by `func`
+        :param func: callable without arguments
+        :param recheck: callable returning the result stored by a call in
+        another process, or None if it is not available (only used with a backend)
+        :return: result of `func`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            started = time.time()
+            finished = call.done.wait(http.get_remaining_budget())
+            http.spend_budget(time.time() - started)
+            if not finished:
+                raise http.UpstreamUnavailable("External call budget spent waiting for {key!r}".format(key=key))
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._do_shared(key, func, recheck)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, func, recheck):
+        if not self.backend or recheck is None:
+            return func()
+        cache = django_caches[self.backend]
+        lock_key = self._backend_key(key)
+        result_key = lock_key + ':result'
+        remaining = http.get_remaining_budget()
+        timeout = self.lock_timeout if remaining is None else min(self.lock_timeout, remaining)
+        started = time.time()
+        waited = False
+        while not cache.add(lock_key, 1, self.lock_timeout):
+            # another process is running the function
+            if time.time() - started >= timeout:
+                http.spend_budget(time.time() - started)
+                if timeout < self.lock_timeout:
+                    raise http.UpstreamUnavailable("External call budget spent waiting for {key!r}".format(key=key))
+                return func()
+            time.sleep(self.poll_interval)
+            waited = True
+            result = self._get_shared_result(cache, result_key, recheck)
+            if result is not None:
+                http.spend_budget(time.time() - started)
+                return result
+        http.spend_budget(time.time() - started)
+        try:
+            if waited:
+                # the other process may have finished just before the lock was taken
+                result = self._get_shared_result(cache, result_key, recheck)
+                if result is not None:
+                    return result
+            result = func()
+            # the result tells the callers waiting in other processes which objects
+            # were not found, `recheck` would not know they are done
+            cache.set(result_key, (result,), self.lock_timeout)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    @staticmethod
+    def _get_shared_result(cache, result_key, recheck):
+        published = cache.get(result_key)
+        if published is not None:
+            return published[0]
+        return recheck()
+
+    def _backend_key(self, key):
+        return '{prefix}:{key}'.format(prefix=self.key_prefix, key=hashlib.md5(repr(key)).hexdigest())
+
+
+_single_flight = None
+
+
+def get_single_flight():
+    """Get the instance shared by all the data sources of this process
+    """
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight.from_settings()
+    return _single_flight
@@ -15,7 +15,9 @@ def healthcheck(request):
     # dictionary containing functions to be called
     checks = {'DB': _test_db_connection,
               'Topics': _test_topics_connection,
-              'Events search': _test_events_search}
+              'Events search': _test_events_search,
+              'Resource cache': _resource_cache_stats,
+              'Search index queue': _search_index_queue_stats}
     response = HttpResponse()
     overall_ok = True
     for name, service in checks.iteritems():
@@ -60,12 +62,12 @@ def _test_topics_connection():
     """Do an HTTP GET request to the configured topics service
     :return: True/False, message
     """
-    import requests
+    from talks.core import http
     if not settings.TOPICS_URL:
         return False, "TOPICS_URL is not configured"
     try:
-        response = requests.get('{server}search?q=a'.format(server=settings.TOPICS_URL),
-                                timeout=2)
+        response = http.get('{server}search?q=a'.format(server=settings.TOPICS_URL),
+                            timeout=2)
         response.raise_for_status()
         return response.ok, "OK"
     except Exception as e:
@@ -83,3 +85,24 @@ def _test_events_search():
         return True, "OK"
     except Exception as e:
         return False, e.message
+
+
+def _resource_cache_stats():
+    """Report the hits and misses of the resource cache of this process
+    :return: True, message
+    """
+    from talks.core.caching import get_resource_cache
+    stats = get_resource_cache().stats()
+    return True, "hits={hits} misses={misses} size={size}".format(**stats)
+
+
+def _search_index_queue_stats():
+    """Report the number of events waiting to be indexed, fails if the
+    oldest has been waiting for too long (i.e. the queue is not processed)
+    :return: True/False, message
+    """
+    from talks.events_search.models import IndexQueueEntry
+    from talks.events_search.conf import get_index_queue_settings
+    stats = IndexQueueEntry.objects.stats()
+    ok = stats['lag'] <= get_index_queue_settings()['MAX_LAG']
+    return ok, "depth={depth} lag={lag:.0f}s".format(**stats)
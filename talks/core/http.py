@@ -0,0 +1,334 @@
+"""HTTP client for the external services (OxPoints, topics, dates, old talks).
+
+Requests to the same host share a `requests.Session`, so that connections are
+kept alive and reused within and across requests instead of doing a new TCP
+and TLS handshake for each call. Pool sizes and timeouts are configured by the
+EXTERNAL_HTTP setting, timeouts can be set per host.
+
+A slow or failing host does not take the site down with it:
+
+- a circuit breaker per host stops sending it requests for a while once
+  too many of its recent calls failed or were slow;
+- the time a request of the site spends waiting on external calls is limited
+  (see `talks.core.middleware.ExternalCallBudgetMiddleware`), further
+  calls are not sent.
+
+In both cases `UpstreamUnavailable` is raised without sending the request,
+callers handle it like any `requests.RequestException` (e.g. by rendering
+the page without the external data).
+
+Independent calls can be sent concurrently with `map_concurrently`, the
+threads share the budget of the calling thread.
+"""
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+_sessions = {}
+_breakers = {}
+_lock = threading.Lock()
+_budget = threading.local()
+_pool = None
+_pool_pid = None
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """The request was not sent, because the circuit breaker
+    of the host is open or the external call budget is spent
+    """
+
+
+def get_http_settings():
+    """Settings of the external HTTP client (see EXTERNAL_HTTP), with defaults
+    """
+    conf = getattr(settings, 'EXTERNAL_HTTP', {})
+    return {'POOL_MAXSIZE': conf.get('POOL_MAXSIZE', 10),
+            'MAX_RETRIES': conf.get('MAX_RETRIES', 0),
+            'TIMEOUT': conf.get('TIMEOUT', 5),
+            'HOSTS': conf.get('HOSTS', {}),
+            'CIRCUIT_BREAKER': conf.get('CIRCUIT_BREAKER', {}),
+            'REQUEST_BUDGET': conf.get('REQUEST_BUDGET', None),
+            'FAN_OUT_WORKERS': conf.get('FAN_OUT_WORKERS', 4)}
+
+
+def _now():
+    """Clock of the circuit breakers and of the external call budgets
+    :return: seconds since the epoch
+    """
+    return time.time()
+
+
+def _get_host(url):
+    parsed = urlparse(url)
+    return parsed.scheme, parsed.netloc
+
+
+def get_session(url):
+    """Get the session used for the host of a URL
+    :param url: URL requested
+    :return: requests.Session
+    """
+    host = _get_host(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                conf = get_http_settings()
+                session = requests.Session()
+                # a single host is requested through this session
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=conf['POOL_MAXSIZE'],
+                                      max_retries=conf['MAX_RETRIES'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sessions[host] = session
+    return session
+
+
+class CircuitBreaker(object):
+    """Track the outcome of the last calls to a host. Once enough of them
+    failed (errors, 5xx responses or calls slower than `slow_call` seconds),
+    the circuit opens: calls are refused for `open_seconds`, then a single
+    trial call is let through, which closes the circuit if it succeeds.
+    Calls which were already running when the circuit opened do not decide
+    the outcome of the trial: `allow` returns a token identifying each call.
+    """
+
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call=2.0, open_seconds=30):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        # token of the trial call, while the circuit is half-open
+        self._trial = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, netloc=None):
+        """Create a circuit breaker configured by EXTERNAL_HTTP['CIRCUIT_BREAKER'],
+        which can be overridden per host in EXTERNAL_HTTP['HOSTS']
+        :param netloc: host
+        """
+        http_settings = get_http_settings()
+        conf = dict(http_settings['CIRCUIT_BREAKER'])
+        conf.update(http_settings['HOSTS'].get(netloc, {}).get('CIRCUIT_BREAKER', {}))
+        return cls(window=conf.get('WINDOW', 20),
+                   min_calls=conf.get('MIN_CALLS', 5),
+                   failure_rate=conf.get('FAILURE_RATE', 0.5),
+                   slow_call=conf.get('SLOW_CALL', 2.0),
+                   open_seconds=conf.get('OPEN_SECONDS', 30))
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if _now() - self._opened_at < self.open_seconds:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """
+        :return: token of the call to pass to `record`, or None if the call is refused
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return object()
+            if state == 'open' or self._trial is not None:
+                return None
+            self._trial = object()
+            return self._trial
+
+    def record(self, success, duration, token=None):
+        """Record the outcome of a call
+        :param success: True/False, or None if the call does not tell anything about the host
+        :param duration: seconds, or None if the call is not expected to be fast
+        (e.g. updates, whose slowness does not count as a failure)
+        :param token: token returned by `allow` for the call
+        """
+        with self._lock:
+            failed = not success or (duration is not None and duration > self.slow_call)
+            if self._opened_at is not None:
+                # only the trial call closes or reopens the circuit
+                if token is None or token is not self._trial:
+                    return
+                if success is not None:
+                    if failed:
+                        self._opened_at = _now()
+                    else:
+                        self._opened_at = None
+                        self._outcomes.clear()
+                self._trial = None
+                return
+            if success is None:
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= self.failure_rate * len(self._outcomes):
+                self._opened_at = _now()
+
+
+def get_circuit_breaker(url):
+    """Get the circuit breaker of the host of a URL
+    :param url: URL requested
+    :return: CircuitBreaker
+    """
+    host = _get_host(url)
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker.from_settings(host[1])
+    return breaker
+
+
+def start_budget(milliseconds):
+    """Limit the time the current thread spends waiting on external calls
+    :param milliseconds: budget, or None for no limit
+    """
+    _budget.remaining = milliseconds / 1000.0 if milliseconds is not None else None
+
+
+def end_budget():
+    _budget.remaining = None
+
+
+def get_remaining_budget():
+    """
+    :return: seconds left to the current thread for external calls, or None if unlimited
+    """
+    return getattr(_budget, 'remaining', None)
+
+
+def spend_budget(seconds):
+    """Deduct time spent waiting on external calls (e.g. in other threads)
+    from the budget of the current thread
+    :param seconds: time spent
+    """
+    if get_remaining_budget() is not None:
+        _budget.remaining -= seconds
+
+
+def get_timeout(url):
+    """
+    :param url: URL requested
+    :return: timeout (in seconds) configured for the host of the URL
+    """
+    conf = get_http_settings()
+    _, netloc = _get_host(url)
+    return conf['HOSTS'].get(netloc, {}).get('TIMEOUT', conf['TIMEOUT'])
+
+
+def close_sessions():
+    """Close the connections of all the sessions (e.g. before forking),
+    and forget the state of the circuit breakers
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _breakers.clear()
+
+
+def request(method, url, timeout=None, budgeted=True, **kwargs):
+    """Send a request through the session of the host
+    :param method: HTTP method
+    :param url: URL requested
+    :param timeout: timeout in seconds (defaults to the timeout of the host)
+    :param budgeted: if False, the request is sent even if the external call
+    budget of the current request is spent, and its duration does not count
+    towards the slow calls of the circuit breaker (e.g. for updates)
+    :param kwargs: other arguments of `requests.request`
+    :return: requests.Response
+    :raise UpstreamUnavailable: if the request was not sent
+    """
+    if timeout is None:
+        timeout = get_timeout(url)
+    remaining = get_remaining_budget() if budgeted else None
+    capped = False
+    if remaining is not None:
+        if remaining <= 0:
+            raise UpstreamUnavailable("External call budget spent, not requesting {url}".format(url=url))
+        if remaining < timeout:
+            timeout, capped = remaining, True
+    breaker = get_circuit_breaker(url)
+    token = breaker.allow()
+    if token is None:
+        raise UpstreamUnavailable("Circuit open, not requesting {url}".format(url=url))
+    started = _now()
+    try:
+        response = get_session(url).request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        duration = _now() - started
+        spend_budget(duration)
+        # a timeout shortened by the budget does not mean the host is slow
+        breaker.record(None if capped and isinstance(e, requests.Timeout) else False,
+                       duration if budgeted else None, token)
+        raise
+    except Exception:
+        # not an outcome of the host, but a trial call must not hold the circuit
+        breaker.record(None, None, token)
+        raise
+    duration = _now() - started
+    spend_budget(duration)
+    breaker.record(response.status_code < 500, duration if budgeted else None, token)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _lock:
+        # the threads of the pool do not survive a fork
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(get_http_settings()['FAN_OUT_WORKERS'])
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def map_concurrently(func, items):
+    """Call a function doing external calls on each item, in a pool of threads
+    (see FAN_OUT_WORKERS). Each call can use the external call budget left to the
+    current thread, less the time it waited for a thread of the pool (which is
+    shared by all the requests of the process): once nothing is left, its external
+    calls are refused. The current thread is charged with the time spent waiting
+    for all of them. The function must not use the database (connections are per thread).
+    :param func: function of one argument
+    :param items: list of arguments
+    :return: list of results, in the order of `items`
+    """
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    remaining = get_remaining_budget()
+    started = _now()
+
+    def call(item):
+        if remaining is not None:
+            queued = _now() - started
+            start_budget(max(remaining - queued, 0) * 1000)
+        try:
+            return func(item)
+        finally:
+            end_budget()
+
+    try:
+        return _get_pool().map(call, items)
+    finally:
+        spend_budget(_now() - started)
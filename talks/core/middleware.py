@@ -0,0 +1,16 @@
+from talks.core.http import end_budget, get_http_settings, start_budget
+
+
+class ExternalCallBudgetMiddleware(object):
+    """Limit the time each request spends waiting on external services
+    to EXTERNAL_HTTP['REQUEST_BUDGET'] milliseconds (see `talks.core.http`)
+    """
+
+    def process_request(self, request):
+        start_budget(get_http_settings()['REQUEST_BUDGET'])
+        # Have to return None so other middlewares are called
+        return None
+
+    def process_response(self, request, response):
+        end_budget()
+        return response
@@ -0,0 +1,134 @@
+"""Keyset (cursor) pagination of events on (start, id).
+
+Unlike `django.core.paginator.Paginator` this does not count the results
+and does not skip rows with OFFSET: each page is selected by comparing
+(start, id) with the first or last event of the adjacent page, which is
+encoded in an opaque cursor.
+"""
+import base64
+import json
+
+from dateutil import parser
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# maximum number of events in a page (larger counts are reduced to it)
+MAX_COUNT = 500
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, event):
+    """Create a cursor for the events after (or before) an event
+    :param direction: NEXT or PREVIOUS
+    :param event: Event
+    :return: string
+    """
+    return base64.urlsafe_b64encode(json.dumps([direction, event.start.isoformat(), event.id]))
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: string created by `encode_cursor`
+    :return: tuple (direction, start, id)
+    :raise InvalidCursor: if the cursor is not valid
+    """
+    try:
+        direction, start, id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        return direction, parser.parse(start), int(id)
+    except (TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def _after(start, id):
+    return Q(start__gt=start) | Q(start=start, id__gt=id)
+
+
+def _before(start, id):
+    return Q(start__lt=start) | Q(start=start, id__lt=id)
+
+
+class KeysetPage(object):
+    """Page of events, with the events just before and after it
+    (used to find if a page starts or ends in the middle of a day)
+    """
+
+    def __init__(self, object_list, previous_item, next_item):
+        self.object_list = object_list
+        self.previous_item = previous_item
+        self.next_item = next_item
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_item is not None
+
+    def has_previous(self):
+        return self.previous_item is not None
+
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(NEXT, self.object_list[-1])
+
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(PREVIOUS, self.object_list[0])
+
+
+def parse_count(value, default=20):
+    """Get the number of events in a page from a query parameter
+    :param value: value of the parameter, None if it is missing
+    :param default: number of events if the parameter is missing
+    :return: number between 1 and MAX_COUNT
+    :raise ValueError: if the value is not a number or is less than 1
+    """
+    count = int(value) if value is not None else default
+    if count < 1:
+        raise ValueError(value)
+    return min(count, MAX_COUNT)
+
+
+def get_keyset_page(events, cursor=None, count=20):
+    """Get a page of events ordered by start
+    :param events: QuerySet of Event
+    :param cursor: cursor of the page (from `KeysetPage.next_cursor` or `previous_cursor`), None for the first page
+    :param count: number of events in a page
+    :return: KeysetPage
+    :raise InvalidCursor: if the cursor is not valid
+    """
+    forward = events.order_by('start', 'id')
+    backward = events.order_by('-start', '-id')
+    if not cursor:
+        rows = list(forward[:count + 1])
+        return KeysetPage(rows[:count], None, rows[count] if len(rows) > count else None)
+
+    direction, start, id = decode_cursor(cursor)
+    if direction == NEXT:
+        rows = list(forward.filter(_after(start, id))[:count + 1])
+        object_list = rows[:count]
+        next_item = rows[count] if len(rows) > count else None
+        if object_list:
+            first = object_list[0]
+            previous_item = backward.filter(_before(first.start, first.id)).first()
+        else:
+            previous_item = None
+    else:
+        rows = list(backward.filter(_before(start, id))[:count + 1])
+        object_list = list(reversed(rows[:count]))
+        previous_item = rows[count] if len(rows) > count else None
+        if object_list:
+            last = object_list[-1]
+            next_item = forward.filter(_after(last.start, last.id)).first()
+        else:
+            next_item = None
+    return KeysetPage(object_list, previous_item, next_item)
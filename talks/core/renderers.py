@@ -11,16 +11,18 @@ class ICalRenderer(renderers.BaseRenderer):
     format = 'ics'
 
     def render(self, data, media_type=None, renderer_context=None):
-        cal = Calendar()
-        cal.add('prodid', 'talks.ox.ac.uk')
-        cal.add('version', '2.0')
-
         if not isinstance(data, list):
             data = [data]
 
-        for e in data:
-            cal.add_component(self._event_to_ics(e))
-        return cal.to_ical()
+        return "".join(stream_ical(self.event_to_vevent(e) for e in data))
+
+    @classmethod
+    def event_to_vevent(cls, e):
+        """Render a single event
+        :param e: dictionary of event data (as serialized by `EventSerializer`)
+        :return: VEVENT block (string)
+        """
+        return cls._event_to_ics(e).to_ical()
 
     @staticmethod
     def _event_to_ics(e):
@@ -28,7 +30,6 @@ class ICalRenderer(renderers.BaseRenderer):
         event.add('summary', e['title_display'])
 
         if 'description' in e:
-            print 'got a description'
             desc_status = ""
             if 'status' in e:
                 if e['status'] == 'preparation':
@@ -64,6 +65,27 @@ class ICalRenderer(renderers.BaseRenderer):
         return event
 
 
+def _calendar_header():
+    cal = Calendar()
+    cal.add('prodid', 'talks.ox.ac.uk')
+    cal.add('version', '2.0')
+    footer = "END:VCALENDAR\r\n"
+    return cal.to_ical()[:-len(footer)], footer
+
+ICAL_HEADER, ICAL_FOOTER = _calendar_header()
+
+
+def stream_ical(vevents):
+    """Produce a calendar piece by piece
+    :param vevents: iterable of VEVENT blocks (see `ICalRenderer.event_to_vevent`)
+    :return: generator of strings
+    """
+    yield ICAL_HEADER
+    for vevent in vevents:
+        yield vevent
+    yield ICAL_FOOTER
+
+
 def get_speaker_name(speaker):
     name = speaker['name']
     if(speaker['bio']):
@@ -72,7 +94,9 @@ def get_speaker_name(speaker):
 
 def dt_string_to_object(string):
     """Transforms a string date into a datetime object
-    :param string: string representing a date/time
+    :param string: string representing a date/time (or a datetime object, returned as is)
     :return: python datetime object
     """
+    if isinstance(string, datetime):
+        return string
     return parser.parse(string)
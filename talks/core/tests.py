@@ -1,11 +1,23 @@
+import threading
+import time
 from datetime import date, datetime, timedelta
 
+import mock
+import pytz
+import requests
+from django.core.cache import caches
 from django.test import TestCase
+from django.test.utils import override_settings
 from icalendar import Calendar
 from rest_framework.exceptions import ParseError
 
-from .renderers import ICalRenderer
-from .utils import parse_date
+from talks.events import factories
+from talks.events.models import Event
+from . import http
+from .caching import ResourceCache, SingleFlight
+from .pagination import get_keyset_page, parse_count, InvalidCursor
+from .renderers import ICalRenderer, stream_ical
+from .utils import parse_date, date_range
 
 
 class ICalSerializerTest(TestCase):
@@ -40,6 +52,15 @@ class ICalSerializerTest(TestCase):
         self.assertEquals(cal.subcomponents[0]['DESCRIPTION'], 'Description')
         self.assertEquals(cal.subcomponents[0]['URL'], 'http://oxtalks.com/test/1')
 
+    def test_stream(self):
+        events = [{'title_display': 'Talk 1', 'start': datetime(2015, 10, 23, 12, 0)},
+                  {'title_display': 'Talk 2', 'start': '2015-10-23T13:00:00'}]
+        streamed = "".join(stream_ical(ICalRenderer.event_to_vevent(e) for e in events))
+        self.assertEquals(streamed, ICalRenderer().render(events))
+        cal = Calendar.from_ical(streamed)
+        self.assertEquals(len(cal.subcomponents), 2)
+        self.assertEquals(cal.subcomponents[1]['DTSTART'].dt, datetime(2015, 10, 23, 13, 0))
+
 
 class UtilsParseDate(TestCase):
 
@@ -57,3 +78,335 @@ class UtilsParseDate(TestCase):
     def test_custom_date(self):
         result = parse_date("13/02/15")
         self.assertEquals(result, datetime(2015, 2, 13, 0, 0))
+
+
+class UtilsDateRange(TestCase):
+
+    def test_month(self):
+        start, end = date_range('2015', '12')
+        self.assertEquals(start, datetime(2015, 12, 1, tzinfo=pytz.utc))
+        self.assertEquals(end, datetime(2016, 1, 1, tzinfo=pytz.utc))
+
+    def test_day_in_summer_time(self):
+        start, end = date_range(2015, 10, 23)
+        self.assertEquals(start, datetime(2015, 10, 22, 23, 0, tzinfo=pytz.utc))
+        self.assertEquals(end - start, timedelta(days=1))
+
+    def test_year(self):
+        start, end = date_range(2016)
+        self.assertEquals((start.year, start.month, start.day), (2016, 1, 1))
+        self.assertEquals((end.year, end.month, end.day), (2017, 1, 1))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, date_range, 2015, 2, 30)
+
+
+class ResourceCacheTest(TestCase):
+
+    def test_hit_and_miss(self):
+        cache = ResourceCache(max_size=10, ttl=60)
+        func = mock.Mock(return_value='value')
+        self.assertEquals(cache.get_or_set('key', func), 'value')
+        self.assertEquals(cache.get_or_set('key', func), 'value')
+        self.assertEquals(func.call_count, 1)
+        self.assertEquals(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_least_recently_used_evicted(self):
+        cache = ResourceCache(max_size=2, ttl=60)
+        cache.get_or_set('a', lambda: 1)
+        cache.get_or_set('b', lambda: 2)
+        cache.get_or_set('a', lambda: 1)
+        cache.get_or_set('c', lambda: 3)
+        self.assertEquals(cache.get_or_set('a', lambda: 'recomputed'), 1)
+        self.assertEquals(cache.get_or_set('b', lambda: 'recomputed'), 'recomputed')
+
+    @mock.patch('talks.core.caching.time.time')
+    def test_expired(self, time):
+        cache = ResourceCache(max_size=10, ttl=60)
+        time.return_value = 1000
+        cache.get_or_set('key', lambda: 'old')
+        time.return_value = 1061
+        self.assertEquals(cache.get_or_set('key', lambda: 'new'), 'new')
+
+    def test_none_is_cached(self):
+        cache = ResourceCache(max_size=10, ttl=60)
+        func = mock.Mock(return_value=None)
+        cache.get_or_set('key', func)
+        cache.get_or_set('key', func)
+        self.assertEquals(func.call_count, 1)
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        # two events at each start time, so that pages are split between equal starts
+        start = datetime(2015, 10, 23, 9, 0)
+        self.events = []
+        for hour in range(5):
+            for _ in range(2):
+                self.events.append(factories.EventFactory.create(start=start + timedelta(hours=hour),
+                                                                 end=start + timedelta(hours=hour + 1)))
+
+    def test_first_page(self):
+        page = get_keyset_page(Event.objects.all(), None, 4)
+        self.assertEquals(list(page), self.events[:4])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertEquals(page.next_item, self.events[4])
+
+    def test_walk_forward_and_back(self):
+        events = Event.objects.all()
+        pages = [get_keyset_page(events, None, 3)]
+        while pages[-1].has_next():
+            pages.append(get_keyset_page(events, pages[-1].next_cursor(), 3))
+        self.assertEquals([e for page in pages for e in page], self.events)
+        self.assertEquals(len(pages[-1]), 1)
+
+        previous = get_keyset_page(events, pages[-1].previous_cursor(), 3)
+        self.assertEquals(list(previous), self.events[6:9])
+        self.assertEquals(previous.previous_item, self.events[5])
+        self.assertEquals(previous.next_item, self.events[9])
+        first = get_keyset_page(events, pages[1].previous_cursor(), 3)
+        self.assertEquals(list(first), self.events[:3])
+        self.assertFalse(first.has_previous())
+
+    def test_queries(self):
+        events = Event.objects.all()
+        cursor = get_keyset_page(events, None, 3).next_cursor()
+        # the page (with the next event) and the event before it
+        with self.assertNumQueries(2):
+            get_keyset_page(events, cursor, 3)
+
+    def test_invalid_cursor(self):
+        for cursor in ('foo', 'WyJ4IiwgMV0='):
+            self.assertRaises(InvalidCursor, get_keyset_page, Event.objects.all(), cursor, 3)
+
+    def test_parse_count(self):
+        self.assertEquals(parse_count(None), 20)
+        self.assertEquals(parse_count('5'), 5)
+        self.assertEquals(parse_count('100000'), 500)
+        for value in ('', 'foo', '0', '-2'):
+            self.assertRaises(ValueError, parse_count, value)
+
+
+@override_settings(EXTERNAL_HTTP={'TIMEOUT': 7, 'HOSTS': {'slow.example.org': {'TIMEOUT': 30}}})
+class ExternalHttpTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(http.close_sessions)
+
+    def test_session_per_host(self):
+        session = http.get_session('https://api.example.org/dates/2015-01-01')
+        self.assertIs(session, http.get_session('https://api.example.org/places/search'))
+        self.assertIsNot(session, http.get_session('https://slow.example.org/topics/'))
+
+    def test_timeouts(self):
+        self.assertEquals(http.get_timeout('https://api.example.org/dates/'), 7)
+        self.assertEquals(http.get_timeout('https://slow.example.org/topics/'), 30)
+
+    def test_request(self):
+        with mock.patch('requests.Session.request') as session_request:
+            http.get('https://slow.example.org/topics/search?q=a')
+            http.post('https://api.example.org/update', 'data', timeout=60)
+        session_request.assert_any_call('GET', 'https://slow.example.org/topics/search?q=a', timeout=30)
+        session_request.assert_any_call('POST', 'https://api.example.org/update', data='data', timeout=60)
+
+
+class SingleFlightTest(TestCase):
+
+    def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(single_flight.do('key', fetch)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(single_flight.do('key', fetch)))
+                     for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # let the followers reach the call in progress
+        time.sleep(0.2)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(results, ['result'] * 4)
+
+    def test_follower_wait_limited_by_budget(self):
+        self.addCleanup(http.end_budget)
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            started.set()
+            release.wait(5)
+
+        leader = threading.Thread(target=lambda: single_flight.do('key', fetch))
+        leader.start()
+        started.wait(5)
+        http.start_budget(50)
+        self.assertRaises(http.UpstreamUnavailable, single_flight.do, 'key', fetch)
+        release.set()
+        leader.join(5)
+
+    def test_error_raised_and_not_kept(self):
+        single_flight = SingleFlight()
+        self.assertRaises(IOError, single_flight.do, 'key', mock.Mock(side_effect=IOError))
+        self.assertEquals(single_flight.do('key', lambda: 'result'), 'result')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'single-flight'}})
+    def test_other_process_fetching(self):
+        single_flight = SingleFlight(backend='default', poll_interval=0.01)
+        # lock taken by another process
+        caches['default'].add(single_flight._backend_key('key'), 1)
+        fetch = mock.Mock()
+        recheck = mock.Mock(side_effect=[None, 'result'])
+        self.assertEquals(single_flight.do('key', fetch, recheck), 'result')
+        self.assertFalse(fetch.called)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'single-flight'}})
+    def test_result_published_to_other_processes(self):
+        caches['default'].clear()
+        single_flight = SingleFlight(backend='default', poll_interval=0.01)
+        # some of the objects were not found
+        self.assertEquals(single_flight.do('key', lambda: {'a': 1}, mock.Mock()), {'a': 1})
+        caches['default'].add(single_flight._backend_key('key'), 1)
+        recheck = mock.Mock(return_value=None)
+        self.assertEquals(single_flight.do('key', mock.Mock(), recheck), {'a': 1})
+        self.assertFalse(recheck.called)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'single-flight'}})
+    def test_wait_limited_by_budget(self):
+        self.addCleanup(http.end_budget)
+        single_flight = SingleFlight(backend='default', poll_interval=0.01)
+        caches['default'].add(single_flight._backend_key('other'), 1)
+        http.start_budget(50)
+        fetch = mock.Mock()
+        self.assertRaises(http.UpstreamUnavailable, single_flight.do, 'other', fetch, mock.Mock(return_value=None))
+        self.assertFalse(fetch.called)
+        self.assertTrue(http.get_remaining_budget() <= 0)
+
+
+class CircuitBreakerTest(TestCase):
+
+    def test_opens_on_failures(self):
+        breaker = http.CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, slow_call=1, open_seconds=30)
+        for success, duration in [(True, 0.1), (False, 0.1), (True, 0.1), (True, 5)]:
+            token = breaker.allow()
+            self.assertIsNotNone(token)
+            breaker.record(success, duration, token)
+        self.assertEquals(breaker.state, 'open')
+        self.assertIsNone(breaker.allow())
+
+    def test_trial_call(self):
+        breaker = http.CircuitBreaker(window=1, min_calls=1, open_seconds=30)
+        earlier = breaker.allow()
+        breaker.record(False, 0.1, breaker.allow())
+        with mock.patch('talks.core.http._now', return_value=time.time() + 60):
+            trial = breaker.allow()
+            self.assertIsNotNone(trial)
+            # a single trial at a time
+            self.assertIsNone(breaker.allow())
+            # a call started before the circuit opened does not close it
+            breaker.record(True, 0.1, earlier)
+            self.assertEquals(breaker.state, 'half-open')
+            self.assertIsNone(breaker.allow())
+            breaker.record(True, 0.1, trial)
+        self.assertEquals(breaker.state, 'closed')
+
+
+class FakeClock(object):
+    """Replaces `http._now`: the current thread reads `time`, the other threads
+    (e.g. of `http.map_concurrently`) read `other_threads_time`
+    """
+
+    def __init__(self):
+        self.time = 0
+        self.other_threads_time = 0
+        self.thread = threading.current_thread()
+
+    def __call__(self):
+        return self.time if threading.current_thread() is self.thread else self.other_threads_time
+
+    def advance(self, seconds):
+        self.time += seconds
+        return mock.Mock(status_code=200)
+
+
+@override_settings(EXTERNAL_HTTP={'TIMEOUT': 5, 'CIRCUIT_BREAKER': {'WINDOW': 2, 'MIN_CALLS': 2}})
+class ExternalCallLimitsTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(http.close_sessions)
+        self.addCleanup(http.end_budget)
+        self.clock = FakeClock()
+        patcher = mock.patch('talks.core.http._now', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_budget(self):
+        http.start_budget(1000)
+        with mock.patch('requests.Session.request') as session_request:
+            session_request.side_effect = lambda *args, **kwargs: self.clock.advance(0.4)
+            http.get('https://api.example.org/a')
+            session_request.assert_called_once_with('GET', 'https://api.example.org/a', timeout=1.0)
+            session_request.side_effect = lambda *args, **kwargs: self.clock.advance(0.6)
+            http.get('https://api.example.org/b')
+            self.assertRaises(http.UpstreamUnavailable, http.get, 'https://api.example.org/c')
+            # updates are not limited by the budget
+            http.post('https://api.example.org/d', budgeted=False)
+        self.assertEquals(session_request.call_count, 3)
+
+    def test_slow_updates(self):
+        with mock.patch('requests.Session.request') as session_request:
+            session_request.side_effect = lambda *args, **kwargs: self.clock.advance(30)
+            for _ in range(3):
+                http.post('https://old.example.org/update', budgeted=False)
+        self.assertEquals(session_request.call_count, 3)
+        self.assertEquals(http.get_circuit_breaker('https://old.example.org/').state, 'closed')
+
+    def test_fail_fast(self):
+        with mock.patch('requests.Session.request', side_effect=requests.ConnectionError) as session_request:
+            for _ in range(2):
+                self.assertRaises(requests.ConnectionError, http.get, 'https://down.example.org/a')
+            self.assertRaises(http.UpstreamUnavailable, http.get, 'https://down.example.org/a')
+        self.assertEquals(session_request.call_count, 2)
+
+    def test_concurrent_calls_share_budget(self):
+        http.start_budget(1000)
+        # the calls start 0.1s after being submitted, and are all done after 0.3s
+        self.clock.other_threads_time = 0.1
+
+        def call(item):
+            self.clock.time = 0.3
+            return http.get_remaining_budget()
+        budgets = http.map_concurrently(call, [1, 2])
+        self.assertEquals(budgets, [0.9, 0.9])
+        self.assertAlmostEquals(http.get_remaining_budget(), 0.7)
+
+    def test_concurrent_calls_queued_too_long(self):
+        http.start_budget(100)
+        self.clock.other_threads_time = 0.2
+        with mock.patch('requests.Session.request') as session_request:
+            self.assertRaises(http.UpstreamUnavailable, http.map_concurrently,
+                              lambda url: http.get(url), ['https://api.example.org/a', 'https://api.example.org/b'])
+        self.assertFalse(session_request.called)
+
+    def test_degraded_rendering(self):
+        event = factories.EventFactory.create(location='oxpoints:1')
+        with mock.patch('talks.core.http.get', side_effect=http.UpstreamUnavailable):
+            self.assertIsNone(event.api_location)
@@ -1,7 +1,8 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from re import sub, compile
 from sys import maxunicode
 
+from django.utils import timezone
 from rest_framework.exceptions import ParseError
 import yaml
 
@@ -75,6 +76,32 @@ def parse_date(date_param, from_date=None):
     return date
 
 
+def date_range(year, month=None, day=None):
+    """
+    Get the beginning of a year, month or day and the beginning of the next one,
+    in the current time zone, to filter events with `start__gte` and `start__lt`
+    (which can use an index on start, unlike `start__year` etc.)
+    :param year: year (int or string)
+    :param month: month (optional)
+    :param day: day (optional, requires month)
+    :return: tuple of aware datetimes (start, end)
+    :raise ValueError: if the date does not exist
+    """
+    year = int(year)
+    if day:
+        first = date(year, int(month), int(day))
+        last = first + timedelta(days=1)
+    elif month:
+        first = date(year, int(month), 1)
+        last = date(year + first.month // 12, first.month % 12 + 1, 1)
+    else:
+        first = date(year, 1, 1)
+        last = date(year + 1, 1, 1)
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime(first.year, first.month, first.day), tz),
+            timezone.make_aware(datetime(last.year, last.month, last.day), tz))
+
+
 def read_yaml_param(fname, key):
     fullname = fname + ".yaml"
     try:
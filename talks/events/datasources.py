@@ -3,9 +3,21 @@ from urllib import urlencode
 from django.conf import settings
 
 from talks.api import serializers
+from talks.api_ox.models import OxPoint
 from talks.events import typeahead
 
 
+def get_cache_policy(cache_key):
+    """Cache policy of a data source (see the DATA_SOURCE_CACHE setting)
+    :param cache_key: name of the cache of the data source
+    :return: keyword arguments of `typeahead.DataSource`
+    """
+    conf = getattr(settings, 'DATA_SOURCE_CACHE', {}).get(cache_key, {})
+    return {'soft_ttl': conf.get('SOFT_TTL'),
+            'hard_ttl': conf.get('HARD_TTL'),
+            'negative_ttl': conf.get('NEGATIVE_TTL')}
+
+
 class OxPointDataSource(typeahead.DataSource):
     def __init__(self, **kwargs):
         _types = kwargs.pop('types', [])
@@ -15,7 +27,9 @@ class OxPointDataSource(typeahead.DataSource):
             url=url,
             response_expression='response._embedded.pois',
             # XXX: forcing api to return list if requesting single object
-            get_prefetch_url=lambda values: settings.API_OX_PLACES_URL + ",".join(values) + ","
+            get_prefetch_url=lambda values: settings.API_OX_PLACES_URL + ",".join(values) + ",",
+            mirror=OxPoint.objects,
+            **get_cache_policy('oxpoints')
         )
 
 LOCATION_DATA_SOURCE = OxPointDataSource(
@@ -32,6 +46,7 @@ TOPICS_DATA_SOURCE = typeahead.DataSource(
     display_key='prefLabel',
     id_key='uri',
     response_expression='response._embedded.concepts',
+    **get_cache_policy('topics')
 )
 PERSONS_DATA_SOURCE = typeahead.DjangoModelDataSource(
     'speakers',
@@ -79,7 +94,8 @@ DEPARTMENT_DESCENDANT_DATA_SOURCE = typeahead.DataSource(
     id_key='id',
     display_key='title',
     response_expression='response',
-    as_list=True
+    as_list=True,
+    **get_cache_policy('department_descendant')
 )
 
 def get_descendants(org_id):
@@ -0,0 +1,234 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+
+from talks.api.services import events_search
+from talks.events.models import Event, EventGroup, Person, PersonEvent, TopicItem, ROLES_SPEAKER
+
+# size of the pools of related objects the synthetic events pick from
+VENUES = 200
+DEPARTMENTS = 100
+SERIES = 500
+SPEAKERS = 5000
+TOPICS = 300
+
+BATCH_SIZE = 2000
+
+# filters used by `events_search` before it used semi-joins, for comparison
+JOIN_FILTERS = {
+    'speaker': lambda speakers: Q(personevent__role=ROLES_SPEAKER, personevent__person__slug__in=speakers),
+    'venue': lambda venues: Q(location__in=venues),
+    'organising_department': lambda depts: Q(department_organiser__in=depts),
+    'topic': lambda topics: Q(topics__uri__in=topics),
+}
+
+CASES = (
+    ('speaker + topic', ('speaker', 'topic')),
+    ('speaker + venue', ('speaker', 'venue')),
+    ('topic + department', ('topic', 'organising_department')),
+    ('speaker + topic + venue + department', ('speaker', 'topic', 'venue', 'organising_department')),
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def venue_id(i):
+    return 'oxpoints:bench-venue-{i}'.format(i=i)
+
+
+def department_id(i):
+    return 'oxpoints:bench-dept-{i}'.format(i=i)
+
+
+def topic_uri(i):
+    return 'http://id.worldcat.org/fast/bench-{i}'.format(i=i)
+
+
+def speaker_slug(i):
+    return 'bench-speaker-{i}'.format(i=i)
+
+
+def create_events(count, rnd, stdout):
+    """Create `count` events spread over two years around today, each with
+    1-3 speakers and 0-3 topics, picked from fixed size pools
+    """
+    now = timezone.now()
+    groups = []
+    for i in range(SERIES):
+        group = EventGroup(title='Benchmark series {i}'.format(i=i), slug=str(uuid.uuid4()))
+        groups.append(group)
+    EventGroup.objects.bulk_create(groups)
+    group_ids = list(EventGroup.objects.filter(title__startswith='Benchmark series').values_list('id', flat=True))
+
+    Person.objects.bulk_create([Person(name='Speaker {i}'.format(i=i), slug=speaker_slug(i))
+                                for i in range(SPEAKERS)])
+    person_ids = list(Person.objects.filter(slug__startswith='bench-speaker-').values_list('id', flat=True))
+    event_type = ContentType.objects.get_for_model(Event)
+
+    for offset in range(0, count, BATCH_SIZE):
+        events = []
+        for i in range(offset, min(count, offset + BATCH_SIZE)):
+            start = now + timedelta(days=rnd.randint(-365, 365), minutes=15 * rnd.randint(0, 40))
+            events.append(Event(title='Benchmark event {i}'.format(i=i),
+                                slug='bench-event-{i}'.format(i=i),
+                                start=start, end=start + timedelta(hours=1),
+                                location=venue_id(rnd.randrange(VENUES)),
+                                department_organiser=department_id(rnd.randrange(DEPARTMENTS)),
+                                group_id=rnd.choice(group_ids)))
+        Event.objects.bulk_create(events)
+        # bulk_create does not set the ids of the events
+        event_ids = Event.objects.order_by('-id').values_list('id', flat=True)[:len(events)]
+
+        people, topics = [], []
+        for event_id in event_ids:
+            for person_id in rnd.sample(person_ids, rnd.randint(1, 3)):
+                people.append(PersonEvent(event_id=event_id, person_id=person_id, role=ROLES_SPEAKER))
+            for i in rnd.sample(range(TOPICS), rnd.randint(0, 3)):
+                topics.append(TopicItem(content_type=event_type, object_id=event_id, uri=topic_uri(i)))
+        PersonEvent.objects.bulk_create(people)
+        TopicItem.objects.bulk_create(topics)
+        stdout.write("Created {n} events".format(n=offset + len(events)))
+
+
+def get_filter_values(rnd):
+    return {
+        'speaker': [speaker_slug(rnd.randrange(SPEAKERS)) for _ in range(20)],
+        'topic': [topic_uri(rnd.randrange(TOPICS)) for _ in range(5)],
+        'venue': [venue_id(rnd.randrange(VENUES)) for _ in range(40)],
+        'organising_department': [department_id(rnd.randrange(DEPARTMENTS)) for _ in range(20)],
+    }
+
+
+def join_events_search(from_date, filters):
+    """Search with joins and DISTINCT (as `events_search` used to)
+    """
+    queries = [JOIN_FILTERS[name](values) for name, values in filters.items()]
+    return Event.objects.filter(Q(start__gt=from_date), *queries).distinct().order_by('start')
+
+
+def semi_join_events_search(from_date, filters):
+    parameters = QueryDict('', mutable=True)
+    parameters['from'] = from_date.strftime('%Y-%m-%d')
+    parameters['subdepartments'] = 'false'
+    for name, values in filters.items():
+        parameters.setlist(name, values)
+    return events_search(parameters)
+
+
+def explain(queryset, analyze=False):
+    """
+    :return: the query plan of the database (list of strings)
+    """
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql' and analyze:
+        prefix = 'EXPLAIN ANALYZE '
+    else:
+        prefix = 'EXPLAIN '
+    cursor = connection.cursor()
+    cursor.execute(prefix + sql, params)
+    return [' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+
+def timed(func, repeat):
+    """
+    :return: tuple (result of the last call, median duration in milliseconds)
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.time()
+        result = func()
+        durations.append((time.time() - started) * 1000)
+    return result, sorted(durations)[len(durations) // 2]
+
+
+class Command(BaseCommand):
+    help = ("Compare the plans and latency of searching events with joins and DISTINCT "
+            "and with semi-joins (as done by `events_search`), on synthetic events")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--events',
+                    dest='events',
+                    type='int',
+                    default=200000,
+                    help='Number of synthetic events to create (0 to use the existing events)'),
+        make_option('--repeat',
+                    dest='repeat',
+                    type='int',
+                    default=5,
+                    help='Number of times each query is run'),
+        make_option('--page-size',
+                    dest='page_size',
+                    type='int',
+                    default=20,
+                    help='Number of events fetched by each query'),
+        make_option('--explain',
+                    action='store_true',
+                    dest='explain',
+                    default=False,
+                    help='Print the query plans'),
+        make_option('--analyze',
+                    action='store_true',
+                    dest='analyze',
+                    default=False,
+                    help='Use EXPLAIN ANALYZE for the query plans (PostgreSQL)'),
+        make_option('--keep',
+                    action='store_true',
+                    dest='keep',
+                    default=False,
+                    help='Keep the synthetic events instead of rolling back'),
+        make_option('--seed',
+                    dest='seed',
+                    type='int',
+                    default=0,
+                    help='Seed of the random generator'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write("Synthetic events removed")
+
+    def benchmark(self, options):
+        rnd = random.Random(options['seed'])
+        if options['events']:
+            create_events(options['events'], rnd, self.stdout)
+            if connection.vendor == 'postgresql':
+                connection.cursor().execute('ANALYZE')
+        from_date = (timezone.now() - timedelta(days=365)).date()
+        filter_values = get_filter_values(rnd)
+        page_size = options['page_size']
+
+        for label, names in CASES:
+            filters = dict((name, filter_values[name]) for name in names)
+            self.stdout.write("\n== {label} ==".format(label=label))
+            counts = []
+            for name, search in (('joins + DISTINCT', join_events_search),
+                                 ('semi-joins', semi_join_events_search)):
+                queryset = search(from_date, filters)
+                page, page_ms = timed(lambda: list(queryset[:page_size]), options['repeat'])
+                count, count_ms = timed(queryset.count, options['repeat'])
+                counts.append(count)
+                self.stdout.write("{name:>17}: {count} events, first page {page_ms:.1f} ms, count {count_ms:.1f} ms".format(
+                    name=name, count=count, page_ms=page_ms, count_ms=count_ms))
+                if options['explain']:
+                    for line in explain(queryset[:page_size], options['analyze']):
+                        self.stdout.write("    " + line)
+            if counts[0] != counts[1]:
+                self.stderr.write("The two queries returned a different number of events")
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# index of the published events (`Event.published`) by start date. The
+# condition of a partial index cannot depend on the current date, so it
+# contains past events too, but the start ranges of upcoming events only
+# read its end.
+PUBLISHED_INDEX = 'events_event_published_start'
+
+
+def create_published_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("CREATE INDEX {name} ON events_event (start) "
+                              "WHERE status = 'published' AND NOT embargo".format(name=PUBLISHED_INDEX))
+
+
+def drop_published_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP INDEX {name}".format(name=PUBLISHED_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='start',
+            field=models.DateTimeField(db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('department_organiser', 'start'), ('group', 'start'), ('location', 'start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='personevent',
+            index_together=set([('person', 'role', 'event')]),
+        ),
+        migrations.RunPython(create_published_index, drop_published_index),
+    ]
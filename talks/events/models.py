@@ -13,12 +13,15 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.db import models
+from django.dispatch import receiver
 from django.template.defaultfilters import date as date_filter
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 
-from talks.api_ox.api import ApiException, OxfordDateResource
+from talks.api_ox.api import ApiException
+from talks.api_ox.dates import OxfordDate, local_date
+from talks.core.caching import get_resource_cache
 from talks.core.utils import iso8601_duration
 
 logger = logging.getLogger(__name__)
@@ -102,6 +105,7 @@ class EventGroup(models.Model):
     web_address = models.URLField(blank=True, default='', verbose_name='Web address')
     department_organiser = models.TextField(default='', blank=True, verbose_name='Organising Department')
     editor_set = models.ManyToManyField(User, blank=True)
+    updated = models.DateTimeField(auto_now=True)
 
     objects = EventGroupManager()
 
@@ -132,7 +136,7 @@ class EventGroup(models.Model):
         from . import datasources
         try:
             return datasources.DEPARTMENT_DATA_SOURCE.get_object_by_id(self.department_organiser)
-        except requests.HTTPError:
+        except requests.RequestException:
             return None
 
     def user_can_edit(self, user):
@@ -176,6 +180,7 @@ class Person(models.Model):
     web_address = models.URLField(verbose_name="Web address",
                                   null=True,
                                   blank=True)
+    updated = models.DateTimeField(auto_now=True)
     objects = PersonManager()
 
     def save(self, *args, **kwargs):
@@ -244,6 +249,27 @@ class PersonEvent(models.Model):
     role = models.TextField(choices=ROLES, default=ROLES_SPEAKER)
     url = models.URLField(blank=True)
 
+    class Meta:
+        # events of a person in a given role (e.g. talks page of a speaker)
+        index_together = (('person', 'role', 'event'),)
+
+
+class PrefetchedPeople(list):
+    """People of an event loaded by `talks.events.resources.prefetch_events`,
+    usable like the QuerySet returned when they are not prefetched
+    """
+
+    def all(self):
+        return self
+
+    def count(self, *args):
+        if args:
+            return super(PrefetchedPeople, self).count(*args)
+        return len(self)
+
+    def exists(self):
+        return bool(self)
+
 
 class PublishedEventManager(models.Manager):
     """Manager filtering events not publised
@@ -256,7 +282,7 @@ class PublishedEventManager(models.Manager):
 
 
 class Event(models.Model):
-    start = models.DateTimeField(null=False, blank=False)
+    start = models.DateTimeField(null=False, blank=False, db_index=True)
     end = models.DateTimeField(null=False, blank=False)
     title = models.CharField(max_length=250, blank=True)
     title_not_announced = models.BooleanField(default=False, verbose_name="Title to be announced")
@@ -295,73 +321,97 @@ class Event(models.Model):
     department_organiser = models.TextField(default='', blank=True)
     organiser_email = models.EmailField(blank=True, default='', verbose_name='Contact email')
     topics = GenericRelation(TopicItem)
+    updated = models.DateTimeField(auto_now=True)
 
     objects = models.Manager()
     # manager used to only get published, non embargo events
     published = PublishedEventManager()
 
-    _cached_resources = {}
+    class Meta:
+        # events are mostly listed by start date, filtered by one of these
+        # (see also the partial index of published events in migration 0015)
+        index_together = (
+            ('department_organiser', 'start'),
+            ('location', 'start'),
+            ('group', 'start'),
+        )
+
+    def _get_people(self, role):
+        if hasattr(self, '_prefetched_people'):
+            # see `talks.events.resources.prefetch_events`
+            return PrefetchedPeople(self._prefetched_people.get(role, []))
+        return self.person_set.filter(personevent__role=role).order_by('personevent__id')
 
     @property
     def speakers(self):
-        return self.person_set.filter(personevent__role=ROLES_SPEAKER).order_by('personevent__id')
+        return self._get_people(ROLES_SPEAKER)
 
     @property
     def organisers(self):
-        return self.person_set.filter(personevent__role=ROLES_ORGANISER)
+        return self._get_people(ROLES_ORGANISER)
 
     @property
     def hosts(self):
-        return self.person_set.filter(personevent__role=ROLES_HOST)
+        return self._get_people(ROLES_HOST)
 
     def fetch_resource(self, key, func):
         """Fetch a resource from the API.
 
-        If we have `key` in a cache then pull from there, otherwise call `func`
+        If we have `key` in the resource cache then pull from there, otherwise call `func`
         """
-        if key in self._cached_resources:
-            return self._cached_resources[key]
-        else:
-            try:
-                res = func()
-                self._cached_resources[key] = res
-                return res
-            except ApiException:
-                logger.warn('Unable to reach API', exc_info=True)
-                return None
+        try:
+            return get_resource_cache().get_or_set(key, func)
+        except ApiException:
+            logger.warn('Unable to reach API', exc_info=True)
+            return None
 
     @property
     def api_location(self):
+        if 'location' in getattr(self, '_api_resources', {}):
+            return self._api_resources['location']
         from talks.events import datasources
         try:
             return datasources.LOCATION_DATA_SOURCE.get_object_by_id(self.location)
-        except requests.HTTPError:
+        except requests.RequestException:
             return None
 
     @property
     def api_organisation(self):
+        if 'organisation' in getattr(self, '_api_resources', {}):
+            return self._api_resources['organisation']
         from talks.events import datasources
         try:
             return datasources.DEPARTMENT_DATA_SOURCE.get_object_by_id(self.department_organiser)
-        except requests.HTTPError:
+        except requests.RequestException:
             return None
 
     @property
     def api_topics(self):
+        if 'topics' in getattr(self, '_api_resources', {}):
+            return self._api_resources['topics']
         from talks.events import datasources
         uris = [item.uri for item in self.topics.all()]
         logger.debug("uris:%s", uris)
         try:
             return datasources.TOPICS_DATA_SOURCE.get_object_list(uris)
-        except requests.HTTPError:
+        except requests.RequestException:
             return None
 
     @property
     def oxford_date(self):
         if not self.start:
             return None
-        func = functools.partial(OxfordDateResource.from_date, self.start)
-        return self.fetch_resource(self.start, func)
+        if getattr(self, '_oxford_date', None):
+            return self._oxford_date
+        func = functools.partial(OxfordDate.from_date, self.start)
+        return self.fetch_resource(('oxford_date', local_date(self.start)), func)
+
+    @oxford_date.setter
+    def oxford_date(self, value):
+        """Used when the dates of multiple events have been
+        resolved at once (see `talks.api_ox.api.get_oxford_dates`)
+        """
+        self._oxford_date = value
 
     def save(self, *args, **kwargs):
         if not self.id and not self.slug:
@@ -510,3 +560,40 @@ reversion.register(EventGroup)
 reversion.register(Person)
 reversion.register(PersonEvent)
 reversion.register(TopicItem)
+
+
+# `updated` is used to answer conditional requests (see `talks.api.services.get_events_validator`),
+# it is also changed when objects displayed with an event or series change
+
+@receiver(models.signals.post_save, sender=PersonEvent)
+@receiver(models.signals.post_delete, sender=PersonEvent)
+def person_event_changed(sender, instance, **kwargs):
+    Event.objects.filter(id=instance.event_id).update(updated=timezone.now())
+
+
+@receiver(models.signals.post_save, sender=TopicItem)
+@receiver(models.signals.post_delete, sender=TopicItem)
+def topic_item_changed(sender, instance, **kwargs):
+    model = instance.content_type.model_class()
+    if model in (Event, EventGroup):
+        model.objects.filter(id=instance.object_id).update(updated=timezone.now())
+
+
+@receiver(models.signals.post_save, sender=Person)
+def person_changed(sender, instance, created, **kwargs):
+    if not created:
+        now = timezone.now()
+        Event.objects.filter(personevent__person=instance).update(updated=now)
+        EventGroup.objects.filter(organisers=instance).update(updated=now)
+
+
+@receiver(models.signals.m2m_changed, sender=EventGroup.organisers.through)
+def event_group_organisers_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, EventGroup):
+        EventGroup.objects.filter(id=instance.id).update(updated=timezone.now())
+
+
+@receiver(models.signals.post_save, sender=EventGroup)
+def event_group_changed(sender, instance, created, **kwargs):
+    if not created:
+        Event.objects.filter(group=instance).update(updated=timezone.now())
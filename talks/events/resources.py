@@ -0,0 +1,194 @@
+"""Bulk loading of the related objects and external resources of a list of
+events, so that serializing a page of events does not query the database
+and the APIs once per event.
+"""
+import logging
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+
+from talks.api_ox.api import get_oxford_dates
+from talks.api_ox.dates import local_date
+from talks.core import http
+from talks.events.models import Event, EventGroup, PersonEvent, TopicItem
+
+logger = logging.getLogger(__name__)
+
+
+API_RESOURCES = ('location', 'organisation', 'topics', 'oxford_date')
+
+
+def prefetch_events(events, api_resources=API_RESOURCES, resource_map=None):
+    """Load the people, series, topics and external resources
+    (location, organising department, topics, Oxford date) of events at once.
+    Attributes of the events (e.g. `speakers`, `group`, `api_location`)
+    then use the loaded objects.
+    :param events: iterable of Event
+    :param api_resources: external resources to load (others are fetched on access)
+    :param resource_map: see `resolve_api_resources`
+    :return: list of Event
+    """
+    events = list(events)
+    if not events:
+        return events
+    _prefetch_groups(events)
+    _prefetch_people(events)
+    topic_uris = _prefetch_topic_uris(events)
+    resolve_api_resources(events, api_resources, topic_uris, resource_map)
+    return events
+
+
+def _prefetch_groups(events):
+    cache_name = Event._meta.get_field('group').get_cache_name()
+    groups = EventGroup.objects.in_bulk(set(e.group_id for e in events if e.group_id))
+    for event in events:
+        if event.group_id:
+            setattr(event, cache_name, groups.get(event.group_id))
+
+
+def _prefetch_people(events):
+    people = defaultdict(lambda: defaultdict(list))
+    person_events = PersonEvent.objects.filter(event__in=[e.id for e in events]).select_related('person')
+    for person_event in person_events.order_by('id'):
+        people[person_event.event_id][person_event.role].append(person_event.person)
+    for event in events:
+        event._prefetched_people = people[event.id]
+
+
+def _prefetch_topic_uris(events):
+    topic_uris = defaultdict(list)
+    topic_items = TopicItem.objects.filter(content_type=ContentType.objects.get_for_model(Event),
+                                           object_id__in=[e.id for e in events])
+    for object_id, uri in topic_items.order_by('id').values_list('object_id', 'uri'):
+        topic_uris[object_id].append(uri)
+    return topic_uris
+
+
+class ResourceMap(object):
+    """Identity map of the external resources looked up while handling a
+    request: each object is loaded once, however many events refer to it.
+    Data sources sharing a cache (e.g. locations and departments, both
+    OxPoints) share their objects, others are kept apart.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._failed = set()
+
+    @staticmethod
+    def _get_space(data_source):
+        return data_source.cache_key or id(data_source)
+
+    def load(self, lookups):
+        """Load objects which are not in the map yet: from the caches or the
+        mirrors first, then from the APIs, each lookup in its own request,
+        all of them concurrently
+        :param lookups: list of tuples (data source, ids)
+        """
+        missing = []
+        for data_source, id_list in lookups:
+            space = self._get_space(data_source)
+            id_list = [object_id for object_id in set(id_list)
+                       if object_id and (space, object_id) not in self._objects]
+            if not id_list:
+                continue
+            objects, not_local = data_source.get_local_objects(id_list)
+            self._store(space, objects, set(id_list) - not_local)
+            if not_local:
+                missing.append((data_source, not_local))
+        fetched = http.map_concurrently(_fetch_missing_objects, missing)
+        for (data_source, id_list), objects in zip(missing, fetched):
+            space = self._get_space(data_source)
+            if objects is None:
+                self._failed.update((space, object_id) for object_id in id_list)
+            else:
+                self._store(space, objects, id_list)
+
+    def _store(self, space, objects, id_list):
+        for object_id in id_list:
+            self._objects[(space, object_id)] = objects.get(object_id)
+
+    def get_object_map(self, data_source, id_list):
+        """
+        :param data_source: typeahead.DataSource
+        :param id_list: ids of the objects (loaded with `load` first)
+        :return: dictionary of objects by id (objects not found are
+        omitted), or None if the API failed to return some of them
+        """
+        space = self._get_space(data_source)
+        keys = [(space, object_id) for object_id in id_list if object_id]
+        if any(key in self._failed for key in keys):
+            return None
+        return {key[1]: self._objects[key] for key in keys if self._objects.get(key) is not None}
+
+
+def get_resource_map(request):
+    """
+    :param request: HttpRequest (or REST framework Request)
+    :return: `ResourceMap` of the request
+    """
+    request = getattr(request, '_request', request)
+    if not hasattr(request, '_resource_map'):
+        request._resource_map = ResourceMap()
+    return request._resource_map
+
+
+def _fetch_missing_objects(lookup):
+    # called in the threads of `http.map_concurrently`, an error must
+    # not lose the objects fetched from the other APIs
+    data_source, id_list = lookup
+    try:
+        return data_source.fetch_missing_objects(id_list)
+    except Exception:
+        logger.warn('Unable to fetch %s', sorted(id_list), exc_info=True)
+        return None
+
+
+def resolve_api_resources(events, api_resources=API_RESOURCES, topic_uris=None, resource_map=None):
+    """Look up the external resources of events, so that their attributes
+    (`api_location`, `api_organisation`, `api_topics`, `oxford_date`) do not
+    query the APIs one after the other. Objects neither cached nor mirrored
+    are requested from all the APIs concurrently.
+    :param events: list of Event
+    :param api_resources: external resources to look up (others are fetched on access)
+    :param topic_uris: dictionary of topic URIs by event id (queried if None)
+    :param resource_map: `ResourceMap` of the request (objects already in
+    it are reused)
+    :return: list of Event
+    """
+    from talks.events import datasources
+    if resource_map is None:
+        resource_map = ResourceMap()
+    if topic_uris is None and 'topics' in api_resources:
+        topic_uris = _prefetch_topic_uris(events)
+    lookups = {}
+    if 'location' in api_resources:
+        lookups['location'] = (datasources.LOCATION_DATA_SOURCE, [e.location for e in events])
+    if 'organisation' in api_resources:
+        lookups['organisation'] = (datasources.DEPARTMENT_DATA_SOURCE, [e.department_organiser for e in events])
+    if 'topics' in api_resources:
+        lookups['topics'] = (datasources.TOPICS_DATA_SOURCE, [uri for uris in topic_uris.values() for uri in uris])
+    resource_map.load(lookups.values())
+    objects = {name: resource_map.get_object_map(*lookup) for name, lookup in lookups.items()}
+
+    resources = {}
+    if 'location' in api_resources:
+        locations = objects['location']
+        resources['location'] = lambda event: locations.get(event.location) if locations is not None else None
+    if 'organisation' in api_resources:
+        organisations = objects['organisation']
+        resources['organisation'] = lambda event: (organisations.get(event.department_organiser)
+                                                   if organisations is not None else None)
+    if 'topics' in api_resources:
+        topics = objects['topics']
+        # same order as `DataSource.get_object_list`
+        resources['topics'] = lambda event: ({uri: topics[uri] for uri in topic_uris[event.id] if uri in topics}.values()
+                                             if topics is not None else None)
+    for event in events:
+        event._api_resources = {name: get_resource(event) for name, get_resource in resources.items()}
+    if 'oxford_date' in api_resources:
+        dates = get_oxford_dates(event.start for event in events)
+        for event in events:
+            if event.start:
+                event.oxford_date = dates[local_date(event.start)]
+    return events
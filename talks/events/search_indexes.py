@@ -1,6 +1,7 @@
 from haystack import indexes
 
 from .models import Event
+from talks.api_ox.dates import format_date_heading
 from talks.events.models import EVENT_IN_PREPARATION, EVENT_PUBLISHED
 
 
@@ -22,6 +23,14 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
     group_slug = indexes.CharField(null=True)
     lists = indexes.MultiValueField(faceted=True, null=True)
 
+    # only stored, so that search results can be displayed without
+    # loading the events (see talks.events.views.group_events)
+    title_display = indexes.CharField(model_attr='title_display', indexed=False)
+    special_message = indexes.CharField(model_attr='special_message', null=True, indexed=False)
+    various_speakers = indexes.BooleanField(model_attr='various_speakers', indexed=False)
+    formatted_time = indexes.CharField(null=True, indexed=False)
+    date_heading = indexes.CharField(null=True, indexed=False)
+
     # suggestions: used for spellchecking
     suggestions = indexes.SuggestionField()
 
@@ -29,9 +38,10 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
         return Event
 
     def index_queryset(self, using=None):
-        """Used when the entire index for model is updated."""
+        """Used when the entire index for model is updated
+        (see also the `reindex_events` management command)."""
         #return self.get_model().objects.filter(pub_date__lte=datetime.datetime.now())
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('group')
 
     def prepare(self, obj):
         """Overriding the prepare() method of SearchIndex in order to add our most complicated fields
@@ -55,7 +65,7 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
             api_loc = obj.api_location
         else:
             api_loc = None
-        speakers_names = [speaker.name for speaker in obj.speakers.all()]
+        speakers_names = [speaker.name for speaker in obj.speakers]
 
         # Speakers
         self.prepared_data[self.speakers.index_fieldname] = speakers_names
@@ -76,14 +86,24 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
         self.prepared_data[self.is_published.index_fieldname] = obj.is_published
         self.prepared_data[self.is_cancelled.index_fieldname] = obj.is_cancelled
         
+        # Date and time as displayed in lists of events
+        if obj.start:
+            self.prepared_data[self.formatted_time.index_fieldname] = obj.formatted_time()
+            self.prepared_data[self.date_heading.index_fieldname] = format_date_heading(obj.oxford_date.components)
+
         # Series name
         if obj.group:
             self.prepared_data[self.group.index_fieldname] = obj.group.title
             self.prepared_data[self.group_slug.index_fieldname] = obj.group.slug
 
-        # lists
-        lists_names = [list.title for list in obj.public_collections_containing_this_event.all()]
-        self.prepared_data[self.lists.index_fieldname] = lists_names
+        # lists: indexed by id, so that they can be renamed without reindexing
+        # their events (see talks.events_search.lists for their titles)
+        if hasattr(obj, '_public_collection_ids'):
+            # see `talks.events_search.indexing.prefetch_public_collections`
+            lists_ids = obj._public_collection_ids
+        else:
+            lists_ids = list(obj.public_collections_containing_this_event.values_list('id', flat=True))
+        self.prepared_data[self.lists.index_fieldname] = [unicode(list_id) for list_id in lists_ids]
 
         suggest_content = []        # used when providing suggestions
         full_text_content = []      # used when searching full text
@@ -104,9 +124,6 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
 
         suggest_content.extend(speakers_names)
         full_text_content.extend(speakers_names)
-        
-        suggest_content.extend(lists_names)
-        full_text_content.extend(lists_names)
 
         self.prepared_data[self.suggestions.index_fieldname] = suggest_content
         self.prepared_data[self.text.index_fieldname] = full_text_content
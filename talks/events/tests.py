@@ -1,14 +1,23 @@
 import unittest
 import datetime
+import threading
+import time
 import mock
 import requests
 
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.core.cache.backends.base import BaseCache
 from django.contrib.auth.models import User
+from django.db import connection
+from django.http import QueryDict
 from django.utils import timezone
 
-from . import models, factories, typeahead, datasources
+from talks.api.services import events_search
+from talks.api_ox.models import OrganisationNode
+from talks.core import http
+from . import models, factories, typeahead, datasources, views, resources
 from talks.events.models import EVENT_PUBLISHED
 
 
@@ -49,6 +58,18 @@ class TestEventProperties(TestCase):
         self.assertTrue(event.user_can_edit(contrib_user_editor))
         self.assertFalse(event.user_can_edit(contrib_user))
 
+    def test_prefetched_people(self):
+        event = factories.EventFactory.create()
+        speaker = factories.PersonFactory.create(name="Speaker")
+        models.PersonEvent.objects.create(person=speaker, event=event, role=models.ROLES_SPEAKER)
+        prefetched, = resources.prefetch_events([models.Event.objects.get(id=event.id)], api_resources=())
+        # same use as the QuerySet of an event which is not prefetched
+        for people in (event.speakers, prefetched.speakers):
+            self.assertEquals(list(people.all()), [speaker])
+            self.assertEquals(people.count(), 1)
+            self.assertTrue(people.exists())
+        self.assertEquals(prefetched.hosts.count(), 0)
+
 
 class TestEventPublishWorkflow(TestCase):
 
@@ -64,9 +85,190 @@ class TestEventPublishWorkflow(TestCase):
         self.assertEquals(events[0], self.published)
 
 
+class TestBrowseEvents(TestCase):
+
+    def setUp(self):
+        start = timezone.now().replace(hour=9) + datetime.timedelta(days=1)
+        self.events = [factories.EventFactory.create(title="Talk %d" % i,
+                                                     start=start + datetime.timedelta(minutes=i),
+                                                     end=start + datetime.timedelta(hours=1))
+                       for i in range(3)]
+
+    def test_cursor_pages(self):
+        response = self.client.get('/browse', {'start_date': 'today', 'count': 2})
+        self.assertEquals(response.status_code, 200)
+        page = response.context['events']
+        self.assertEquals(list(page), self.events[:2])
+        self.assertFalse(response.context['date_continued_previous'])
+        self.assertTrue(response.context['date_continued_next'])
+
+        response = self.client.get('/browse', {'start_date': 'today', 'count': 2, 'cursor': page.next_cursor()})
+        self.assertEquals(list(response.context['events']), self.events[2:])
+        self.assertTrue(response.context['date_continued_previous'])
+        self.assertFalse(response.context['date_continued_next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/browse', {'start_date': 'today', 'cursor': 'foo'})
+        self.assertEquals(response.status_code, 302)
+
+    def test_count(self):
+        for count in ('0', '-2', 'foo'):
+            response = self.client.get('/browse', {'start_date': 'today', 'count': count})
+            self.assertEquals(response.status_code, 302)
+        with mock.patch('talks.core.pagination.MAX_COUNT', 2):
+            response = self.client.get('/browse', {'start_date': 'today', 'count': 100000})
+        self.assertEquals(list(response.context['events']), self.events[:2])
+
+
+class TestDateArchives(TestCase):
+
+    def setUp(self):
+        # 23:30 UTC is already the 23rd in British Summer Time
+        self.late = factories.EventFactory.create(start=datetime.datetime(2015, 10, 22, 23, 30, tzinfo=timezone.utc))
+        self.events = [factories.EventFactory.create(start=datetime.datetime(2015, 10, 23, 9, i, tzinfo=timezone.utc))
+                       for i in range(3)]
+        factories.EventFactory.create(start=datetime.datetime(2015, 11, 1, 9, 0, tzinfo=timezone.utc))
+
+    def test_day(self):
+        response = self.client.get('/talks/date/2015/10/23/')
+        self.assertEquals(list(response.context['events']), [self.late] + self.events)
+
+    def test_month_pages(self):
+        response = self.client.get('/talks/date/2015/10/', {'count': 3})
+        page = response.context['events']
+        self.assertEquals(list(page), [self.late] + self.events[:2])
+        response = self.client.get('/talks/date/2015/10/', {'count': 3, 'cursor': page.next_cursor()})
+        self.assertEquals(list(response.context['events']), self.events[2:])
+
+    def test_invalid_date(self):
+        response = self.client.get('/talks/date/2015/13/')
+        self.assertEquals(response.status_code, 404)
+
+    def test_count(self):
+        response = self.client.get('/talks/date/2015/10/', {'count': 0})
+        self.assertEquals(response.status_code, 302)
+        with mock.patch('talks.core.pagination.MAX_COUNT', 2):
+            response = self.client.get('/talks/date/2015/10/', {'count': 100000})
+        self.assertEquals(list(response.context['events']), [self.late, self.events[0]])
+        self.assertEquals(response.context['fragment'], 'count=2')
+
+
+def get_query_plan(queryset):
+    """Query plan of the database for a queryset (indexes are
+    preferred to scanning tables, which are tiny in tests)
+    """
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("EXPLAIN " + sql, params)
+    else:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return "\n".join(" ".join(unicode(column) for column in row) for row in cursor.fetchall())
+
+
+def get_index_names(model, columns):
+    """Names of the indexes of a model on exactly these columns
+    """
+    table = model._meta.db_table
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        # the introspection of Django 1.7 does not support recent SQLite versions
+        cursor.execute("PRAGMA index_list({table})".format(table=connection.ops.quote_name(table)))
+        indexes = {}
+        for name in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("PRAGMA index_info({name})".format(name=connection.ops.quote_name(name)))
+            indexes[name] = [row[2] for row in sorted(cursor.fetchall())]
+    else:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        indexes = dict((name, c['columns']) for name, c in constraints.items() if c['index'])
+    return [name for name, index_columns in indexes.items() if index_columns == columns]
+
+
+class TestQueryPlans(TestCase):
+
+    def setUp(self):
+        self.group = factories.EventGroupFactory.create(title="Series", slug="series")
+        self.person = factories.PersonFactory.create(name="Speaker", slug="speaker")
+        start = timezone.now() + datetime.timedelta(days=1)
+        event = factories.EventFactory.create(start=start, end=start, group=self.group,
+                                              location='oxpoints:1', department_organiser='oxpoints:2')
+        factories.PersonEventFactory.create(person=self.person, event=event, role=models.ROLES_SPEAKER)
+        # querysets given by the views to `group_events`
+        self.querysets = []
+        self._group_events = views.group_events
+        patcher = mock.patch('talks.events.views.group_events', side_effect=self._record_events)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _record_events(self, events):
+        self.querysets.append(events)
+        return self._group_events(events)
+
+    def assertUsesIndex(self, queryset, model, columns):
+        plan = get_query_plan(queryset)
+        names = get_index_names(model, columns)
+        self.assertTrue(any(name in plan for name in names),
+                        "None of {names} used by:\n{plan}".format(names=names, plan=plan))
+
+    def test_events_search(self):
+        search = lambda query: events_search(QueryDict('from=today&subdepartments=false&' + query))
+        self.assertUsesIndex(search(''), models.Event, ['start'])
+        self.assertUsesIndex(search('venue=oxpoints:1'), models.Event, ['location', 'start'])
+        self.assertUsesIndex(search('organising_department=oxpoints:2'), models.Event,
+                             ['department_organiser', 'start'])
+        self.assertUsesIndex(search('speaker=speaker'), models.PersonEvent, ['person_id', 'role', 'event_id'])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql',
+                         "SQLite does not match query parameters with the condition of a partial index")
+    def test_upcoming_published(self):
+        events = models.Event.published.filter(start__gte=datetime.date.today()).order_by('start')
+        self.assertIn('events_event_published_start', get_query_plan(events))
+
+    @mock.patch('talks.events.views.DEPARTMENT_DATA_SOURCE')
+    def test_show_department_descendant(self, data_source):
+        data_source.get_object_by_id.return_value = {'id': 'oxpoints:2', 'name': 'Department', '_links': {}}
+        OrganisationNode.objects.rebuild('oxpoints:2', {'oxpoints:2': (None, 'Department')})
+        self.client.get('/talks/department/id/oxpoints:2')
+        self.assertUsesIndex(self.querysets[0], models.Event, ['department_organiser', 'start'])
+
+    def test_show_event_group(self):
+        self.client.get('/talks/series/id/series')
+        self.assertUsesIndex(self.querysets[0], models.Event, ['group_id', 'start'])
+
+    def test_show_person(self):
+        self.client.get('/talks/persons/id/speaker')
+        for queryset in self.querysets:
+            self.assertUsesIndex(queryset, models.PersonEvent, ['person_id', 'role', 'event_id'])
+
+
+@mock.patch('talks.core.http.get', side_effect=http.UpstreamUnavailable)
+class TestViewsWithoutApi(TestCase):
+
+    def setUp(self):
+        start = timezone.now() + datetime.timedelta(days=1)
+        self.event = factories.EventFactory.create(title='Unavailable API', start=start, end=start,
+                                                   department_organiser='oxpoints:unavailable')
+        factories.TopicItemFactory_noSubFactory.create(uri='http://example.org/unavailable',
+                                                       content_type=ContentType.objects.get_for_model(models.Event),
+                                                       object_id=self.event.id)
+
+    def test_show_topic(self, requests_get):
+        response = self.client.get('/talks/topics/id/', {'uri': 'http://example.org/unavailable'})
+        self.assertContains(response, 'Unavailable API')
+
+    def test_list_topics(self, requests_get):
+        response = self.client.get('/talks/topics')
+        self.assertEquals(response.status_code, 200)
+
+    def test_show_department(self, requests_get):
+        response = self.client.get('/talks/department/id/oxpoints:unavailable')
+        self.assertContains(response, 'Unavailable API')
+
+
 @mock.patch('talks.events.typeahead.get_objects_from_response', autospec=True)
 @mock.patch.object(typeahead.DataSource, 'cache', spec=BaseCache)
-@mock.patch('requests.get', autospec=True)
+@mock.patch('talks.core.http.get', autospec=True)
 class TestDataSourceFetchObjects(unittest.TestCase):
 
     def test_empty_id_list(self, requests_get, cache, get_objects_from_response):
@@ -211,6 +413,44 @@ class TestDataSourceFetchObjects(unittest.TestCase):
         self.assertEquals(result, {fetched_id: fetched_object})
 
 
+    def test_fetched_from_mirror_and_remote(self, requests_get, cache, get_objects_from_response):
+        id_key = mock.sentinel.id_key
+        mirrored_id, mirrored_object = mock.sentinel.mirrored_id, mock.sentinel.mirrored_object
+        fetched_id, fetched_object = mock.sentinel.fetched_id, {id_key: mock.sentinel.fetched_id}
+        requests_get.return_value = mock.Mock(spec=requests.Response)
+        cache.get_many.return_value = {}
+        get_objects_from_response.return_value = [fetched_object]
+        get_prefetch_url = mock.Mock(return_value=mock.sentinel.url)
+        mirror = mock.Mock()
+        mirror.get_many.return_value = {mirrored_id: mirrored_object}
+
+        ds = typeahead.DataSource(mock.sentinel.cache_key, get_prefetch_url=get_prefetch_url, id_key=id_key,
+                                  mirror=mirror)
+        result = ds._fetch_objects([mirrored_id, fetched_id])
+
+        mirror.get_many.assert_called_once_with({mirrored_id, fetched_id})
+        get_prefetch_url.assert_called_once_with({fetched_id})
+        self.assertEquals(cache.set_many.call_args_list, [mock.call({mirrored_id: mirrored_object}),
+                                                          mock.call({fetched_id: fetched_object})])
+        self.assertEquals(result, {
+            mirrored_id: mirrored_object,
+            fetched_id: fetched_object
+        })
+
+    def test_fetched_from_mirror(self, requests_get, cache, get_objects_from_response):
+        cache.get_many.return_value = {}
+        mirror = mock.Mock()
+        mirror.get_many.return_value = {mock.sentinel.id: mock.sentinel.object}
+        get_prefetch_url = mock.Mock()
+
+        ds = typeahead.DataSource(mock.sentinel.cache_key, get_prefetch_url=get_prefetch_url, mirror=mirror)
+        result = ds._fetch_objects([mock.sentinel.id])
+
+        assert_not_called(requests_get)
+        assert_not_called(get_prefetch_url)
+        self.assertEquals(result, {mock.sentinel.id: mock.sentinel.object})
+
+
 @mock.patch('talks.events.typeahead.DataSource._fetch_objects', autospec=True)
 class TestDataSourceGetObjectById(unittest.TestCase):
     def test_not_found(self, fetch_objects):
@@ -286,7 +526,79 @@ class TestGetObjectsFromResponse(unittest.TestCase):
         self.assertEquals(e.exception.message, 'foo')
 
 
-@mock.patch('requests.get', autospec=True)
+@override_settings(CACHES={'policy': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                      'LOCATION': 'data-source-policy'}})
+class TestDataSourceCachePolicy(TestCase):
+
+    def setUp(self):
+        self.ds = typeahead.DataSource('policy', get_prefetch_url=mock.Mock(),
+                                       soft_ttl=60, hard_ttl=3600, negative_ttl=600)
+        self.ds.cache.clear()
+        patcher = mock.patch.object(self.ds, 'fetch_remote_objects', return_value={'a': {'id': 'a'}})
+        self.fetch_remote_objects = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_found_cached(self):
+        self.assertEquals(self.ds.get_object_map(['a', 'free text']), {'a': {'id': 'a'}})
+        self.assertEquals(self.ds.get_object_map(['a', 'free text']), {'a': {'id': 'a'}})
+        self.fetch_remote_objects.assert_called_once_with({'a', 'free text'})
+
+    def test_stale_served_and_refreshed(self):
+        self.ds.get_object_map(['a'])
+        with mock.patch.object(self.ds, '_refresh_in_background') as refresh:
+            self.assertEquals(self.ds.get_object_map(['a']), {'a': {'id': 'a'}})
+            self.assertFalse(refresh.called)
+            with mock.patch('talks.events.typeahead.time.time', return_value=time.time() + 120):
+                self.assertEquals(self.ds.get_object_map(['a']), {'a': {'id': 'a'}})
+        refresh.assert_called_once_with({'a'})
+        self.assertEquals(self.fetch_remote_objects.call_count, 1)
+
+
+class TestResolveApiResources(TestCase):
+
+    def setUp(self):
+        self.event = factories.EventFactory.create(location='oxpoints:1', department_organiser='oxpoints:2')
+        patcher = mock.patch('talks.events.typeahead.DataSource.get_local_objects',
+                             side_effect=lambda id_list: ({}, set(id_list)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.threads = []
+
+    def fetch(self, id_list):
+        self.threads.append(threading.current_thread())
+        if 'oxpoints:1' in id_list:
+            raise ValueError("malformed response")
+        return {object_id: {'id': object_id} for object_id in id_list}
+
+    def test_fetched_concurrently(self):
+        with mock.patch('talks.events.typeahead.DataSource.fetch_missing_objects', side_effect=self.fetch):
+            resources.resolve_api_resources([self.event])
+        self.assertEquals(len(self.threads), 2)
+        self.assertNotIn(threading.current_thread(), self.threads)
+        # the failure of one lookup does not affect the others
+        self.assertIsNone(self.event.api_location)
+        self.assertEquals(self.event.api_organisation, {'id': 'oxpoints:2'})
+        self.assertEquals(self.event.api_topics, [])
+        self.assertIsNotNone(self.event._oxford_date)
+
+    def test_identity_map(self):
+        other = factories.EventFactory.create(location='oxpoints:2', department_organiser='oxpoints:2')
+        resource_map = resources.ResourceMap()
+        with mock.patch('talks.events.typeahead.DataSource.fetch_missing_objects', side_effect=self.fetch):
+            resources.resolve_api_resources([self.event], resource_map=resource_map)
+            resources.resolve_api_resources([other], resource_map=resource_map)
+        self.assertEquals(len(self.threads), 2)
+        self.assertEquals(other.api_location, {'id': 'oxpoints:2'})
+
+    def test_data_source_without_cache(self):
+        data_source = typeahead.DataSource(None, get_prefetch_url=mock.Mock())
+        resource_map = resources.ResourceMap()
+        with mock.patch('talks.events.typeahead.DataSource.fetch_missing_objects', side_effect=self.fetch):
+            resource_map.load([(data_source, ['a'])])
+        self.assertEquals(resource_map.get_object_map(data_source, ['a']), {'a': {'id': 'a'}})
+
+
+@mock.patch('talks.core.http.get', autospec=True)
 class TestDeclaredDataSources(unittest.TestCase):
     def test_location(self, requests_get):
         location_id = str(mock.sentinel.location_id)
@@ -1,11 +1,15 @@
 import json
 import logging
+import threading
+import time
 
-import requests
 from django import forms
 from django.utils.html import mark_safe
 from django.core.cache import caches as django_caches
 
+from talks.core import http
+from talks.core.caching import get_single_flight
+
 log = logging.getLogger(__name__)
 
 
@@ -80,6 +84,16 @@ def get_objects_from_response(response, expression=None, as_list=False):
     return json
 
 
+class CacheEntry(object):
+    """Object cached by a data source with a cache policy (value is None
+    if the object was not found), stale after `stale_at` (a timestamp)
+    """
+
+    def __init__(self, value, stale_at):
+        self.value = value
+        self.stale_at = stale_at
+
+
 class DataSource(object):
     """
     Represents external set of data reachable by HTTP.
@@ -87,7 +101,8 @@ class DataSource(object):
     """
 
     def __init__(self, cache_key=None, url=None, get_prefetch_url=None, local=None, id_key=None, display_key=None,
-                 response_expression=None, prefetch_response_expression=None, templates=None, as_list=False):
+                 response_expression=None, prefetch_response_expression=None, templates=None, as_list=False,
+                 mirror=None, soft_ttl=None, hard_ttl=None, negative_ttl=None):
         """
         :param cache_key: cache name to use
         :param url: url for fetching suggestions
@@ -99,6 +114,14 @@ class DataSource(object):
         :param prefetch_response_expression: same as `response_expression` but for prefetch response
         :param templates: dictionary of template strings to configure typeahead
         :param as_list: if true, convert a single result to a list of one
+        :param mirror: local copy of the remote objects, consulted before fetching them over HTTP
+        (an object with a `get_many(id_list)` method returning a dict, e.g. `OxPoint.objects`)
+        :param soft_ttl: seconds after which a cached object is stale: it is still returned,
+        but refreshed in the background (without a policy, objects are cached with the
+        default timeout of the cache and fetched again when they expire)
+        :param hard_ttl: seconds after which a cached object expires (defaults to `soft_ttl`)
+        :param negative_ttl: seconds during which ids not found by the remote API are
+        remembered, so that they are not requested again
         """
         self.cache_key = cache_key
         self.url = url
@@ -110,6 +133,16 @@ class DataSource(object):
         self.response_expression = response_expression
         self.prefetch_response_expression = prefetch_response_expression or response_expression
         self.as_list = as_list
+        self.mirror = mirror
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl or soft_ttl
+        self.negative_ttl = negative_ttl
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    @property
+    def has_cache_policy(self):
+        return bool(self.soft_ttl or self.negative_ttl)
 
     @property
     def is_local(self):
@@ -127,32 +160,153 @@ class DataSource(object):
         log.debug("get_object_list(%s)", id_list)
         return self._fetch_objects(id_list).values()
 
+    def get_object_map(self, id_list):
+        """
+        Get multiple objects at once, as a dictionary by id (missing objects are omitted).
+        """
+        log.debug("get_object_map(%s)", id_list)
+        return self._fetch_objects(id_list)
+
     def _fetch_objects(self, id_list):
         """
-        Fetch multiple objects by their id, but check if they are cached first. Update cache accordingly.
+        Fetch multiple objects by their id, but check if they are cached or mirrored first. Update cache accordingly.
         """
-        id_list = filter(None, id_list)
         log.debug("_fetch_objects(%s)", id_list)
-        objects = self.cache.get_many(id_list) if self.cache else []
-        missing = set(id_list) - set(objects)
-        log.debug("existing in cache: %s", objects)
-        log.debug("missing from cache: %s", missing)
+        objects, missing = self.get_local_objects(id_list)
         if missing:
-            url = self.get_prefetch_url(missing)
-            log.debug("prefetch_url: %s", url)
-            response = requests.get(url)
-            response.raise_for_status()
-            fetched = get_objects_from_response(response, self.prefetch_response_expression, self.as_list)
-            log.debug("fetched from response: %s", fetched)
-            log.debug("as list?: %r", self.as_list)
-            mapped = {obj[self.id_key]: obj for obj in fetched if obj[self.id_key] in id_list}
-            if mapped:
-                if self.cache:
-                    self.cache.set_many(mapped)
-            objects.update(mapped)
+            objects.update(self.fetch_missing_objects(missing))
         log.debug("returning objects: %s", objects)
         return objects
 
+    def get_local_objects(self, id_list):
+        """
+        Get objects from the cache or the mirror, without any request to the API
+        (stale objects are refreshed in the background)
+        :param id_list: ids of the objects
+        :return: tuple (dictionary of objects by id, set of ids to fetch with `fetch_missing_objects`)
+        """
+        id_list = filter(None, id_list)
+        objects, stale, missing = self._get_cached_objects(id_list)
+        log.debug("existing in cache: %s", objects)
+        log.debug("missing from cache: %s", missing)
+        if missing and self.mirror:
+            mirrored = self.mirror.get_many(missing)
+            log.debug("existing in mirror: %s", mirrored)
+            if mirrored:
+                self._cache_objects(mirrored)
+                objects.update(mirrored)
+                missing = missing - set(mirrored)
+        if stale:
+            self._refresh_in_background(stale)
+        return objects, missing
+
+    def _get_cached_objects(self, id_list):
+        """
+        :param id_list: ids of the objects
+        :return: tuple (dictionary of cached objects by id, set of ids
+        of the stale objects, set of ids missing from the cache)
+        """
+        cached = self.cache.get_many(id_list) if self.cache else {}
+        missing = set(id_list) - set(cached)
+        if not self.has_cache_policy:
+            return cached, set(), missing
+        now = time.time()
+        objects = {}
+        stale = set()
+        for object_id, entry in cached.items():
+            if not isinstance(entry, CacheEntry):
+                # cached without a policy
+                objects[object_id] = entry
+                continue
+            if entry.value is not None:
+                objects[object_id] = entry.value
+                if entry.stale_at <= now:
+                    stale.add(object_id)
+        return objects, stale, missing
+
+    def _cache_objects(self, objects, requested=()):
+        """
+        Store fetched objects in the cache, according to the cache policy
+        :param objects: dictionary of objects by id
+        :param requested: ids requested (those not in `objects` are cached as not found)
+        """
+        if not self.cache:
+            return
+        if not self.has_cache_policy:
+            if objects:
+                self.cache.set_many(objects)
+            return
+        now = time.time()
+        if objects and self.soft_ttl:
+            self.cache.set_many({object_id: CacheEntry(value, now + self.soft_ttl)
+                                 for object_id, value in objects.items()}, self.hard_ttl)
+        not_found = set(requested) - set(objects)
+        if not_found and self.negative_ttl:
+            self.cache.set_many({object_id: CacheEntry(None, now + self.negative_ttl)
+                                 for object_id in not_found}, self.negative_ttl)
+
+    def fetch_missing_objects(self, missing):
+        """
+        Fetch objects missing from the cache, concurrent fetches of the same objects
+        (in this process, or in other processes if configured) share a single request
+        :param missing: set of ids
+        :return: dictionary of objects by id
+        """
+        def fetch():
+            mapped = self.fetch_remote_objects(missing)
+            self._cache_objects(mapped, missing)
+            return mapped
+
+        def recheck():
+            # objects fetched by another process
+            objects, _, still_missing = self._get_cached_objects(list(missing))
+            return objects if not still_missing else None
+
+        key = (self.cache_key, tuple(sorted(missing)))
+        return get_single_flight().do(key, fetch, recheck)
+
+    def _refresh_in_background(self, stale):
+        """
+        Fetch stale objects again in a thread, unless they are already being refreshed
+        :param stale: set of ids
+        """
+        with self._refreshing_lock:
+            stale = stale - self._refreshing
+            self._refreshing.update(stale)
+        if not stale:
+            return
+
+        def refresh():
+            try:
+                self.fetch_missing_objects(stale)
+            except Exception:
+                log.warning("Unable to refresh %s", sorted(stale), exc_info=True)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.difference_update(stale)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def fetch_remote_objects(self, missing, id_list=None):
+        """
+        Fetch objects over HTTP, bypassing the cache and the mirror
+        :param missing: ids of the objects to fetch
+        :param id_list: ids of the objects to keep from the response (defaults to `missing`)
+        :return: dictionary of objects by id
+        """
+        if id_list is None:
+            id_list = list(missing)
+        url = self.get_prefetch_url(missing)
+        log.debug("prefetch_url: %s", url)
+        response = http.get(url)
+        response.raise_for_status()
+        fetched = get_objects_from_response(response, self.prefetch_response_expression, self.as_list)
+        log.debug("fetched from response: %s", fetched)
+        log.debug("as list?: %r", self.as_list)
+        return {obj[self.id_key]: obj for obj in fetched if obj[self.id_key] in id_list}
+
     @property
     def cache(self):
         if self.cache_key:
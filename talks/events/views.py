@@ -1,19 +1,23 @@
 import logging
-import functools
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 
+import requests
 from django.core.urlresolvers import reverse
 from django.http.response import Http404
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 from .models import Event, EventGroup, Person, TopicItem
 from talks.events.models import ROLES_SPEAKER, ROLES_HOST, ROLES_ORGANISER
+from talks.events.resources import get_resource_map, resolve_api_resources
 from talks.events.datasources import TOPICS_DATA_SOURCE, DEPARTMENT_DATA_SOURCE, DEPARTMENT_DESCENDANT_DATA_SOURCE
 from talks.users.models import COLLECTION_ROLES_OWNER, COLLECTION_ROLES_EDITOR, COLLECTION_ROLES_READER
 from .forms import BrowseEventsForm, BrowseSeriesForm
 from talks.api.services import events_search
-from talks.api_ox.api import OxfordDateResource
+from talks.api_ox.api import get_oxford_dates
+from talks.api_ox.models import OrganisationNode
+from talks.api_ox.dates import OxfordDate, format_date_heading, local_date
+from talks.core.pagination import get_keyset_page, parse_count, InvalidCursor
+from talks.core.utils import date_range
 
 logger = logging.getLogger(__name__)
 
@@ -45,14 +49,11 @@ def homepage(request):
         # Authenticated user
         collections = request.tuser.collections.all()
         if collections:
-            user_events = collections[0].get_all_events()
-            for collection in collections[1:]:
-                user_events = user_events | collection.get_all_events()
             context['collections'] = collections
-            user_events = user_events.filter(start__gte=today)
-            if (user_events.count() > HOMEPAGE_YOUR_TALKS_RESULTS_LIMIT):
+            user_events, more = request.tuser.get_next_events(today, HOMEPAGE_YOUR_TALKS_RESULTS_LIMIT)
+            if more:
                 context['user_events_more_link'] = True
-            context['user_events'] = user_events[:HOMEPAGE_YOUR_TALKS_RESULTS_LIMIT]
+            context['user_events'] = user_events
 
     return render(request, 'front.html', context)
 
@@ -74,14 +75,17 @@ def browse_events(request):
 
     browse_events_form = BrowseEventsForm(modified_request_parameters)
 
-    count = request.GET.get('count', 20)
-    page = request.GET.get('page', 1)
+    try:
+        count = parse_count(request.GET.get('count'))
+    except ValueError:
+        return redirect(reverse('browse_events'))
+    cursor = request.GET.get('cursor')
 
     if request.GET.get('limit_to_collections'):
         modified_request_parameters['limit_to_collections'] = request.tuser.collections.all()
 
     # used to build a URL fragment that does not
-    # contain "page" so that we can... paginate
+    # contain "cursor" so that we can... paginate
     args = {'count': count}
     for param in ('start_date', 'to', 'venue', 'organising_department', 'include_subdepartments', 'seriesid', 'limit_to_collections'):
         if modified_request_parameters.get(param):
@@ -92,10 +96,9 @@ def browse_events(request):
 
     events = events_search(modified_request_parameters)
 
-    paginator = Paginator(events, count)
     try:
-        events = paginator.page(page)
-    except (PageNotAnInteger, EmptyPage):
+        events = get_keyset_page(events, cursor, count)
+    except InvalidCursor:
         return redirect(reverse('browse_events'))
 
     grouped_events = group_events(events)
@@ -169,15 +172,15 @@ def browse_events(request):
                 tab['active'] = True
                 
     date_continued_previous = False
-    if int(page) != 1:
+    if events.has_previous() and len(events):
         # if the date of the first talk of the current page is the same with that of the last talk of the previous page
-        if list(events)[0].start.date()==list(paginator.page(int(page)-1))[-1].start.date():
+        if events.object_list[0].start.date() == events.previous_item.start.date():
             date_continued_previous = True
 
     date_continued_next = False
-    if paginator.num_pages != int(page):
+    if events.has_next() and len(events):
         # if the date of the last talk of the current page is the same with that of the first talk of the next page
-        if list(events)[-1].start.date()==list(paginator.page(int(page)+1))[0].start.date():
+        if events.object_list[-1].start.date() == events.next_item.start.date():
             date_continued_next = True
         
     context = {
@@ -196,22 +199,18 @@ def browse_events(request):
 def group_events (events):
     grouped_events = {}
     event_dates = []
+    events = list(events)
+    # resolve the oxford date of each distinct day only once (search
+    # results have their date heading and time stored in the index)
+    oxford_dates = get_oxford_dates(group_event.start for group_event in events
+                                    if not getattr(group_event, 'date_heading', None))
     for group_event in events:
-        hours = datetime.strftime(group_event.start, '%I')
-        minutes = datetime.strftime(group_event.start, ':%M')
-        if minutes==":00":
-            minutes = ""
-        ampm = datetime.strftime(group_event.start, '%p')
         group_event.display_time = group_event.formatted_time
-        # if there is no oxford_date field, events are search results
-        # we need to call date_to_oxford_date to create the oxford date
-        if not group_event.oxford_date:
-            group_event.oxford_date = date_to_oxford_date(group_event.start)
-
-        comps = group_event.oxford_date.components
-        key = comps['day_name']+ " " +str(comps['day_number'])+ " " +comps['month_long']+ " "
-        key+= str(comps['year'])+ " ("+ str(comps['week']) + comps['ordinal']+ " Week, " +comps['term_long']+ " Term)"
-        
+        key = getattr(group_event, 'date_heading', None)
+        if not key:
+            group_event.oxford_date = oxford_dates[local_date(group_event.start)]
+            key = format_date_heading(group_event.oxford_date.components)
+
         if key not in grouped_events:
             grouped_events[key] = []
             event_dates.append(key)
@@ -224,13 +223,7 @@ def group_events (events):
     return result_events
 
 def date_to_oxford_date(date_str):
-    func = functools.partial(OxfordDateResource.from_date, date_str)
-    try:
-        res = func()
-        return res
-    except ApiException:
-        logger.warn('Unable to reach API', exc_info=True)
-        return None
+    return OxfordDate.from_date(date_str)
 
 
 def upcoming_events(request):
@@ -240,25 +233,33 @@ def upcoming_events(request):
 
 
 def events_for_year(request, year):
-    events = Event.objects.filter(start__year=year)
-    return _events_list(request, events)
+    return _events_in_range(request, year)
 
 
 def events_for_month(request, year, month):
-    events = Event.objects.filter(start__year=year,
-                                    start__month=month)
-    return _events_list(request, events)
+    return _events_in_range(request, year, month)
 
 
 def events_for_day(request, year, month, day):
-    events = Event.objects.filter(start__year=year,
-                                    start__month=month,
-                                    start__day=day)
+    return _events_in_range(request, year, month, day)
+
+
+def _events_in_range(request, year, month=None, day=None):
+    try:
+        start, end = date_range(year, month, day)
+    except ValueError:
+        raise Http404
+    events = Event.objects.filter(start__gte=start, start__lt=end)
     return _events_list(request, events)
 
 
 def _events_list(request, events):
-    context = {'events': events}
+    try:
+        count = parse_count(request.GET.get('count'))
+        page = get_keyset_page(events, request.GET.get('cursor'), count)
+    except (InvalidCursor, ValueError):
+        return redirect(request.path)
+    context = {'events': page, 'fragment': 'count={count}'.format(count=count)}
     return render(request, 'events/events.html', context)
 
 
@@ -275,6 +276,8 @@ def show_event(request, event_slug):
             'department_organiser').get(slug=event_slug)
     except Event.DoesNotExist:
         raise Http404
+    # venue, department, topics and date are looked up at once
+    resolve_api_resources([ev], resource_map=get_resource_map(request))
 
     context = {
         'event': ev,
@@ -366,7 +369,11 @@ def show_person(request, person_slug):
 
 def show_topic(request):
     topic_uri = request.GET.get('uri')
-    api_topic = TOPICS_DATA_SOURCE.get_object_by_id(topic_uri)
+    try:
+        api_topic = TOPICS_DATA_SOURCE.get_object_by_id(topic_uri)
+    except requests.RequestException:
+        logger.warning("Error retrieving topic %s", topic_uri, exc_info=True)
+        api_topic = {'uri': topic_uri}
     events = Event.objects.filter(topics__uri=topic_uri).order_by('start')
 
     #RB 3/5/16 get filtered by current talks in topic
@@ -393,8 +400,12 @@ def list_topics(request):
     for topic in topics.all():
         events = Event.objects.filter(topics__uri=topic.uri)
         if(len(events)>0):
-            api_topic = TOPICS_DATA_SOURCE.get_object_by_id(topic.uri)
-            if api_topic not in topics_results:
+            try:
+                api_topic = TOPICS_DATA_SOURCE.get_object_by_id(topic.uri)
+            except requests.RequestException:
+                logger.warning("Error retrieving topic %s, not listing it", topic.uri, exc_info=True)
+                continue
+            if api_topic and api_topic not in topics_results:
                 topics_results.append(api_topic)
 
     topics_results.sort(key=lambda topic:topic['prefLabel'])
@@ -406,7 +417,11 @@ def list_topics(request):
     return render(request, 'events/topic_list.html', context)
 
 def show_department_organiser(request, org_id):
-    org = DEPARTMENT_DATA_SOURCE.get_object_by_id(org_id)
+    try:
+        org = DEPARTMENT_DATA_SOURCE.get_object_by_id(org_id)
+    except requests.RequestException:
+        logger.warning("Error retrieving department %s", org_id, exc_info=True)
+        org = {'id': org_id, 'name': org_id}
     events = Event.objects.filter(department_organiser=org_id).order_by('start')
 
     show_all = request.GET.get('show_all', False)
@@ -427,18 +442,28 @@ def show_department_organiser(request, org_id):
 
 
 def show_department_descendant(request, org_id):
-    org = DEPARTMENT_DATA_SOURCE.get_object_by_id(org_id)
     try:
-        results = DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_by_id(org_id)
-        descendants = results['descendants']
-        sub_orgs = descendants
-        ids = [o['id'] for o in sub_orgs]
-        ids.append(results['id'])  # Include self
+        org = DEPARTMENT_DATA_SOURCE.get_object_by_id(org_id)
+    except requests.RequestException:
+        logger.warning("Error retrieving department %s", org_id, exc_info=True)
+        org = {'id': org_id, 'name': org_id, '_links': {}}
+    try:
+        node = OrganisationNode.objects.get(id=org_id)
+        sub_orgs = list(node.get_descendants().order_by('title').values('id', 'title'))
+        ids, _ = OrganisationNode.objects.descendant_ids([org_id])
         events = Event.objects.filter(department_organiser__in=ids).order_by('start')
-    except Exception:
-        print "Error retrieving sub-departments, only showing department"
-        events = Event.objects.filter(department_organiser=org).order_by('start')
-        sub_orgs = []
+    except OrganisationNode.DoesNotExist:
+        try:
+            results = DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_by_id(org_id)
+            descendants = results['descendants']
+            sub_orgs = descendants
+            ids = [o['id'] for o in sub_orgs]
+            ids.append(results['id'])  # Include self
+            events = Event.objects.filter(department_organiser__in=ids).order_by('start')
+        except Exception:
+            print "Error retrieving sub-departments, only showing department"
+            events = Event.objects.filter(department_organiser=org_id).order_by('start')
+            sub_orgs = []
 
     show_all = request.GET.get('show_all', False)
     if not show_all:
@@ -449,7 +474,11 @@ def show_department_descendant(request, org_id):
     if org['_links'].has_key('parent'):
         parent_href = org['_links']['parent'][0]['href']
         parent_id = parent_href[parent_href.find("oxpoints"):]
-        parent = DEPARTMENT_DATA_SOURCE.get_object_by_id(parent_id)
+        try:
+            parent = DEPARTMENT_DATA_SOURCE.get_object_by_id(parent_id)
+        except requests.RequestException:
+            logger.warning("Error retrieving department %s", parent_id, exc_info=True)
+            parent = None
     else:
         parent = None
 
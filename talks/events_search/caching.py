@@ -0,0 +1,65 @@
+"""Cache of the searches, keyed by the normalized query, selected facets
+and date filter, storing what is fetched from the search index to render
+the first page of results (facet counts, hits, spelling suggestion).
+
+Keys include a generation number, incremented whenever events are indexed
+(see `talks.events_search.indexing.index_events`), so that updating the
+index invalidates all the cached searches at once.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+
+CACHE_NAME = 'search'
+GENERATION_KEY = 'events_search:generation'
+
+
+def _new_generation():
+    # larger than any generation used before the counter was evicted
+    return int(time.time() * 1000)
+
+
+def get_generation():
+    """
+    :return: current generation of the search index
+    """
+    cache = caches[CACHE_NAME]
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate_searches():
+    """Invalidate all the cached searches (called when the index changes)
+    """
+    cache = caches[CACHE_NAME]
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _new_generation(), None)
+
+
+def get_search_key(name, query_dict):
+    """Build the key of a search, equivalent searches get the same key
+    (the case and spacing of the query, the order of the facets do not matter)
+    :param name: name of the view (views do not cache the same data)
+    :param query_dict: QueryDict of the request
+    :return: string
+    """
+    query = u' '.join(query_dict.get('q', u'').lower().split())
+    facets = sorted(set(facet.strip() for facet in query_dict.getlist('selected_facets') if facet.strip()))
+    filtered_date = query_dict.get('filtered_date') or u''
+    digest = hashlib.md5(json.dumps([name, query, facets, filtered_date]).encode('utf-8')).hexdigest()
+    return u'search:{generation}:{digest}'.format(generation=get_generation(), digest=digest)
+
+
+def get_search(key):
+    return caches[CACHE_NAME].get(key)
+
+
+def set_search(key, data):
+    caches[CACHE_NAME].set(key, data)
@@ -5,6 +5,7 @@ Very specific to Solr unfortunately
 
 from collections import OrderedDict
 
+from django.conf import settings
 from haystack.query import SearchQuerySet
 from datetime import datetime
 
@@ -34,3 +35,12 @@ sqs_past = (SearchQuerySet()
 # add all the facet start date queries to the queryset
 for v in FACET_START_DATE.itervalues():
     sqs = sqs.query_facet('start', v['solr_query'])
+
+
+def get_index_queue_settings():
+    """Settings of the index queue (see SEARCH_INDEX_QUEUE), with defaults
+    """
+    conf = getattr(settings, 'SEARCH_INDEX_QUEUE', {})
+    return {'BATCH_SIZE': conf.get('BATCH_SIZE', 100),
+            'COMMIT_WITHIN': conf.get('COMMIT_WITHIN', 10000),
+            'MAX_LAG': conf.get('MAX_LAG', 600)}
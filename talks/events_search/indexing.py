@@ -0,0 +1,95 @@
+"""Sending events to the search index in batches, used by the
+`process_index_queue` and `reindex_events` management commands
+"""
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from haystack import connections, connection_router
+from haystack.exceptions import SkipDocument
+from haystack.utils import get_model_ct
+
+from talks.events.models import Event
+from talks.events.resources import prefetch_events
+from talks.events_search.caching import invalidate_searches
+
+
+def prefetch_public_collections(events):
+    """Load the ids of the public collections containing each event
+    (see `Event.public_collections_containing_this_event`) with one query,
+    they are then used by `EventIndex.prepare`
+    :param events: list of Event
+    """
+    from talks.users.models import CollectionItem
+    collection_ids = defaultdict(list)
+    items = (CollectionItem.objects.filter(content_type=ContentType.objects.get_for_model(Event),
+                                           object_id__in=[event.id for event in events],
+                                           collection__public=True)
+             .order_by('collection_id').values_list('object_id', 'collection_id'))
+    for event_id, collection_id in items:
+        collection_ids[event_id].append(collection_id)
+    for event in events:
+        event._public_collection_ids = collection_ids[event.id]
+
+
+def load_events(ids):
+    """Load events with everything needed to index them
+    :param ids: list of Event ids
+    :return: list of Event (deleted events are omitted)
+    """
+    events = prefetch_events(Event.objects.filter(id__in=ids).select_related('group'))
+    prefetch_public_collections(events)
+    return events
+
+
+def update_documents(backend, index, events, commit_within=None):
+    """Add or replace the documents of events in one request
+    :param backend: haystack search backend
+    :param index: EventIndex
+    :param events: list of Event
+    :param commit_within: milliseconds within which Solr should commit the
+    documents (instead of committing immediately), ignored by other backends
+    """
+    conn = getattr(backend, 'conn', None)
+    if not commit_within or conn is None:
+        backend.update(index, events)
+        return
+    docs = []
+    for event in events:
+        try:
+            docs.append(index.full_prepare(event))
+        except SkipDocument:
+            pass
+    if docs:
+        conn.add(docs, commit=False, commitWithin=commit_within, boost=index.get_field_weights())
+
+
+def remove_documents(backend, event_ids):
+    """Remove the documents of deleted events
+    :param backend: haystack search backend
+    :param event_ids: list of ids
+    """
+    for event_id in event_ids:
+        backend.remove(u"{ct}.{id}".format(ct=get_model_ct(Event), id=event_id), commit=False)
+    conn = getattr(backend, 'conn', None)
+    if event_ids and conn is not None:
+        conn.commit()
+
+
+def index_events(ids, commit_within=None):
+    """Update the documents of events in all the search indexes,
+    and remove the documents of the events which no longer exist
+    (cached searches are invalidated)
+    :param ids: list of Event ids
+    :param commit_within: see `update_documents`
+    :return: number of events indexed
+    """
+    events = load_events(ids)
+    deleted = sorted(set(ids) - set(event.id for event in events))
+    for using in connection_router.for_write():
+        backend = connections[using].get_backend()
+        index = connections[using].get_unified_index().get_index(Event)
+        if events:
+            update_documents(backend, index, events, commit_within)
+        remove_documents(backend, deleted)
+    invalidate_searches()
+    return len(events)
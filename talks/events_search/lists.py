@@ -0,0 +1,40 @@
+"""Titles of the public lists (collections), which are indexed by id
+(see `EventIndex.lists`) so that editing a list does not require
+reindexing its events. The titles are resolved when displaying the
+facets from a map cached until a collection is saved or deleted.
+"""
+from django.core.cache import caches
+
+CACHE_NAME = 'default'
+CACHE_KEY = 'events_search:public-list-titles'
+CACHE_TIMEOUT = 3600
+
+
+def get_public_list_titles():
+    """
+    :return: dictionary of the titles of the public collections by id (as string,
+    the value of the facet)
+    """
+    from talks.users.models import Collection
+    cache = caches[CACHE_NAME]
+    titles = cache.get(CACHE_KEY)
+    if titles is None:
+        titles = {unicode(collection_id): title
+                  for collection_id, title in Collection.objects.filter(public=True).values_list('id', 'title')}
+        cache.set(CACHE_KEY, titles, CACHE_TIMEOUT)
+    return titles
+
+
+def invalidate_public_list_titles():
+    caches[CACHE_NAME].delete(CACHE_KEY)
+
+
+def resolve_list_facets(facet_counts):
+    """Replace the ids of the lists facet by their titles
+    :param facet_counts: list of tuples (collection id, count)
+    :return: list of tuples (collection id, count, title), omitting
+    collections which are no longer public
+    """
+    titles = get_public_list_titles()
+    return [(collection_id, count, titles[collection_id])
+            for collection_id, count in facet_counts if collection_id in titles]
@@ -0,0 +1,85 @@
+import logging
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from talks.events_search.conf import get_index_queue_settings
+from talks.events_search.indexing import index_events
+from talks.events_search.models import IndexQueueEntry
+
+logger = logging.getLogger(__name__)
+
+
+def process_batch(batch_size, commit_within=None):
+    """Index the events queued first
+    :param batch_size: maximum number of events
+    :param commit_within: see `talks.events_search.indexing.update_documents`
+    :return: number of events processed
+    """
+    entries = IndexQueueEntry.objects.next_batch(batch_size)
+    if not entries:
+        return 0
+    index_events([entry.event_id for entry in entries], commit_within)
+    IndexQueueEntry.objects.done(entries)
+    return len(entries)
+
+
+class Command(BaseCommand):
+    help = "Update the search index with the events of the index queue"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    dest='batch_size',
+                    type='int',
+                    default=None,
+                    help='Number of events sent to the search index at once'),
+        make_option('--commit-within',
+                    dest='commit_within',
+                    type='int',
+                    default=None,
+                    help='Milliseconds within which Solr commits updates (0 to commit each batch)'),
+        make_option('--once',
+                    action='store_true',
+                    dest='once',
+                    default=False,
+                    help='Exit when the queue is empty instead of waiting for more events'),
+        make_option('--sleep',
+                    dest='sleep',
+                    type='float',
+                    default=5,
+                    help='Seconds to wait when the queue is empty or the search index fails'),
+        make_option('--stats',
+                    action='store_true',
+                    dest='stats',
+                    default=False,
+                    help='Only display the depth and lag of the queue'),
+    )
+
+    def handle(self, *args, **options):
+        conf = get_index_queue_settings()
+        batch_size = options['batch_size'] or conf['BATCH_SIZE']
+        commit_within = options['commit_within']
+        if commit_within is None:
+            commit_within = conf['COMMIT_WITHIN']
+
+        if options['stats']:
+            self.stdout.write("depth={depth} lag={lag:.0f}s".format(**IndexQueueEntry.objects.stats()))
+            return
+
+        processed = 0
+        while True:
+            try:
+                count = process_batch(batch_size, commit_within)
+            except Exception as e:
+                if options['once']:
+                    raise CommandError("Unable to update the search index: {message}".format(message=e))
+                logger.error("Unable to update the search index", exc_info=True)
+                time.sleep(options['sleep'])
+                continue
+            processed += count
+            if not count:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        self.stdout.write("Indexed {count} events".format(count=processed))
@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connections as db_connections
+from haystack import connections, connection_router
+
+from talks.core import http
+from talks.events.models import Event
+from talks.events_search.indexing import index_events
+
+logger = logging.getLogger(__name__)
+
+
+def index_chunk(args):
+    """Index a chunk of events (run in a worker process)
+    :param args: tuple (list of Event ids, commit_within)
+    :return: number of events in the chunk
+    """
+    ids, commit_within = args
+    index_events(ids, commit_within)
+    return len(ids)
+
+
+def _close_connections():
+    # connections must not be shared with the worker processes
+    for conn in db_connections.all():
+        conn.close()
+    http.close_sessions()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of events in chunks, optionally in several processes"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    dest='chunk_size',
+                    type='int',
+                    default=500,
+                    help='Number of events loaded and sent to the search index at once'),
+        make_option('--workers',
+                    dest='workers',
+                    type='int',
+                    default=1,
+                    help='Number of processes indexing chunks in parallel'),
+        make_option('--commit-within',
+                    dest='commit_within',
+                    type='int',
+                    default=60000,
+                    help='Milliseconds within which Solr commits updates (0 to commit each chunk)'),
+        make_option('--clear',
+                    action='store_true',
+                    dest='clear',
+                    default=False,
+                    help='Remove all the documents from the search index first'),
+    )
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        workers = max(options['workers'], 1)
+        commit_within = options['commit_within']
+
+        if options['clear']:
+            for using in connection_router.for_write():
+                connections[using].get_backend().clear(models=[Event])
+
+        ids = list(Event.objects.order_by('id').values_list('id', flat=True))
+        chunks = [(ids[i:i + chunk_size], commit_within) for i in range(0, len(ids), chunk_size)]
+
+        started = time.time()
+        indexed = 0
+        if workers == 1:
+            results = (index_chunk(chunk) for chunk in chunks)
+            pool = None
+        else:
+            _close_connections()
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(index_chunk, chunks)
+        try:
+            for count in results:
+                indexed += count
+                elapsed = time.time() - started
+                logger.info("Indexed %d/%d events (%.1f events/s)", indexed, len(ids),
+                            indexed / elapsed if elapsed else 0)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        for using in connection_router.for_write():
+            backend = connections[using].get_backend()
+            conn = getattr(backend, 'conn', None)
+            if conn is not None:
+                conn.commit()
+
+        elapsed = time.time() - started
+        self.stdout.write("Indexed {count} events in {elapsed:.1f}s ({rate:.1f} events/s)".format(
+            count=indexed, elapsed=elapsed, rate=indexed / elapsed if elapsed else 0))
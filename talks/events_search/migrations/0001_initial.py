@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexQueueEntry',
+            fields=[
+                ('event_id', models.IntegerField(serialize=False, primary_key=True)),
+                ('queued', models.DateTimeField(db_index=True)),
+                ('updated', models.DateTimeField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,84 @@
+import operator
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+# number of ids in a single `IN` clause (SQLite limits the number of parameters)
+CHUNK_SIZE = 500
+
+
+def _chunks(id_list):
+    for i in range(0, len(id_list), CHUNK_SIZE):
+        yield id_list[i:i + CHUNK_SIZE]
+
+
+class IndexQueueManager(models.Manager):
+
+    def mark(self, event_ids):
+        """Record that events need to be (re-)indexed. An event already
+        in the queue is not added again, only its `updated` time changes.
+        :param event_ids: iterable of Event ids (including deleted events)
+        """
+        now = timezone.now()
+        ids = sorted(set(event_ids))
+        for chunk in _chunks(ids):
+            with transaction.atomic():
+                existing = set(self.filter(event_id__in=chunk).values_list('event_id', flat=True))
+                if existing:
+                    self.filter(event_id__in=existing).update(updated=now)
+                new = [event_id for event_id in chunk if event_id not in existing]
+                try:
+                    with transaction.atomic():
+                        self.bulk_create([self.model(event_id=event_id, queued=now, updated=now)
+                                          for event_id in new])
+                except IntegrityError:
+                    # queued by another process in the meantime
+                    for event_id in new:
+                        with transaction.atomic():
+                            _, created = self.get_or_create(event_id=event_id,
+                                                            defaults={'queued': now, 'updated': now})
+                            if not created:
+                                self.filter(event_id=event_id).update(updated=now)
+
+    def next_batch(self, size):
+        """
+        :param size: maximum number of entries
+        :return: list of the entries queued first
+        """
+        return list(self.order_by('queued', 'event_id')[:size])
+
+    def done(self, entries):
+        """Remove indexed entries from the queue, unless their event
+        was marked again since they were read
+        :param entries: list of IndexQueueEntry (from `next_batch`)
+        """
+        if entries:
+            self.filter(reduce(operator.or_, [Q(event_id=entry.event_id, updated=entry.updated)
+                                              for entry in entries])).delete()
+
+    def stats(self):
+        """
+        :return: dictionary with the number of events to index ('depth') and
+        the number of seconds the oldest has been waiting ('lag')
+        """
+        depth = self.count()
+        oldest = self.order_by('queued').values_list('queued', flat=True).first()
+        lag = (timezone.now() - oldest).total_seconds() if oldest else 0
+        return {'depth': depth, 'lag': lag}
+
+
+class IndexQueueEntry(models.Model):
+    """Event to update (or remove) in the search index,
+    processed by the `process_index_queue` management command
+    """
+    event_id = models.IntegerField(primary_key=True)
+    # when the event was first marked since it was last indexed
+    queued = models.DateTimeField(db_index=True)
+    # when the event was last marked
+    updated = models.DateTimeField()
+
+    objects = IndexQueueManager()
+
+    def __unicode__(self):
+        return u"Event {id}".format(id=self.event_id)
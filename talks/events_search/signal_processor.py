@@ -1,12 +1,36 @@
 # Custom signal processor for event changes
-# If an event is saved, upate it in the default way.
-# If a list is saved, update affected events
+# Changes are not sent to the search index during the request: the events
+# affected are recorded in the index queue (see models.IndexQueueEntry),
+# which is processed by the `process_index_queue` management command.
+# If an event is saved or deleted, queue it.
+# Lists are indexed by id (see lists.py): if a list is made public or
+# private, or deleted, queue its events; other changes to a list only
+# invalidate the cached titles.
 
-from talks.events.models import Event
-from talks.users.models import Collection, CollectionItem
+from talks.events.models import Event, EventGroup
+from talks.users.models import Collection, CollectionItem, CollectedDepartment
 from django.db import models
 from haystack import signals
-from haystack.exceptions import NotHandled
+
+from .lists import invalidate_public_list_titles
+from .models import IndexQueueEntry
+
+
+def get_item_event_ids(item):
+	"""Get the ids of the events of an item of a collection
+	:param item: Event, EventGroup or CollectedDepartment
+	:return: list of ids
+	"""
+	if isinstance(item, Event):
+		return [item.id]
+	elif isinstance(item, EventGroup):
+		return list(item.events.values_list('id', flat=True))
+	elif isinstance(item, CollectedDepartment):
+		from talks.api.services import get_all_department_ids
+		department_ids = get_all_department_ids([item.department], True)
+		return list(Event.objects.filter(department_organiser__in=department_ids).values_list('id', flat=True))
+	return []
+
 
 class EventUpdateSignalProcessor(signals.BaseSignalProcessor):
 	def setup(self):
@@ -15,9 +39,11 @@ class EventUpdateSignalProcessor(signals.BaseSignalProcessor):
 		models.signals.post_delete.connect(self.handle_delete, sender=Event)
 		
 		# connect list save to handler for collection
+		models.signals.pre_save.connect(self.handle_pre_save_list, sender=Collection)
 		models.signals.post_save.connect(self.handle_save_list, sender=Collection)
-		# removing a list treated same as updating it - we just update the affected talks
-		models.signals.post_delete.connect(self.handle_save_list, sender=Collection)
+		# removing a list - we just update the affected talks
+		# (before it is deleted, as its events are deleted with it)
+		models.signals.pre_delete.connect(self.handle_delete_list, sender=Collection)
 		
 		# update when talk is added/removed from a collection
 		models.signals.post_save.connect(self.handle_change_collectionItem, sender=CollectionItem)
@@ -27,37 +53,37 @@ class EventUpdateSignalProcessor(signals.BaseSignalProcessor):
 		# disconnect event/collection save/delete
 		models.signals.post_save.disconnect(self.handle_save, sender=Event)
 		models.signals.post_delete.disconnect(self.handle_delete, sender=Event)
+		models.signals.pre_save.disconnect(self.handle_pre_save_list, sender=Collection)
 		models.signals.post_save.disconnect(self.handle_save_list, sender=Collection)
-		models.signals.post_delete.disconnect(self.handle_save_list, sender=Collection)
+		models.signals.pre_delete.disconnect(self.handle_delete_list, sender=Collection)
 		models.signals.post_save.disconnect(self.handle_change_collectionItem, sender=CollectionItem)
 		models.signals.post_delete.disconnect(self.handle_change_collectionItem, sender=CollectionItem)
-		
-	def handle_save_list(self, sender, instance, **kwargs):
-		# update the each event from the list in each index
-		events = instance.get_all_events()
-		using_backends = self.connection_router.for_write(instance=instance)
-
-		for event in events.all():
-			for using in using_backends:
-				try:
-					index = self.connections[using].get_unified_index().get_index(event.__class__)
-					index.update_object(event, using=using)
-				except Exception:
-					# TODO: Maybe log it or let the exception bubble?
-					print "NOT HANDLED"
-					pass
+
+	def handle_save(self, sender, instance, **kwargs):
+		IndexQueueEntry.objects.mark([instance.id])
+
+	def handle_delete(self, sender, instance, **kwargs):
+		IndexQueueEntry.objects.mark([instance.id])
+
+	def handle_pre_save_list(self, sender, instance, **kwargs):
+		# remember whether the list was public, to know if its events need to be reindexed
+		previous = Collection.objects.filter(pk=instance.pk).values_list('public', flat=True) if instance.pk else []
+		instance._was_public = bool(previous and previous[0])
+
+	def handle_save_list(self, sender, instance, created, **kwargs):
+		invalidate_public_list_titles()
+		# a new list has no events yet
+		if not created and instance.public != getattr(instance, '_was_public', None):
+			IndexQueueEntry.objects.mark(instance.get_all_events().values_list('id', flat=True))
+
+	def handle_delete_list(self, sender, instance, **kwargs):
+		invalidate_public_list_titles()
+		if instance.public:
+			IndexQueueEntry.objects.mark(instance.get_all_events().values_list('id', flat=True))
 	
 	def handle_change_collectionItem(self, sender, instance, **kwargs):
-		#re-index the affected event
+		# re-index the affected events (only public lists are indexed)
+		collection = Collection.objects.filter(id=instance.collection_id, public=True).first()
 		item = instance.item
-		
-		using_backends = self.connection_router.for_write(instance=instance)
-
-
-		for using in using_backends:
-			try:
-				index = self.connections[using].get_unified_index().get_index(item.__class__)
-				index.update_object(item, using=using)
-			except Exception:
-				print "NOT HANDLED"
-				pass
+		if collection and item:
+			IndexQueueEntry.objects.mark(get_item_event_ids(item))
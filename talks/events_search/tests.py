@@ -0,0 +1,246 @@
+from datetime import datetime
+
+import mock
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.http import Http404, QueryDict
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.timezone import utc
+from haystack.models import SearchResult
+
+from talks.events import factories
+from talks.events.models import Event
+from talks.events.search_indexes import EventIndex
+from talks.events.views import group_events
+from talks.users.models import Collection
+from . import indexing
+from .caching import GENERATION_KEY, get_search_key
+from .lists import get_public_list_titles, resolve_list_facets
+from .management.commands import process_index_queue, reindex_events
+from .models import IndexQueueEntry
+from .views import get_results_page, SearchPastView, SearchUpcomingView
+
+
+class TestIndexQueue(TestCase):
+
+    def test_coalesce(self):
+        IndexQueueEntry.objects.mark([1, 2])
+        first = IndexQueueEntry.objects.get(event_id=1)
+        IndexQueueEntry.objects.mark([1, 1, 3])
+        self.assertEquals(IndexQueueEntry.objects.count(), 3)
+        again = IndexQueueEntry.objects.get(event_id=1)
+        self.assertEquals(again.queued, first.queued)
+        self.assertTrue(again.updated > first.updated)
+
+    def test_marked_again_while_processed(self):
+        IndexQueueEntry.objects.mark([1, 2])
+        entries = IndexQueueEntry.objects.next_batch(10)
+        IndexQueueEntry.objects.mark([2])
+        IndexQueueEntry.objects.done(entries)
+        self.assertEquals(list(IndexQueueEntry.objects.values_list('event_id', flat=True)), [2])
+
+    def test_stats(self):
+        self.assertEquals(IndexQueueEntry.objects.stats(), {'depth': 0, 'lag': 0})
+        IndexQueueEntry.objects.mark([1, 2])
+        self.assertEquals(IndexQueueEntry.objects.stats()['depth'], 2)
+
+
+class TestSignalProcessor(TestCase):
+
+    def test_event_saved(self):
+        event = factories.EventFactory.create()
+        self.assertTrue(IndexQueueEntry.objects.filter(event_id=event.id).exists())
+
+    def test_collection_deleted(self):
+        event = factories.EventFactory.create()
+        collection = Collection.objects.create(title="List", public=True)
+        collection.add_item(event)
+        IndexQueueEntry.objects.all().delete()
+        collection.delete()
+        self.assertTrue(IndexQueueEntry.objects.filter(event_id=event.id).exists())
+
+    def test_collection_renamed(self):
+        event = factories.EventFactory.create()
+        collection = Collection.objects.create(title="List", public=True)
+        collection.add_item(event)
+        IndexQueueEntry.objects.all().delete()
+        collection.title = "Renamed"
+        collection.save()
+        self.assertFalse(IndexQueueEntry.objects.exists())
+        self.assertEquals(get_public_list_titles()[unicode(collection.id)], "Renamed")
+
+    def test_collection_made_private(self):
+        event = factories.EventFactory.create()
+        collection = Collection.objects.create(title="List", public=True)
+        collection.add_item(event)
+        IndexQueueEntry.objects.all().delete()
+        collection.public = False
+        collection.save()
+        self.assertTrue(IndexQueueEntry.objects.filter(event_id=event.id).exists())
+
+
+class TestListFacets(TestCase):
+
+    def test_resolve_titles(self):
+        public = Collection.objects.create(title="Public", public=True)
+        private = Collection.objects.create(title="Private", public=False)
+        facets = [(unicode(public.id), 3), (unicode(private.id), 2)]
+        self.assertEquals(resolve_list_facets(facets), [(unicode(public.id), 3, "Public")])
+
+
+class TestProcessIndexQueue(TestCase):
+
+    def setUp(self):
+        self.event = factories.EventFactory.create(title="Indexed")
+        IndexQueueEntry.objects.mark([self.event.id, 12345])
+        self.backend = mock.Mock()
+        self.index = mock.Mock()
+        self.index.full_prepare.side_effect = lambda event: {'id': event.id}
+        connection = mock.Mock()
+        connection.get_backend.return_value = self.backend
+        connection.get_unified_index.return_value.get_index.return_value = self.index
+        patcher = mock.patch.object(indexing, 'connections', {'default': connection})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batch(self):
+        self.assertEquals(process_index_queue.process_batch(10, commit_within=5000), 2)
+        self.backend.conn.add.assert_called_once_with([{'id': self.event.id}], commit=False, commitWithin=5000,
+                                                      boost=self.index.get_field_weights())
+        self.backend.remove.assert_called_once_with(u"events.event.12345", commit=False)
+        self.assertEquals(IndexQueueEntry.objects.count(), 0)
+
+    def test_failure_keeps_queue(self):
+        self.backend.conn.add.side_effect = IOError("Solr is down")
+        self.assertRaises(IOError, process_index_queue.process_batch, 10, 5000)
+        self.assertEquals(IndexQueueEntry.objects.count(), 2)
+
+
+class TestReindexEvents(TestCase):
+
+    def setUp(self):
+        self.events = [factories.EventFactory.create(title="Event {0}".format(i)) for i in range(3)]
+        self.backend = mock.Mock()
+        self.index = mock.Mock()
+        self.index.full_prepare.side_effect = lambda event: {'id': event.id}
+        connection = mock.Mock()
+        connection.get_backend.return_value = self.backend
+        connection.get_unified_index.return_value.get_index.return_value = self.index
+        for module in (indexing, reindex_events):
+            patcher = mock.patch.object(module, 'connections', {'default': connection})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_public_collections_prefetched(self):
+        public = Collection.objects.create(title="Public", public=True)
+        public.add_item(self.events[0])
+        private = Collection.objects.create(title="Private", public=False)
+        private.add_item(self.events[0])
+        events = list(Event.objects.filter(id__in=[e.id for e in self.events]).order_by('id'))
+        with self.assertNumQueries(1):
+            indexing.prefetch_public_collections(events)
+        self.assertEquals(events[0]._public_collection_ids, [public.id])
+        self.assertEquals(events[1]._public_collection_ids, [])
+
+    def test_chunks(self):
+        call_command('reindex_events', chunk_size=2, workers=1, commit_within=5000)
+        self.assertEquals(self.backend.conn.add.call_count, 2)
+        indexed = [doc['id'] for call in self.backend.conn.add.call_args_list for doc in call[0][0]]
+        self.assertEquals(sorted(indexed), sorted(e.id for e in self.events))
+        self.backend.conn.commit.assert_called_once_with()
+
+
+class TestStoredFields(TestCase):
+
+    def test_search_result_rendered_from_index(self):
+        event = factories.EventFactory.create(title="Stored", start=datetime(2025, 1, 20, 14, 0, tzinfo=utc))
+        data = EventIndex().full_prepare(event)
+        self.assertEquals(data['date_heading'], "Monday 20 January 2025 (1st Week, Hilary Term)")
+        self.assertEquals(data['title_display'], "Stored")
+        result = SearchResult('events', 'event', event.id, 1.0, **data)
+        with self.assertNumQueries(0):
+            grouped = group_events([result])
+        self.assertEquals(grouped[0]['start_date'], data['date_heading'])
+        self.assertEquals(grouped[0]['gr_events'][0].display_time, event.formatted_time())
+
+
+class TestResultsPage(TestCase):
+
+    def setUp(self):
+        starts = [datetime(2025, 1, 20, 10, 0), datetime(2025, 1, 20, 14, 0),
+                  datetime(2025, 1, 21, 10, 0), datetime(2025, 1, 22, 10, 0)]
+        self.results = [mock.Mock(start=start.replace(tzinfo=utc)) for start in starts]
+
+    def test_first_page(self):
+        page = get_results_page(self.results, None, 1)
+        self.assertEquals(page.object_list, self.results[:1])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.date_continued_next())
+
+    def test_middle_page(self):
+        page = get_results_page(self.results, '2', 2)
+        self.assertEquals(page.object_list, self.results[2:4])
+        self.assertFalse(page.has_next())
+        self.assertFalse(page.date_continued_previous())
+
+    def test_invalid_page(self):
+        self.assertRaises(Http404, get_results_page, self.results, '4', 2)
+        self.assertRaises(Http404, get_results_page, self.results, 'next', 2)
+
+    def test_search_view(self):
+        factories.EventFactory.create(title="Paginated talk", start=datetime(2099, 1, 20, 10, 0, tzinfo=utc))
+        response = self.client.get('/search/', {'q': 'Paginated'})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['future_page'].number, 1)
+
+
+SEARCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'search': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-search'},
+}
+
+
+@override_settings(CACHES=SEARCH_CACHES)
+class TestSearchCache(TestCase):
+
+    def test_normalized_key(self):
+        key = get_search_key('view', QueryDict('q=Quantum%20%20Physics&selected_facets=b&selected_facets=a'))
+        self.assertEquals(key, get_search_key('view', QueryDict('selected_facets=a&selected_facets=b&q=quantum physics')))
+        self.assertNotEquals(key, get_search_key('view', QueryDict('q=quantum physics&filtered_date=past')))
+
+    def test_invalidated_by_indexing(self):
+        key = get_search_key('view', QueryDict('q=physics'))
+        with mock.patch.object(indexing, 'connections', {'default': mock.Mock()}):
+            indexing.index_events([])
+        self.assertNotEquals(key, get_search_key('view', QueryDict('q=physics')))
+
+    @override_settings(CACHES=dict(SEARCH_CACHES, search={'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                                          'LOCATION': 'test_search_cache'}))
+    def test_invalidated_by_other_process(self):
+        call_command('createcachetable')
+        key = get_search_key('view', QueryDict('q=physics'))
+        # the cache of the process_index_queue worker
+        worker_cache = DatabaseCache('test_search_cache', {})
+        worker_cache.incr(GENERATION_KEY)
+        self.assertNotEquals(key, get_search_key('view', QueryDict('q=physics')))
+
+    def test_first_page_cached(self):
+        factories.EventFactory.create(title="Cached talk", start=datetime(2099, 1, 20, 10, 0, tzinfo=utc))
+        fetch = SearchUpcomingView.fetch_search_data
+        with mock.patch.object(SearchUpcomingView, 'fetch_search_data', autospec=True, side_effect=fetch) as fetched:
+            first = self.client.get('/search/', {'q': 'Cached'})
+            second = self.client.get('/search/', {'q': ' cached '})
+        self.assertEquals(fetched.call_count, 1)
+        self.assertEquals(len(second.context['future_page']), len(first.context['future_page']))
+
+    def test_past_first_page_cached(self):
+        factories.EventFactory.create(title="Cached talk", start=datetime(2000, 1, 20, 10, 0, tzinfo=utc))
+        fetch = SearchPastView.fetch_search_data
+        with mock.patch.object(SearchPastView, 'fetch_search_data', autospec=True, side_effect=fetch) as fetched:
+            first = self.client.get('/search_past/', {'q': 'Cached'})
+            second = self.client.get('/search_past/', {'q': 'cached'})
+        self.assertEquals(fetched.call_count, 1)
+        self.assertEquals([result.pk for result in second.context['past_page']],
+                          [result.pk for result in first.context['past_page']])
@@ -2,10 +2,17 @@
 Custom search view, includes our custom dynamic faceting
 """
 
+from django.core.paginator import Paginator, Page
+from django.http import Http404
+from django.shortcuts import render_to_response
 from haystack.views import FacetedSearchView
 from datetime import datetime
 
+from talks.api_ox.dates import local_date
+
 from talks.events.views import group_events, date_to_oxford_date
+from .caching import get_search, get_search_key, set_search
+from .lists import resolve_list_facets
 
 
 class StartDateFacetItem(object):
@@ -24,6 +31,79 @@ class StartDateFacetItem(object):
         self.count = count
 
 
+class ResultsPage(object):
+    """Page of search results, with the results just before
+    and after it (used to tell if a day continues on another page)
+    """
+
+    def __init__(self, object_list, number, previous_item=None, next_item=None):
+        self.object_list = object_list
+        self.number = number
+        self.previous_item = previous_item
+        self.next_item = next_item
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self.previous_item is not None
+
+    def has_next(self):
+        return self.next_item is not None
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def date_continued_previous(self):
+        return bool(self.object_list) and self.has_previous() and \
+            local_date(self.object_list[0].start) == local_date(self.previous_item.start)
+
+    def date_continued_next(self):
+        return bool(self.object_list) and self.has_next() and \
+            local_date(self.object_list[-1].start) == local_date(self.next_item.start)
+
+
+def get_results_page(results, number, per_page):
+    """Fetch a page of results, and the results around it, in a single
+    request to the search index (the total number of results is not needed)
+    :param results: SearchQuerySet
+    :param number: page number (from the query string, starting at 1)
+    :param per_page: number of results per page
+    :return: ResultsPage
+    """
+    try:
+        number = int(number or 1)
+    except ValueError:
+        raise Http404("Not a valid number for page.")
+    if number < 1:
+        raise Http404("Pages should be 1 or greater.")
+    offset = (number - 1) * per_page
+    rows = list(results[max(offset - 1, 0):offset + per_page + 1])
+    previous_item = rows.pop(0) if offset and rows else None
+    if number > 1 and not rows:
+        raise Http404("No such page!")
+    next_item = rows.pop() if len(rows) > per_page else None
+    return ResultsPage(rows, number, previous_item, next_item)
+
+
+class CachedHits(object):
+    """Stands for the search results in the paginator of a page
+    rendered from the cache (only their number is used)
+    """
+
+    def __init__(self, count):
+        self._count = count
+
+    def count(self):
+        return self._count
+
+
 class SearchView(FacetedSearchView):
 
     def __init__(self, *args, **kwargs):
@@ -37,10 +117,57 @@ class SearchView(FacetedSearchView):
 
         return super(SearchView, self).build_form(form_kwargs)
 
+    def get_search_data(self):
+        """Get what is fetched from the search index to render the page,
+        from the cache for the first page of results
+        :return: dictionary
+        """
+        key = None
+        if self.query and self.request.GET.get('page', '1') == '1':
+            key = get_search_key(self.__class__.__name__, self.request.GET)
+            data = get_search(key)
+            if data is not None:
+                return data
+        data = self.fetch_search_data()
+        if key:
+            set_search(key, data)
+        return data
+
+    def fetch_search_data(self):
+        """Run the search
+        :return: dictionary with the hits of the page and their total number,
+        the facet counts and the spelling suggestion
+        """
+        paginator, page = self.build_page()
+        data = {
+            'number': page.number,
+            'hits': list(page.object_list),
+            'count': paginator.count,
+            'facets': self.results.facet_counts(),
+            'suggestion': None,
+        }
+        if self.results and hasattr(self.results, 'query') and self.results.query.backend.include_spelling:
+            data['suggestion'] = self.form.get_suggestion()
+        return data
+
+    def create_response(self):
+        self.search_data = self.get_search_data()
+        paginator = Paginator(CachedHits(self.search_data['count']), self.results_per_page)
+        context = {
+            'query': self.query,
+            'form': self.form,
+            'page': Page(self.search_data['hits'], self.search_data['number'], paginator),
+            'paginator': paginator,
+            'suggestion': self.search_data['suggestion'],
+        }
+        context.update(self.extra_context())
+        return render_to_response(self.template, context, context_instance=self.context_class(self.request))
+
     def extra_context(self):
         from .conf import FACET_START_DATE, SOLR_TO_NAME
 
-        extra = super(SearchView, self).extra_context()
+        # facets from the search data (which may be cached), rather than from self.results
+        extra = {'request': self.request, 'facets': dict(self.search_data['facets'])}
 
         if 'facets' in extra and 'queries' in extra['facets']:
             queries = extra['facets']['queries']
@@ -59,11 +186,35 @@ class SearchView(FacetedSearchView):
 
             extra['facet_date'] = ordered_dates
 
+        fields = extra['facets'].get('fields', {})
+        if fields.get('lists'):
+            extra['facets']['fields'] = dict(fields, lists=resolve_list_facets(fields['lists']))
 
         return extra
 
+    def results_page_context(self, page):
+        """Context to render a page of results grouped by day
+        :param page: ResultsPage
+        :return: dictionary
+        """
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        return {
+            'date_continued_previous': page.date_continued_previous(),
+            'date_continued_next': page.date_continued_next(),
+            'fragment': query.urlencode(),
+        }
+
 class SearchUpcomingView(SearchView):
-    
+
+    def fetch_search_data(self):
+        data = super(SearchUpcomingView, self).fetch_search_data()
+        now = datetime.now()
+        future_results = self.get_results().filter(start__gte=now).order_by('start')
+        # only a page of the future results is fetched from the search index
+        data['future_page'] = get_results_page(future_results, self.request.GET.get('page'), self.results_per_page)
+        return data
+
     def extra_context(self):
         extra = super(SearchUpcomingView, self).extra_context()
         
@@ -83,21 +234,28 @@ class SearchUpcomingView(SearchView):
         #     ampm = datetime.strftime(top_event.start, '%p')
         #     top_event.oxford_date_time = date_str +" "+ str(int(hours))+minutes+ampm.lower()
 
-        now = datetime.now()
-        extra['future_results'] = self.get_results().filter(start__gte=now).order_by('start')
+        page = self.search_data['future_page']
+        extra['future_page'] = page
+        extra['grouped_future_results'] = group_events(page.object_list)
+        extra.update(self.results_page_context(page))
 
-        # return all top results and future_results. These will be displayed on a single page.
-        
-        extra['grouped_future_results'] = group_events(extra['future_results'])
-        
         return extra
         
 class SearchPastView(SearchView):
 
+    def fetch_search_data(self):
+        data = super(SearchPastView, self).fetch_search_data()
+        # only a page of the past results is fetched from the search index
+        data['past_page'] = get_results_page(self.get_results(), self.request.GET.get('page'), self.results_per_page)
+        return data
+
     def extra_context(self):
         extra = super(SearchPastView, self).extra_context()
         
-        # pass all past events, grouped by date
-        extra['grouped_past_results'] = group_events(self.get_results())
+        # pass the page of past events, grouped by date
+        page = self.search_data['past_page']
+        extra['past_page'] = page
+        extra['grouped_past_results'] = group_events(page.object_list)
+        extra.update(self.results_page_context(page))
         
         return extra
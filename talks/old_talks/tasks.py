@@ -1,8 +1,9 @@
 import logging
 
-import requests
 from django.conf import settings
 
+from talks.core import http
+
 from talks.old_talks.models import (OldTalk, OldSeries, event_to_old_talk,
                                     get_list_id, group_to_old_series)
 
@@ -29,8 +30,8 @@ def update_old_talks(event):
 
         logger.debug("POSTing {data} to {url}".format(data=data, url=url))
 
-        response = requests.post(url, data, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
-                                 allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT)
+        response = http.post(url, data, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
+                             allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT, budgeted=False)
 
         if response.status_code == 200:
             if is_new:
@@ -58,8 +59,8 @@ def update_old_series(group, force_update):
         if new_group:
             group_xml = group_to_old_series(group)
             group_url = "{server}/list/api_create".format(server=settings.OLD_TALKS_SERVER)
-            response = requests.post(group_url, group_xml, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
-                                     allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT)
+            response = http.post(group_url, group_xml, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
+                                 allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT, budgeted=False)
             if response.status_code == 200:
                 old_series.old_series_id = get_list_id(response.content)
                 old_series.save()
@@ -68,8 +69,8 @@ def update_old_series(group, force_update):
         elif force_update:
             group_xml = group_to_old_series(group)
             group_url = "{server}/list/update/{id}".format(server=settings.OLD_TALKS_SERVER, id=old_series.old_series_id)
-            response = requests.post(group_url, group_xml, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
-                                     allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT)
+            response = http.post(group_url, group_xml, auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
+                                 allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT, budgeted=False)
             if not response.status_code == 200:
                 # response is a redirection to an edit page so ignore the content...
                 raise Exception(response.status_code)
@@ -86,8 +87,8 @@ def delete_old_talks(event):
 
             logger.debug("POSTing delete request to {url}".format(url=url))
 
-            response = requests.post(url, " ", auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
-                                     allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT)
+            response = http.post(url, " ", auth=(settings.OLD_TALKS_USER, settings.OLD_TALKS_PASSWORD),
+                                 allow_redirects=True, stream=False, headers={"Accept": "application/xml"}, timeout=CONTACT_OLD_TALKS_TIMEOUT, budgeted=False)
         except OldTalk.DoesNotExist:
             logger.debug("Talk {slug} not ")
 
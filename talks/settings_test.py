@@ -33,6 +33,12 @@ CACHES = {
     },
     'department_descendant': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'ics': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     }
 }
 
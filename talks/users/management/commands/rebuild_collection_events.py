@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from talks.users.models import Collection
+
+
+class Command(BaseCommand):
+    args = '[collection_slug ...]'
+    help = "Recompute the events contained in collections (all collections by default)"
+
+    def handle(self, *args, **options):
+        collections = Collection.objects.all()
+        if args:
+            collections = collections.filter(slug__in=args)
+        count = 0
+        for collection in collections.iterator():
+            collection.refresh_events()
+            count += 1
+        self.stdout.write("Rebuilt the events of {count} collections".format(count=count))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_collection_events(apps, schema_editor):
+    # Sub-departments are only found in the local organisation tree,
+    # run the rebuild_collection_events command to also use the API
+    Collection = apps.get_model('users', 'Collection')
+    CollectionItem = apps.get_model('users', 'CollectionItem')
+    CollectionEvent = apps.get_model('users', 'CollectionEvent')
+    CollectedDepartment = apps.get_model('users', 'CollectedDepartment')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Event = apps.get_model('events', 'Event')
+    OrganisationNode = apps.get_model('api_ox', 'OrganisationNode')
+
+    def get_object_ids(collection, app_label, model):
+        try:
+            content_type = ContentType.objects.get(app_label=app_label, model=model)
+        except ContentType.DoesNotExist:
+            return []
+        return CollectionItem.objects.filter(collection=collection,
+                                             content_type=content_type).values_list('object_id', flat=True)
+
+    for collection in Collection.objects.all():
+        departments = set(CollectedDepartment.objects.filter(
+            id__in=list(get_object_ids(collection, 'users', 'collecteddepartment'))).values_list('department', flat=True))
+        for lft, rgt in OrganisationNode.objects.filter(id__in=departments).values_list('lft', 'rgt'):
+            departments.update(OrganisationNode.objects.filter(lft__gte=lft, lft__lte=rgt).values_list('id', flat=True))
+        events = (Event.objects.filter(id__in=list(get_object_ids(collection, 'events', 'event'))) |
+                  Event.objects.filter(group__in=list(get_object_ids(collection, 'events', 'eventgroup'))) |
+                  Event.objects.filter(department_organiser__in=departments))
+        CollectionEvent.objects.bulk_create([CollectionEvent(collection=collection, event_id=event_id, start=start)
+                                             for event_id, start in events.distinct().values_list('id', 'start')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_ox', '0002_organisationnode'),
+        ('contenttypes', '0001_initial'),
+        ('events', '0013_auto_20160506_1550'),
+        ('users', '0013_auto_20160506_1550'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField()),
+                ('collection', models.ForeignKey(to='users.Collection')),
+                ('event', models.ForeignKey(to='events.Event')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='collectionevent',
+            unique_together=set([('collection', 'event')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='collectionevent',
+            index_together=set([('collection', 'start')]),
+        ),
+        migrations.RunPython(fill_collection_events),
+    ]
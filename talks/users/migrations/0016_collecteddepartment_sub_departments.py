@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_collection_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collecteddepartment',
+            name='sub_departments',
+            field=models.TextField(default='', blank=True),
+            preserve_default=True,
+        ),
+    ]
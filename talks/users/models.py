@@ -1,17 +1,23 @@
+import datetime
 import itertools
+import json
+import logging
 import uuid
 
 from textile import textile_restricted
 
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 
+from talks.api_ox.models import OrganisationNode
 from talks.events.models import Event, EventGroup
 
+logger = logging.getLogger(__name__)
 
 DEFAULT_COLLECTION_NAME = "My Collection"
 COLLECTION_ROLES_OWNER = 'owner'
@@ -26,6 +32,33 @@ COLLECTION_ROLES = (
 
 class CollectedDepartment(models.Model):
     department = models.TextField(default='')
+    # JSON list of the sub-departments of a department which is not in the
+    # organisation tree, as last fetched from the API
+    sub_departments = models.TextField(blank=True, default='')
+
+    def get_sub_department_ids(self):
+        """Get the sub-departments last fetched by `refresh_sub_departments`
+        :return: list of OxPoints ids
+        """
+        return json.loads(self.sub_departments) if self.sub_departments else []
+
+    def refresh_sub_departments(self):
+        """Fetch the sub-departments of a department which is not in the
+        organisation tree, keeping the previous ones if the API is unavailable
+        :return: list of OxPoints ids
+        """
+        from talks.events.datasources import DEPARTMENT_DESCENDANT_DATA_SOURCE
+        try:
+            result = DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_by_id(self.department)
+        except Exception:
+            logger.exception("Error retrieving the sub-departments of %s, keeping the previous ones", self.department)
+            return self.get_sub_department_ids()
+        sub_departments = json.dumps([descendant['id'] for descendant in result['descendants']] if result else [])
+        if sub_departments != self.sub_departments:
+            self.sub_departments = sub_departments
+            CollectedDepartment.objects.filter(id=self.id).update(sub_departments=sub_departments)
+        return self.get_sub_department_ids()
+
 
 class Collection(models.Model):
 
@@ -34,6 +67,7 @@ class Collection(models.Model):
     description = models.TextField(blank=True)
     editor_set = models.ManyToManyField('TalksUser', through='TalksUserCollection', blank=True)
     public = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
 
     def _get_items_by_model(self, model):
         """Used when selecting a particular type (specified in the `model` arg)
@@ -118,9 +152,22 @@ class Collection(models.Model):
     def get_departments(self):
         return self._get_items_by_model(CollectedDepartment)
 
-    def get_all_events(self):
+    def get_all_events(self, from_date=None):
         """
-          Returns all distinct events in this collections events, event groups, and departments:
+          Returns all events in this collections events, event groups, and departments
+          (as maintained in `CollectionEvent`)
+          :param from_date: only return events starting on or after this date
+        """
+        # both conditions in a single filter, to join the same CollectionEvent row
+        conditions = {'collectionevent__collection': self}
+        if from_date:
+            conditions['collectionevent__start__gte'] = from_date
+        return Event.objects.filter(**conditions).order_by('start')
+
+    def _query_all_events(self):
+        """
+          Returns all distinct events in this collections events, event groups, and departments
+          by querying the items of the collection
         """
         eventIDs = self.collectionitem_set.filter(content_type=ContentType.objects.get_for_model(Event)
                                              ).values_list('object_id')
@@ -133,18 +180,30 @@ class Collection(models.Model):
                 
         eventsInEventGroups = Event.objects.filter(group=eventGroupIDs)
                 
-        # get all department ids
-        from talks.api.services import get_all_department_ids
-
-        departments = CollectedDepartment.objects.filter(id__in=itertools.chain.from_iterable(collectedDepartmentIDs)).values('department')
-        departmentIDs = [dep['department'] for dep in departments]
-        allDepartmentIDs = get_all_department_ids(departmentIDs, True)        
+        # sub-departments come from the organisation tree, or from the API for
+        # the departments which are not in the tree (see `CollectionEvent`)
+        departments = list(CollectedDepartment.objects.filter(id__in=itertools.chain.from_iterable(collectedDepartmentIDs)))
+        departmentIDs = [dep.department for dep in departments]
+        descendants, missing = OrganisationNode.objects.descendant_ids(departmentIDs)
+        allDepartmentIDs = departmentIDs + (list(descendants) if descendants is not None else [])
+        for dep in departments:
+            if dep.department in missing:
+                allDepartmentIDs.extend(dep.refresh_sub_departments())
         departmentEvents = Event.objects.filter(department_organiser__in=allDepartmentIDs)
         
         allEvents = events | eventsInEventGroups | departmentEvents
 
         return allEvents.distinct().order_by('start')
 
+    def refresh_events(self):
+        """Recompute the `CollectionEvent` rows of this collection
+        """
+        rows = self._query_all_events().values_list('id', 'start')
+        with transaction.atomic():
+            CollectionEvent.objects.filter(collection=self).delete()
+            CollectionEvent.objects.bulk_create([CollectionEvent(collection=self, event_id=event_id, start=start)
+                                                 for event_id, start in rows])
+
     def contains_item(self, item):
         if isinstance(item, Event):
             content_type = ContentType.objects.get_for_model(Event)
@@ -238,6 +297,25 @@ class TalksUser(models.Model):
                                             role=COLLECTION_ROLES_OWNER,
                                             is_main=True)
 
+    def get_upcoming_events(self, from_date):
+        """Get the events of all the collections of this user (whatever the role)
+        as a single semi-join on `CollectionEvent`, without duplicates
+        :param from_date: only return events starting on or after this date
+        :return: QuerySet of Event ordered by start
+        """
+        memberships = CollectionEvent.objects.filter(collection__talksusercollection__user=self,
+                                                     start__gte=from_date)
+        return Event.objects.filter(id__in=memberships.values('event')).order_by('start')
+
+    def get_next_events(self, from_date, limit):
+        """Get the next events of the collections of this user
+        :param from_date: only return events starting on or after this date
+        :param limit: maximum number of events
+        :return: tuple (list of at most `limit` events, True if there are more events)
+        """
+        events = list(self.get_upcoming_events(from_date)[:limit + 1])
+        return events[:limit], len(events) > limit
+
     def __unicode__(self):
         return unicode(self.user)
 
@@ -254,6 +332,71 @@ class CollectionItem(models.Model):
         unique_together = [('collection', 'content_type', 'object_id')]
 
 
+class CollectionEvent(models.Model):
+    """Event contained in a collection, either directly or through its series
+    or organising department (denormalised from `CollectionItem`).
+    Rows are maintained by signals, run the `rebuild_collection_events`
+    command after changing the organisation tree.
+    Sub-departments are resolved from the organisation tree (see the
+    `sync_organisation_tree` command). Those of a collected department which
+    is not in the tree are fetched from the API when the collection is
+    refreshed, and only read from `CollectedDepartment` when an event is saved.
+    """
+    collection = models.ForeignKey(Collection)
+    event = models.ForeignKey(Event)
+    start = models.DateTimeField()
+
+    class Meta:
+        unique_together = [('collection', 'event')]
+        index_together = [('collection', 'start')]
+
+
+def get_collections_containing_event(event):
+    """Get the ids of the collections containing an event, directly,
+    through its series or through its organising department
+    :param event: Event
+    :return: set of Collection ids
+    """
+    items = CollectionItem.objects.filter(content_type=ContentType.objects.get_for_model(Event), object_id=event.id)
+    if event.group_id:
+        items = items | CollectionItem.objects.filter(content_type=ContentType.objects.get_for_model(EventGroup),
+                                                      object_id=event.group_id)
+    collection_ids = set(items.values_list('collection_id', flat=True))
+
+    if event.department_organiser:
+        department_ids = [department.id for department in get_departments_containing(event.department_organiser)]
+        if department_ids:
+            collection_ids.update(CollectionItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(CollectedDepartment),
+                object_id__in=department_ids).values_list('collection_id', flat=True))
+    return collection_ids
+
+
+def get_departments_containing(department):
+    """Get the collected departments which are `department` or one of its
+    parents, without any request to the API
+    :param department: OxPoints id
+    :return: list of CollectedDepartment
+    """
+    ancestors = OrganisationNode.objects.ancestor_ids(department) or [department]
+    departments = list(CollectedDepartment.objects.filter(department__in=ancestors))
+    # collected departments which are not in the organisation tree, with
+    # the sub-departments last fetched when refreshing their collections
+    remote = CollectedDepartment.objects.exclude(department__in=ancestors).exclude(sub_departments='').exclude(
+        department__in=OrganisationNode.objects.values('id'))
+    departments.extend(collected for collected in remote if department in collected.get_sub_department_ids())
+    return departments
+
+
+def refresh_event_collections(event):
+    """Recompute the `CollectionEvent` rows of an event
+    """
+    with transaction.atomic():
+        CollectionEvent.objects.filter(event=event).delete()
+        CollectionEvent.objects.bulk_create([CollectionEvent(collection_id=collection_id, event=event, start=event.start)
+                                             for collection_id in get_collections_containing_event(event)])
+
+
 class DepartmentFollow(models.Model):
     pass
 
@@ -267,3 +410,70 @@ def ensure_profile_exists(sender, instance, created, **kwargs):
     """
     if created:
         tuser, tuser_created = TalksUser.objects.get_or_create(user=instance)
+
+
+# ids of the collections being deleted, their items must not re-create
+# the (already deleted) rows of CollectionEvent
+_collections_being_deleted = set()
+
+
+@receiver(models.signals.pre_delete, sender=Collection)
+def collection_pre_delete(sender, instance, **kwargs):
+    _collections_being_deleted.add(instance.id)
+
+
+@receiver(models.signals.post_delete, sender=Collection)
+def collection_post_delete(sender, instance, **kwargs):
+    _collections_being_deleted.discard(instance.id)
+
+
+@receiver(models.signals.post_save, sender=CollectionItem)
+@receiver(models.signals.post_delete, sender=CollectionItem)
+def update_collection_events(sender, instance, **kwargs):
+    """Update the events of a collection when an item is added or removed
+    """
+    if kwargs.get('raw') or instance.collection_id in _collections_being_deleted:
+        return
+    Collection.objects.filter(id=instance.collection_id).update(updated=timezone.now())
+    instance.collection.refresh_events()
+
+
+def _get_collection_fields(event):
+    start = event.start
+    if isinstance(start, datetime.datetime) and timezone.is_naive(start):
+        # as stored by the database
+        start = timezone.make_aware(start, timezone.get_default_timezone())
+    return start, event.group_id, event.department_organiser
+
+
+@receiver(models.signals.pre_save, sender=Event)
+def record_event_collection_fields(sender, instance, **kwargs):
+    """Record the fields deciding the collections of an event before it is saved
+    """
+    if kwargs.get('raw') or not instance.pk:
+        return
+    instance._previous_collection_fields = (Event.objects.filter(pk=instance.pk)
+                                            .values_list('start', 'group_id', 'department_organiser').first())
+
+
+@receiver(models.signals.post_save, sender=Event)
+def update_event_collections(sender, instance, created, **kwargs):
+    """Update the collections containing an event when its start,
+    series or organising department changed
+    """
+    if kwargs.get('raw'):
+        return
+    previous = getattr(instance, '_previous_collection_fields', None)
+    if created or previous != _get_collection_fields(instance):
+        refresh_event_collections(instance)
+
+
+@receiver(models.signals.post_delete, sender=EventGroup)
+def update_event_group_collections(sender, instance, **kwargs):
+    """Update the collections which contained a deleted series
+    """
+    items = CollectionItem.objects.filter(content_type=ContentType.objects.get_for_model(EventGroup),
+                                          object_id=instance.id).select_related('collection')
+    for item in items:
+        if item.collection_id not in _collections_being_deleted:
+            item.collection.refresh_events()
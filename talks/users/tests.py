@@ -1,7 +1,17 @@
+import datetime
+
+import mock
+import pytz
 from django.test import TestCase
 from django.contrib.auth.models import User, Group
 
+from talks.api_ox.models import OrganisationNode
+from talks.core import http
+from talks.events import factories
+from talks.events.models import Event
 from .authentication import GROUP_EDIT_EVENTS, user_in_group_or_super
+from .models import (Collection, CollectionEvent, CollectedDepartment, TalksUserCollection,
+                     COLLECTION_ROLES_READER)
 
 
 class TestAuthorisation(TestCase):
@@ -19,3 +29,124 @@ class TestAuthorisation(TestCase):
         self.assertTrue(user_in_group_or_super(super_user))
         self.assertTrue(user_in_group_or_super(contributor_user))
         self.assertFalse(user_in_group_or_super(normal_user))
+
+
+class TestCollectionEvents(TestCase):
+
+    def setUp(self):
+        OrganisationNode.objects.rebuild('oxpoints:chem', {
+            'oxpoints:chem': (None, 'Chemistry'),
+            'oxpoints:biol': ('oxpoints:chem', 'Chemical Biology'),
+        })
+        self.collection = Collection.objects.create(title='Collection')
+        self.group = factories.EventGroupFactory.create(title='Series', slug='series')
+        self.event = factories.EventFactory.create(title='Event', slug='event')
+        self.in_group = factories.EventFactory.create(title='In series', slug='in-series', group=self.group)
+        self.in_department = factories.EventFactory.create(title='In department', slug='in-department',
+                                                           department_organiser='oxpoints:biol')
+        self.other = factories.EventFactory.create(title='Other', slug='other')
+
+    def assertCollectionEvents(self, events):
+        self.assertEquals(sorted(self.collection.get_all_events().values_list('slug', flat=True)),
+                          sorted(event.slug for event in events))
+
+    def test_items_added_and_removed(self):
+        self.collection.add_item(self.event)
+        self.collection.add_item(self.group)
+        self.collection.add_item(CollectedDepartment.objects.create(department='oxpoints:chem'))
+        self.assertCollectionEvents([self.event, self.in_group, self.in_department])
+        self.collection.remove_item(self.group)
+        self.assertCollectionEvents([self.event, self.in_department])
+
+    def test_event_changed(self):
+        self.collection.add_item(self.group)
+        self.collection.add_item(CollectedDepartment.objects.create(department='oxpoints:chem'))
+        self.other.group = self.group
+        self.other.save()
+        self.in_department.department_organiser = 'oxpoints:other'
+        self.in_department.save()
+        self.assertCollectionEvents([self.in_group, self.other])
+
+    def test_unchanged_event_not_refreshed(self):
+        self.collection.add_item(self.event)
+        self.event.title = 'Renamed'
+        with mock.patch('talks.users.models.refresh_event_collections') as refresh:
+            self.event.save()
+        self.assertFalse(refresh.called)
+
+    @mock.patch('talks.events.datasources.DEPARTMENT_DESCENDANT_DATA_SOURCE.get_object_by_id')
+    def test_department_not_in_tree(self, get_object_by_id):
+        get_object_by_id.return_value = {'descendants': [{'id': 'oxpoints:theory'}]}
+        self.collection.add_item(CollectedDepartment.objects.create(department='oxpoints:physics'))
+        get_object_by_id.assert_called_once_with('oxpoints:physics')
+
+        # sub-departments are not fetched again when an event is saved
+        get_object_by_id.side_effect = Exception
+        self.other.department_organiser = 'oxpoints:physics'
+        self.other.save()
+        in_sub_department = factories.EventFactory.create(slug='in-sub-department',
+                                                          department_organiser='oxpoints:theory')
+        self.assertEquals(get_object_by_id.call_count, 1)
+        self.assertCollectionEvents([self.other, in_sub_department])
+
+        # the API being unavailable keeps the sub-departments previously fetched
+        self.collection.refresh_events()
+        self.assertCollectionEvents([self.other, in_sub_department])
+
+    @mock.patch('talks.core.http.get', side_effect=http.UpstreamUnavailable)
+    def test_view_without_api(self, requests_get):
+        Collection.objects.filter(id=self.collection.id).update(public=True)
+        self.collection.add_item(CollectedDepartment.objects.create(department='oxpoints:chem'))
+        response = self.client.get('/user/lists/id/%s/' % self.collection.slug)
+        self.assertContains(response, 'oxpoints:chem')
+
+    def test_start_changed(self):
+        self.collection.add_item(self.event)
+        self.event.start = datetime.datetime(2016, 1, 1, 12, 0, tzinfo=pytz.utc)
+        self.event.save()
+        self.assertEquals(self.collection.get_all_events(from_date=datetime.date(2015, 12, 1)).get(), self.event)
+
+    def test_event_in_several_collections(self):
+        for title in ('Second', 'Third'):
+            Collection.objects.create(title=title).add_item(self.event)
+        self.collection.add_item(self.event)
+        self.assertEquals(list(self.collection.get_all_events(from_date=datetime.date(2000, 1, 1))), [self.event])
+
+    def test_series_deleted(self):
+        self.collection.add_item(self.group)
+        Event.objects.filter(group=self.group).update(group=None)
+        self.group.delete()
+        self.assertCollectionEvents([])
+
+    def test_collection_deleted(self):
+        self.collection.add_item(self.event)
+        self.collection.delete()
+        self.assertEquals(CollectionEvent.objects.count(), 0)
+
+
+class TestTalksUserTimeline(TestCase):
+
+    def setUp(self):
+        self.tuser = User.objects.create_user('user', 'user@uni.ox', 'password').talksuser
+        main = self.tuser.collections.get()
+        public = Collection.objects.create(title='Public', public=True)
+        TalksUserCollection.objects.create(user=self.tuser, collection=public, role=COLLECTION_ROLES_READER)
+        self.events = [factories.EventFactory.create(slug='event-%d' % day,
+                                                     start=datetime.datetime(2015, 10, day, 12, 0, tzinfo=pytz.utc))
+                       for day in range(20, 25)]
+        for event in self.events[:3]:
+            main.add_item(event)
+        for event in self.events[2:]:
+            public.add_item(event)
+
+    def test_upcoming_events(self):
+        events = self.tuser.get_upcoming_events(datetime.date(2015, 10, 21))
+        self.assertEquals(list(events), self.events[1:])
+
+    def test_next_events(self):
+        events, more = self.tuser.get_next_events(datetime.date(2015, 10, 21), 3)
+        self.assertEquals(events, self.events[1:4])
+        self.assertTrue(more)
+        events, more = self.tuser.get_next_events(datetime.date(2015, 10, 21), 4)
+        self.assertEquals(events, self.events[1:])
+        self.assertFalse(more)
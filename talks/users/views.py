@@ -1,3 +1,6 @@
+import logging
+
+import requests
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.contrib.auth import logout
@@ -15,6 +18,9 @@ from talks.users.authentication import user_in_group_or_super
 from talks.events.datasources import DEPARTMENT_DATA_SOURCE
 from .forms import CollectionForm
 
+logger = logging.getLogger(__name__)
+
+
 def webauth_logout(request):
     context = {'was_webauth': True}
     logout(request)
@@ -56,18 +62,18 @@ def view_collection(request, collection_slug):
         raise PermissionDenied
 
     show_all = request.GET.get('show_all', False)
-    allEvents = collection.get_all_events().order_by('start')
-
-
-    if not show_all:
-        allEvents = allEvents.filter(start__gte=date.today())
+    allEvents = collection.get_all_events(from_date=None if show_all else date.today())
 
     grouped_events = group_events(allEvents)
 
     series = collection.get_event_groups().order_by('title')
 
     collectedDeps = collection.get_departments()
-    departments = map(lambda cdep:DEPARTMENT_DATA_SOURCE.get_object_by_id(cdep.department), collectedDeps)
+    try:
+        departments = map(lambda cdep:DEPARTMENT_DATA_SOURCE.get_object_by_id(cdep.department), collectedDeps)
+    except requests.RequestException:
+        logger.warning("Error retrieving the departments of collection %s", collection.slug, exc_info=True)
+        departments = [{'id': cdep.department, 'name': cdep.department} for cdep in collectedDeps]
 
     collectionContributors = None
     if request.tuser:
@@ -93,14 +99,8 @@ def view_collection(request, collection_slug):
 @login_required
 def my_talks(request):
     grouped_events = None
-    collections = request.tuser.collections.all()
-    if collections:
-            user_events = collections[0].get_all_events()
-            for collection in collections[1:]:
-                user_events = user_events | collection.get_all_events()
-            #context['collections'] = collections
-            user_events = user_events.filter(start__gte=date.today())
-            grouped_events = group_events(user_events)
+    if request.tuser.collections.exists():
+        grouped_events = group_events(request.tuser.get_upcoming_events(date.today()))
 
     context = {
         'grouped_events': grouped_events